@@ -1,6 +1,5 @@
 import os
 import shutil
-import subprocess
 from pathlib import Path
 
 import uvicorn
@@ -8,26 +7,12 @@ import yaml
 from prometheus_client import start_http_server
 
 from llama_deploy.apiserver.settings import settings
+from llama_deploy.apiserver.source_managers.git import sync_repo
 
 CLONED_REPO_FOLDER = Path("cloned_repo")
 RC_PATH = Path("/data")
 
 
-def run_process(args: list[str], cwd: str | None = None) -> None:
-    kwargs = {
-        "args": args,
-        "capture_output": True,
-        "text": True,
-        "check": False,
-    }
-    if cwd:
-        kwargs["cwd"] = cwd
-    process = subprocess.run(**kwargs)  # type: ignore
-    if process.returncode != 0:
-        stderr = process.stderr or ""
-        raise Exception(stderr)
-
-
 def setup_repo(
     work_dir: Path, source: str, token: str | None = None, force: bool = False
 ) -> None:
@@ -38,18 +23,9 @@ def setup_repo(
     if dest_dir.exists() and force:
         shutil.rmtree(dest_dir)
 
-    if not dest_dir.exists():
-        # need to do a full clone to resolve any kind of ref without exploding in
-        # complexity (tag, branch, commit, short commit)
-        clone_args = ["git", "clone", repo_url, str(dest_dir.absolute())]
-        run_process(clone_args, cwd=str(work_dir.absolute()))
-    else:
-        run_process(["git", "fetch", "origin"], cwd=str(dest_dir.absolute()))
-
-    # Checkout the ref (let git resolve it)
-    if ref_name:
-        run_process(["git", "checkout", ref_name], cwd=str(dest_dir.absolute()))
-    # If no ref specified, stay on whatever the clone gave us (default branch)
+    # The repository is fetched into a cached mirror, from where any kind of ref
+    # (tag, branch, commit, short commit) is resolved and checked out
+    sync_repo(repo_url, ref_name, dest_dir)
 
 
 def _is_valid_uri(uri: str) -> bool:
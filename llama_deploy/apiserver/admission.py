@@ -0,0 +1,224 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from typing import NoReturn
+
+from llama_deploy.types.core import TaskPriority
+
+from .deployment_config_parser import OverflowPolicy
+from .stats import admission_queue_depth, admission_rejections, admission_wait_time
+
+# Share of the slots handed over to each priority when tasks of all priorities wait
+PRIORITY_WEIGHTS = {
+    TaskPriority.HIGH: 8,
+    TaskPriority.NORMAL: 4,
+    TaskPriority.LOW: 1,
+}
+
+
+class AdmissionRejected(Exception):
+    """Raised when a service can't accept more tasks."""
+
+    def __init__(self, message: str, retry_after: float) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Limits the number of tasks running concurrently for a service.
+
+    Tasks exceeding `max_concurrency` either wait for a free slot in a bounded queue,
+    or are rejected right away, depending on the overflow policy. Slots are handed over
+    directly to a waiter when released, so queued tasks can't be overtaken by new ones.
+
+    Waiters are served with weighted fair queuing: priorities get a share of the freed
+    slots proportional to their weight in `PRIORITY_WEIGHTS`, and within a priority the
+    tenants take turns, each one in FIFO order. A task waiting for longer than
+    `starvation_timeout` seconds is served before any other.
+    """
+
+    def __init__(
+        self,
+        deployment_name: str,
+        service_name: str,
+        *,
+        max_concurrency: int | None = None,
+        max_queue_size: int | None = None,
+        overflow_policy: OverflowPolicy = OverflowPolicy.queue,
+        queue_timeout: float | None = None,
+        starvation_timeout: float | None = None,
+    ) -> None:
+        """Creates an AdmissionController instance.
+
+        Args:
+            deployment_name: The name of the deployment, used to label metrics.
+            service_name: The name of the service, used to label metrics.
+            max_concurrency: Maximum number of tasks running at the same time, None means no limit.
+            max_queue_size: Maximum number of tasks waiting for a slot, None means no limit.
+            overflow_policy: Whether tasks exceeding `max_concurrency` are queued or rejected.
+            queue_timeout: Maximum number of seconds a task waits in the queue, None means no limit.
+            starvation_timeout: Seconds after which a queued task is served first, None means never.
+        """
+        self._deployment_name = deployment_name
+        self._service_name = service_name
+        self._max_concurrency = max_concurrency
+        self._max_queue_size = max_queue_size
+        self._overflow_policy = overflow_policy
+        self._queue_timeout = queue_timeout
+        self._starvation_timeout = starvation_timeout
+        self._running = 0
+        # Waiters in arrival order, with their priority, tenant and enqueue time
+        self._waiters: dict[
+            asyncio.Future[None], tuple[TaskPriority, str | None, float]
+        ] = {}
+        self._queues: dict[
+            TaskPriority, OrderedDict[str | None, deque[asyncio.Future[None]]]
+        ] = {priority: OrderedDict() for priority in TaskPriority}
+        self._credits: dict[TaskPriority, int] = dict.fromkeys(TaskPriority, 0)
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    @property
+    def running(self) -> int:
+        """The number of tasks currently holding a slot."""
+        return self._running
+
+    @property
+    def queued(self) -> int:
+        """The number of tasks waiting for a slot."""
+        return len(self._waiters)
+
+    async def acquire(
+        self, priority: TaskPriority = TaskPriority.NORMAL, tenant_id: str | None = None
+    ) -> None:
+        """Waits for a slot to run a task.
+
+        Every successful call must be paired with a call to `release()`.
+
+        Args:
+            priority: The priority of the task.
+            tenant_id: The tenant submitting the task.
+
+        Raises:
+            AdmissionRejected: If the task can't be admitted.
+        """
+        if self._has_free_slot():
+            self._running += 1
+            self._idle.clear()
+            return
+
+        self._check_overflow()
+        waiter = asyncio.get_running_loop().create_future()
+        start = time.perf_counter()
+        self._waiters[waiter] = (priority, tenant_id, time.monotonic())
+        self._queues[priority].setdefault(tenant_id, deque()).append(waiter)
+        self._update_queue_depth()
+        try:
+            await asyncio.wait_for(waiter, self._queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over while giving up, pass it on
+                self.release()
+            else:
+                self._dequeue(waiter)
+            self._update_queue_depth()
+            if isinstance(e, asyncio.TimeoutError):
+                self._reject("Timed out waiting in the service queue", "timeout")
+            raise
+        finally:
+            admission_wait_time.labels(
+                self._deployment_name, self._service_name, priority.value
+            ).observe(time.perf_counter() - start)
+
+    def check(self) -> bool:
+        """Tells whether a task submitted now would be admitted or queued.
+
+        Lets callers reject a task before waiting for its slot in the background. The
+        service might fill up in the meantime, so `acquire()` can still reject it.
+
+        Returns:
+            True if a slot is free, False if the task would wait in the queue.
+
+        Raises:
+            AdmissionRejected: If the task would be rejected.
+        """
+        if self._has_free_slot():
+            return True
+        self._check_overflow()
+        return False
+
+    def release(self) -> None:
+        """Frees a slot, handing it over to the next waiting task if any."""
+        while self._waiters:
+            waiter = self._next_waiter()
+            priority, tenant_id, _ = self._waiters[waiter]
+            self._dequeue(waiter)
+            # The tenant was served, its turn is over
+            tenants = self._queues[priority]
+            if tenant_id in tenants:
+                tenants.move_to_end(tenant_id)
+            if not waiter.done():
+                waiter.set_result(None)
+                self._update_queue_depth()
+                return
+        self._running -= 1
+        if self._running == 0:
+            self._idle.set()
+        self._update_queue_depth()
+
+    async def drain(self) -> None:
+        """Waits until no task holds or waits for a slot."""
+        await self._idle.wait()
+
+    def _has_free_slot(self) -> bool:
+        return self._max_concurrency is None or (
+            self._running < self._max_concurrency and not self._waiters
+        )
+
+    def _check_overflow(self) -> None:
+        if self._overflow_policy == OverflowPolicy.reject:
+            self._reject("Service at capacity", "at_capacity")
+        if self._max_queue_size is not None and self.queued >= self._max_queue_size:
+            self._reject("Service queue is full", "queue_full")
+
+    def _next_waiter(self) -> asyncio.Future[None]:
+        oldest = next(iter(self._waiters))
+        _, _, enqueued_at = self._waiters[oldest]
+        if (
+            self._starvation_timeout is not None
+            and time.monotonic() - enqueued_at > self._starvation_timeout
+        ):
+            return oldest
+
+        # Smooth weighted round robin across the priorities with waiters
+        waiting = [p for p in TaskPriority if self._queues[p]]
+        for p in waiting:
+            self._credits[p] += PRIORITY_WEIGHTS[p]
+        priority = max(waiting, key=lambda p: self._credits[p])
+        self._credits[priority] -= sum(PRIORITY_WEIGHTS[p] for p in waiting)
+        # Round robin across the tenants of the priority
+        return next(iter(self._queues[priority].values()))[0]
+
+    def _dequeue(self, waiter: asyncio.Future[None]) -> None:
+        # release() might have dequeued a cancelled waiter before it woke up
+        if waiter not in self._waiters:
+            return
+        priority, tenant_id, _ = self._waiters.pop(waiter)
+        tenants = self._queues[priority]
+        queue = tenants[tenant_id]
+        queue.remove(waiter)
+        if not queue:
+            del tenants[tenant_id]
+        if not tenants:
+            self._credits[priority] = 0
+
+    def _reject(self, message: str, reason: str) -> NoReturn:
+        admission_rejections.labels(
+            self._deployment_name, self._service_name, reason
+        ).inc()
+        raise AdmissionRejected(message, retry_after=self._queue_timeout or 1)
+
+    def _update_queue_depth(self) -> None:
+        admission_queue_depth.labels(self._deployment_name, self._service_name).set(
+            self.queued
+        )
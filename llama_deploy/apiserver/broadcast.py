@@ -0,0 +1,90 @@
+import asyncio
+import itertools
+from collections import deque
+from typing import AsyncGenerator
+
+from workflows.events import Event
+from workflows.handler import WorkflowHandler
+
+
+class EventBroadcaster:
+    """Fans out the events streamed by a workflow handler to any number of subscribers.
+
+    The handler stream is consumed once, by a background task started with the first
+    subscription. The most recent events are kept in a bounded replay buffer, so that
+    subscribers can attach late or resume from a given offset. A subscriber lagging behind
+    by more than the size of the buffer skips the events that were dropped.
+    """
+
+    def __init__(self, handler: WorkflowHandler, replay_size: int = 1000) -> None:
+        """Creates an EventBroadcaster instance.
+
+        Args:
+            handler: The workflow handler producing the events.
+            replay_size: The maximum number of past events kept for late subscribers.
+        """
+        self._handler = handler
+        self._buffer: deque[Event] = deque(maxlen=replay_size)
+        self._next_offset = 0
+        self._finished = False
+        self._error: BaseException | None = None
+        self._condition = asyncio.Condition()
+        self._pump_task: asyncio.Task | None = None
+
+    @property
+    def first_offset(self) -> int:
+        """The offset of the oldest event still available for replay."""
+        return self._next_offset - len(self._buffer)
+
+    @property
+    def next_offset(self) -> int:
+        """The offset the next event streamed by the handler will have."""
+        return self._next_offset
+
+    async def subscribe(
+        self, offset: int = 0
+    ) -> AsyncGenerator[tuple[int, Event], None]:
+        """Yields the events streamed by the handler along with their offset.
+
+        Args:
+            offset: The offset of the first event to receive, 0 means from the beginning.
+        """
+        if self._pump_task is None:
+            self._pump_task = asyncio.create_task(self._pump())
+
+        while True:
+            async with self._condition:
+                await self._condition.wait_for(
+                    lambda: offset < self._next_offset or self._finished
+                )
+                offset = max(offset, self.first_offset)
+                pending = list(
+                    itertools.islice(self._buffer, offset - self.first_offset, None)
+                )
+                finished = self._finished
+
+            for event in pending:
+                yield offset, event
+                offset += 1
+
+            if finished:
+                break
+
+        if self._error is not None:
+            raise self._error
+
+    async def _pump(self) -> None:
+        try:
+            async for event in self._handler.stream_events():
+                async with self._condition:
+                    self._buffer.append(event)
+                    self._next_offset += 1
+                    self._condition.notify_all()
+            # Surface workflow errors to the subscribers
+            await self._handler
+        except Exception as e:
+            self._error = e
+        finally:
+            async with self._condition:
+                self._finished = True
+                self._condition.notify_all()
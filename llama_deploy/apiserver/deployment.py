@@ -1,43 +1,136 @@
 import asyncio
+import hashlib
 import importlib
 import json
 import logging
 import os
+import shutil
 import site
+import socket
 import subprocess
 import sys
+import sysconfig
 import tempfile
+import threading
+import time
 from asyncio.subprocess import Process
-from multiprocessing.pool import ThreadPool
+from contextlib import contextmanager, suppress
+from functools import partial
 from pathlib import Path
-from typing import Any, Tuple, Type
+from typing import (
+    Any,
+    AsyncGenerator,
+    Awaitable,
+    Callable,
+    Iterator,
+    Tuple,
+    Type,
+    TypeVar,
+)
 
+import httpx
 from dotenv import dotenv_values
 from workflows import Context, Workflow
+from workflows.context import JsonSerializer
+from workflows.errors import WorkflowCancelledByUser
+from workflows.events import Event
 from workflows.handler import WorkflowHandler
 
 from llama_deploy.apiserver.source_managers.base import SyncPolicy
 from llama_deploy.client import Client
-from llama_deploy.types.core import generate_id
+from llama_deploy.types.apiserver import DeploymentStatusEnum
+from llama_deploy.types.core import TaskPriority, TaskResult, TaskStatus, generate_id
 
+from .admission import AdmissionController
+from .broadcast import EventBroadcaster
 from .deployment_config_parser import (
     DeploymentConfig,
     Service,
     SourceType,
+    UIMode,
 )
+from .executor import BlockingExecutor
+from .registry import BoundedRegistry
+from .result_cache import CacheMode, ResultCache
+from .result_store import ResultStore
+from .session_store import SessionStore
+from .settings import settings
 from .source_managers import GitSourceManager, LocalSourceManager, SourceManager
-from .stats import deployment_state, service_state
+from .source_managers.content_store import ContentStore
+from .state_backend import LocalStateBackend, StateBackend, create_state_backend
+from .stats import (
+    coalesced_tasks,
+    deployment_state,
+    service_first_request_wait,
+    service_phase_duration,
+    service_state,
+    ui_cold_start_duration,
+    ui_cold_starts,
+    ui_idle_time,
+)
+from .worker_pool import RemoteContext, WorkerPool
 
 logger = logging.getLogger()
 SOURCE_MANAGERS: dict[SourceType, Type[SourceManager]] = {
     SourceType.git: GitSourceManager,
     SourceType.local: LocalSourceManager,
 }
+# Installs into the same Python environment don't run concurrently, keyed by prefix
+_install_locks: dict[str, threading.Lock] = {}
+_install_locks_guard = threading.Lock()
+# Identifies an instance of a Python environment, recreating the environment drops it
+_ENVIRONMENT_STAMP = ".llama_deploy_environment"
+# Seconds between reads of the shared state when waiting for a task of another replica
+_RESULT_POLL_INTERVAL = 0.5
+# Seconds given to the steps of a cancelled workflow to stop
+_CANCEL_GRACE_PERIOD = 5.0
+# Seconds between checks of the activity of the UI server
+_UI_IDLE_CHECK_INTERVAL = 30.0
+# Seconds between moves of the idle sessions to the session store
+_SESSION_IDLE_CHECK_INTERVAL = 30.0
+# Marks a complete production build of the UI in the build cache
+_UI_BUILD_STAMP = ".llama_deploy_build"
+# Folders produced by the production build of the UI, kept in the build cache
+_UI_BUILD_OUTPUTS = ("node_modules", ".next")
+# Entries of the UI source folder not part of the build hash
+_UI_BUILD_IGNORE = {*_UI_BUILD_OUTPUTS, ".git"}
+
+T = TypeVar("T")
 
 
 class DeploymentError(Exception): ...
 
 
+class SessionOwnedError(Exception):
+    """Raised when running a task in a session owned by another API Server replica."""
+
+    def __init__(self, session_id: str, owner: str) -> None:
+        super().__init__(f"Session {session_id} is owned by another replica: {owner}")
+        self.owner = owner
+
+
+def _modules_in(path: Path) -> list[str]:
+    """Returns the names of the imported modules loaded from the folder `path`."""
+    names = []
+    for name, module in list(sys.modules.items()):
+        file = getattr(module, "__file__", None)
+        if file and Path(file).is_relative_to(path):
+            names.append(name)
+    return names
+
+
+async def _collect_content_garbage(executor: BlockingExecutor) -> None:
+    """Deletes the files of the content store that no deployment uses anymore."""
+    store = ContentStore(settings.cache_dir / "content")
+    try:
+        deleted = await executor.run("collect_garbage", store.collect_garbage)
+    except Exception as e:
+        logger.warning(f"Unable to clean up the content store: {e}")
+        return
+    if deleted:
+        logger.info(f"Deleted {deleted} unused files from the content store")
+
+
 class Deployment:
     def __init__(
         self,
@@ -46,6 +139,8 @@ class Deployment:
         base_path: Path,
         deployment_path: Path,
         local: bool = False,
+        executor: BlockingExecutor | None = None,
+        state_backend: StateBackend | None = None,
     ) -> None:
         """Creates a Deployment instance.
 
@@ -53,33 +148,107 @@ class Deployment:
             config: The configuration object defining this deployment
             root_path: The path on the filesystem used to store deployment data
             local: Whether the deployment is local. If true, sources won't be synced
+            executor: The executor running blocking operations, usually shared by all the deployments
+            state_backend: The backend storing task results and sessions, usually shared by all the deployments
         """
         self._local = local
+        self._executor = executor or BlockingExecutor(settings.executor_max_workers)
+        self._state = state_backend or LocalStateBackend(settings)
         self._name = config.name
         self._base_path = base_path
         # If not local, isolate the deployment in a folder with the same name to avoid conflicts
         self._deployment_path = (
             deployment_path if local else deployment_path / config.name
         )
+        # Each version of the deployment is synced in its own folder, so that a reload
+        # doesn't touch the files the current version runs from. Local deployments run
+        # from their source folder.
+        self._versions = 0
+        self._version_path = (
+            self._deployment_path if local else self._deployment_path / "v0"
+        )
+        # Modules imported from the deployment folder, imported again by a reload
+        self._imported_modules: set[str] = set()
         self._client = Client()
         self._default_service: str | None = None
         self._running = False
+        self._ready = False
         self._service_tasks: list[asyncio.Task] = []
         self._ui_server_process: Process | None = None
-        # Ready to load services
-        self._workflow_services: dict[str, Workflow] = self._load_services(config)
-        self._contexts: dict[str, Context] = {}
-        self._handlers: dict[str, WorkflowHandler] = {}
+        self._ui_port: int | None = None
+        self._ui_client: httpx.AsyncClient | None = None
+        # Idle UI servers are stopped, and started again by the next request
+        self._ui_hibernated = False
+        self._ui_wake_lock = asyncio.Lock()
+        self._ui_connections = 0
+        self._ui_last_active = time.monotonic()
+        self._ui_idle_task: asyncio.Task | None = None
+        # Wind down the previous versions of the deployment after a reload
+        self._drain_tasks: set[asyncio.Task] = set()
+        # Services are registered by start(), and loaded either there or on first use
+        self._services: dict[str, Service] = {}
+        self._workflow_services: dict[str, Workflow] = {}
+        self._service_loads: dict[str, asyncio.Task[Workflow]] = {}
+        # The version of each synced source, results are cached by version
+        self._synced_sources: dict[tuple[SourceType, str], str | None] = {}
+        self._sync_lock = asyncio.Lock()
+        self._served_services: set[str] = set()
+        self._admission: dict[str, AdmissionController] = (
+            self._create_admission_controllers(config)
+        )
+        self._worker_pools: dict[str, WorkerPool] = self._create_worker_pools(config)
+        self._result_caches: dict[str, ResultCache] = self._create_result_caches(config)
+        # Idle sessions are moved to the session store when there's one, in batches
+        self._sessions: SessionStore | None = self._state.session_store(self._name)
+        self._spilled_sessions: dict[str, Context] = {}
+        self._session_idle_task: asyncio.Task | None = None
+        # With a shared state, tasks of a session run only on the replica owning it
+        self._replica_id = generate_id()
+        self._owned_sessions: set[str] = set()
+        self._contexts: BoundedRegistry[Context | RemoteContext] = BoundedRegistry(
+            "sessions",
+            self._name,
+            max_size=settings.max_sessions,
+            ttl=settings.session_ttl
+            if self._sessions is None
+            else settings.session_idle_timeout,
+            is_active=lambda ctx: isinstance(ctx, Context) and ctx.is_running,
+            on_evict=self._on_session_evicted,
+        )
+        self._handlers: BoundedRegistry[WorkflowHandler] = BoundedRegistry(
+            "handlers",
+            self._name,
+            max_size=settings.max_handlers,
+            ttl=settings.handler_ttl,
+            is_active=lambda handler: not handler.done(),
+            on_evict=self._on_handler_evicted,
+        )
         self._handler_inputs: dict[str, str] = {}
+        # Tasks waiting in a service queue, and the new sessions they'll run in
+        self._pending_tasks: dict[str, asyncio.Task] = {}
+        self._pending_sessions: dict[str, asyncio.Task] = {}
+        self._cancel_reasons: dict[str, str] = {}
+        self._cancellations: set[asyncio.Task] = set()
+        # Running tasks of deterministic services, by service and input
+        self._inflight: dict[tuple[str, str], asyncio.Task] = {}
+        self._inflight_waiters: dict[tuple[str, str], int] = {}
+        self._broadcasters: dict[str, EventBroadcaster] = {}
+        self._results: ResultStore = self._state.result_store(self._name)
+        # Pending writes to the state stores, by key, run off the event loop in order
+        self._state_writes: dict[str, asyncio.Task] = {}
         self._config = config
-        deployment_state.labels(self._name).state("ready")
 
     @property
     def default_service(self) -> str:
         if not self._default_service:
-            self._default_service = list(self._workflow_services.keys())[0]
+            self._default_service = self.service_names[0]
         return self._default_service
 
+    @property
+    def ready(self) -> bool:
+        """Whether the deployment finished starting and accepts requests."""
+        return self._ready
+
     @property
     def client(self) -> Client:
         """Returns an async client to interact with this deployment."""
@@ -92,39 +261,1032 @@ class Deployment:
 
     @property
     def service_names(self) -> list[str]:
-        """Returns the list of service names in this deployment."""
-        return list(self._workflow_services.keys())
+        """Returns the list of service names in this deployment, loaded or not."""
+        return list(self._services.keys())
+
+    @property
+    def ui_port(self) -> int | None:
+        """Returns the port of the UI server currently serving requests."""
+        if self._ui_port is not None:
+            return self._ui_port
+        return self._config.ui.port if self._config.ui else None
+
+    @property
+    def ui_client(self) -> httpx.AsyncClient:
+        """Returns the pooled HTTP client used to proxy requests to the UI server."""
+        if self._ui_client is None:
+            self._ui_client = self._create_ui_client()
+        return self._ui_client
+
+    async def wake_ui_server(self) -> int | None:
+        """Marks the UI server as in use and returns its port.
+
+        If the UI server was stopped for being idle, it's started again and this call
+        waits until it answers requests.
+
+        Raises:
+            DeploymentError: If the UI server doesn't start.
+        """
+        self._ui_last_active = time.monotonic()
+        # While the lock is held the UI server is stopping or starting
+        if not self._ui_hibernated and not self._ui_wake_lock.locked():
+            return self.ui_port
+
+        async with self._ui_wake_lock:
+            if self._ui_hibernated and self._config.ui:
+                start = time.perf_counter()
+                port = self._ui_port or self._config.ui.port or _free_port()
+                installed_path = self._ui_installed_path(
+                    self._config, self._version_path
+                )
+                process = await self._run_ui_server(self._config, installed_path, port)
+                try:
+                    await self._wait_ui_ready(process, port)
+                except Exception:
+                    process.terminate()
+                    raise
+                self._ui_server_process = process
+                self._ui_port = port
+                self._ui_hibernated = False
+                self._ui_last_active = time.monotonic()
+                ui_cold_starts.labels(self._name).inc()
+                ui_cold_start_duration.labels(self._name).observe(
+                    time.perf_counter() - start
+                )
+        return self.ui_port
+
+    @contextmanager
+    def ui_connection(self) -> Iterator[None]:
+        """Keeps the UI server awake while a long-lived connection to it is open."""
+        self._ui_connections += 1
+        try:
+            yield
+        finally:
+            self._ui_connections -= 1
+            self._ui_last_active = time.monotonic()
 
     async def run_workflow(
-        self, service_id: str, session_id: str | None = None, **run_kwargs: dict
+        self,
+        service_id: str,
+        session_id: str | None = None,
+        task_timeout: float | None = None,
+        cache_mode: CacheMode = CacheMode.use,
+        priority: TaskPriority = TaskPriority.NORMAL,
+        tenant_id: str | None = None,
+        **run_kwargs: dict,
     ) -> Any:
-        workflow = self._workflow_services[service_id]
-        if session_id:
-            context = self._contexts[session_id]
-            return await workflow.run(context=context, **run_kwargs)
+        """Runs a workflow and waits for its result.
 
-        if run_kwargs:
-            return await workflow.run(**run_kwargs)
+        The workflow is cancelled if it doesn't complete within `task_timeout` seconds,
+        or if the caller is cancelled while waiting. When the service is at capacity,
+        the task waits for a slot according to its `priority` and `tenant_id`.
 
-        return await workflow.run()
+        When the service has a result cache, tasks running outside of a session return
+        the cached result of a previous task with the same input, if any, depending on
+        `cache_mode`.
 
-    def run_workflow_no_wait(
-        self, service_id: str, session_id: str | None = None, **run_kwargs: dict
-    ) -> Tuple[str, str]:
-        workflow = self._workflow_services[service_id]
-        if session_id:
-            context = self._contexts[session_id]
-            handler = workflow.run(context=context, **run_kwargs)
+        For deterministic services, tasks running outside of a session while another
+        task with the same input is running wait for its result instead of starting a
+        new workflow. Each caller keeps its own timeout, and the shared workflow is
+        cancelled only when all the callers waiting for it gave up.
+
+        Raises:
+            AdmissionRejected: If the service can't accept more tasks.
+            TimeoutError: If the workflow didn't complete in time.
+        """
+        cache = self._result_caches.get(service_id)
+        if session_id or cache_mode == CacheMode.bypass:
+            cache = None
+        synced, source_version = self._source_version(service_id)
+        if not synced:
+            # Results are cached by the version of the source, known once synced
+            cache = None
+        if cache is not None:
+            cache_key = cache.key(run_kwargs, source_version)
+            if cache_mode == CacheMode.use:
+                found, result = await self._cache_call(cache, cache.get, cache_key)
+                if found:
+                    return result
+
+        service_config = self._config.services.get(service_id)
+        if session_id is None and service_config and service_config.deterministic:
+            result = await self._run_coalesced(
+                service_id, task_timeout, priority, tenant_id, run_kwargs
+            )
+        else:
+            result = await self._run_workflow(
+                service_id, session_id, task_timeout, priority, tenant_id, run_kwargs
+            )
+
+        if cache is not None:
+            await self._cache_call(cache, cache.put, cache_key, result)
+        return result
+
+    def _source_version(self, service_id: str) -> tuple[bool, str | None]:
+        """Returns whether the source of a service was synced, and its version."""
+        service_config = self._config.services.get(service_id)
+        if service_config is None or service_config.source is None:
+            return False, None
+        source = (service_config.source.type, service_config.source.location)
+        if source not in self._synced_sources:
+            return False, None
+        return True, self._synced_sources[source]
+
+    async def _cache_call(
+        self, cache: ResultCache, func: Callable[..., T], *args: Any
+    ) -> T:
+        """Calls a method of a result cache, off the event loop when it uses a database."""
+        if not cache.persistent:
+            return func(*args)
+        return await self._executor.run("result_cache", func, *args)
+
+    async def _run_coalesced(
+        self,
+        service_id: str,
+        task_timeout: float | None,
+        priority: TaskPriority,
+        tenant_id: str | None,
+        run_kwargs: dict,
+    ) -> Any:
+        """Waits for the result of the running task with the same input, or starts one."""
+        key = (service_id, json.dumps(run_kwargs, sort_keys=True))
+        run = self._inflight.get(key)
+        if run is None:
+            run = asyncio.create_task(
+                self._run_workflow(
+                    service_id, None, None, priority, tenant_id, run_kwargs
+                )
+            )
+            self._inflight[key] = run
+            self._inflight_waiters[key] = 0
+            run.add_done_callback(lambda _: self._end_flight(key, run))
         else:
-            handler = workflow.run(**run_kwargs)
-            session_id = generate_id()
-            self._contexts[session_id] = handler.ctx or Context(workflow)
+            coalesced_tasks.labels(self._name, service_id).inc()
+
+        self._inflight_waiters[key] += 1
+        try:
+            return await asyncio.wait_for(asyncio.shield(run), task_timeout)
+        except asyncio.TimeoutError:
+            msg = f"Task timed out after {task_timeout} seconds"
+            raise TimeoutError(msg) from None
+        finally:
+            if not run.done() and self._inflight.get(key) is run:
+                self._inflight_waiters[key] -= 1
+                if self._inflight_waiters[key] == 0:
+                    # Nobody is waiting for the result anymore
+                    self._end_flight(key, run)
+                    run.cancel()
+                    await asyncio.wait({run})
+
+    def _end_flight(self, key: tuple[str, str], run: asyncio.Task) -> None:
+        # A new task with the same input might have started in the meantime
+        if self._inflight.get(key) is run:
+            del self._inflight[key]
+            del self._inflight_waiters[key]
+
+    async def _run_workflow(
+        self,
+        service_id: str,
+        session_id: str | None,
+        task_timeout: float | None,
+        priority: TaskPriority,
+        tenant_id: str | None,
+        run_kwargs: dict,
+    ) -> Any:
+        workflow = await self._get_workflow(service_id)
+        context = (
+            await self._session_context(session_id, workflow) if session_id else None
+        )
+        admission = self._admission_controller(service_id)
+        await admission.acquire(priority, tenant_id)
+        try:
+            pool = self._worker_pools.get(service_id)
+            handler: WorkflowHandler
+            if pool is not None:
+                handler = await pool.run(
+                    generate_id(), session_id or generate_id(), run_kwargs
+                )
+            elif isinstance(context, RemoteContext):
+                msg = "Session belongs to a service running in worker processes"
+                raise ValueError(msg)
+            elif context is not None:
+                handler = workflow.run(context=context, **run_kwargs)
+            elif run_kwargs:
+                handler = workflow.run(**run_kwargs)
+            else:
+                handler = workflow.run()
+
+            try:
+                # Shielded, so that the workflow is stopped properly when giving up
+                result = await asyncio.wait_for(asyncio.shield(handler), task_timeout)
+            except asyncio.TimeoutError:
+                await self._stop_task(handler)
+                msg = f"Task timed out after {task_timeout} seconds"
+                raise TimeoutError(msg) from None
+            except asyncio.CancelledError:
+                await self._stop_task(handler)
+                raise
+        finally:
+            admission.release()
+            if session_id:
+                self._share_session(session_id)
+                await self._wait_state_writes(f"sessions:{session_id}")
+        return result
+
+    async def run_workflow_no_wait(
+        self,
+        service_id: str,
+        session_id: str | None = None,
+        task_timeout: float | None = None,
+        priority: TaskPriority = TaskPriority.NORMAL,
+        tenant_id: str | None = None,
+        **run_kwargs: dict,
+    ) -> Tuple[str, str]:
+        """Starts a workflow without waiting for its result.
 
+        When the service is at capacity, the task is recorded as pending and returned
+        right away, it waits in the service queue in the background according to its
+        `priority` and `tenant_id`. Pending tasks rejected while queued are recorded as
+        failed. The workflow is cancelled if it doesn't complete within `task_timeout`
+        seconds from its start.
+
+        Raises:
+            AdmissionRejected: If the service can't accept more tasks.
+        """
+        workflow = await self._get_workflow(service_id)
+        context = (
+            await self._session_context(session_id, workflow) if session_id else None
+        )
+        admission = self._admission_controller(service_id)
+        new_session = session_id is None
+        session_id = session_id or generate_id()
         handler_id = generate_id()
-        self._handlers[handler_id] = handler
-        self._handler_inputs[handler_id] = json.dumps(run_kwargs)
+        start = partial(
+            self._start_task,
+            admission,
+            service_id,
+            workflow,
+            context,
+            handler_id,
+            session_id,
+            new_session,
+            task_timeout,
+            run_kwargs,
+        )
+        if admission.check():
+            # A slot is free, it's taken without waiting
+            await admission.acquire(priority, tenant_id)
+            await start()
+        else:
+            self._handler_inputs[handler_id] = json.dumps(run_kwargs)
+            pending = asyncio.create_task(
+                self._start_pending_task(
+                    handler_id, admission, priority, tenant_id, start
+                )
+            )
+            self._pending_tasks[handler_id] = pending
+            if new_session:
+                self._pending_sessions[session_id] = pending
+
+            def done(_: asyncio.Task) -> None:
+                self._pending_tasks.pop(handler_id, None)
+                self._pending_sessions.pop(session_id, None)
+
+            pending.add_done_callback(done)
+            if self._state.shared:
+                self._store_result(
+                    TaskResult(
+                        task_id=handler_id, history=[], status=TaskStatus.PENDING
+                    )
+                )
+        # Other replicas can look the task up as soon as its id is returned
+        await self._wait_state_writes(f"results:{handler_id}", f"sessions:{session_id}")
         return handler_id, session_id
 
+    async def _start_pending_task(
+        self,
+        handler_id: str,
+        admission: AdmissionController,
+        priority: TaskPriority,
+        tenant_id: str | None,
+        start: Callable[[], Awaitable[None]],
+    ) -> None:
+        """Waits for a slot in the service queue, then starts the task."""
+        try:
+            await admission.acquire(priority, tenant_id)
+            await start()
+        except Exception as e:
+            # Nobody waits for the task to start, its result tells why it didn't
+            self._end_pending_task(handler_id, TaskStatus.FAILED, str(e))
+
+    def _end_pending_task(
+        self, handler_id: str, status: TaskStatus, error: str
+    ) -> TaskResult:
+        self._handler_inputs.pop(handler_id, None)
+        result = TaskResult(
+            task_id=handler_id, history=[], status=status, data={"error": error}
+        )
+        self._store_result(result)
+        return result
+
+    async def _start_task(
+        self,
+        admission: AdmissionController,
+        service_id: str,
+        workflow: Workflow,
+        context: Context | RemoteContext | None,
+        handler_id: str,
+        session_id: str,
+        new_session: bool,
+        task_timeout: float | None,
+        run_kwargs: dict,
+    ) -> None:
+        """Starts the workflow of a task admitted by the service."""
+        try:
+            pool = self._worker_pools.get(service_id)
+            if pool is not None:
+                if new_session:
+                    self._contexts[session_id] = RemoteContext(pool, session_id)
+                handler: WorkflowHandler = await pool.run(
+                    handler_id, session_id, run_kwargs
+                )
+            elif isinstance(context, RemoteContext):
+                msg = "Session belongs to a service running in worker processes"
+                raise ValueError(msg)
+            elif not new_session:
+                handler = workflow.run(context=context, **run_kwargs)
+            else:
+                handler = workflow.run(**run_kwargs)
+                self._contexts[session_id] = handler.ctx or Context(workflow)
+        except BaseException:
+            admission.release()
+            raise
+
+        self._handler_inputs[handler_id] = json.dumps(run_kwargs)
+        self._handlers[handler_id] = handler
+        if self._state.shared:
+            self._store_result(
+                TaskResult(task_id=handler_id, history=[], status=TaskStatus.RUNNING)
+            )
+            self._share_session(session_id)
+            handler.add_done_callback(lambda _: self._share_session(session_id))
+        handler.add_done_callback(lambda _: admission.release())
+        handler.add_done_callback(partial(self._on_handler_done, handler_id))
+        if task_timeout is not None:
+            timer = asyncio.get_running_loop().call_later(
+                task_timeout, self._on_task_timeout, handler_id, task_timeout
+            )
+            handler.add_done_callback(lambda _: timer.cancel())
+
+    async def cancel_task(
+        self, handler_id: str, reason: str = "Task was cancelled"
+    ) -> TaskResult:
+        """Cancels a running task and waits for its workflow to stop.
+
+        The steps of the workflow are cancelled and the task releases its slot in the
+        service. Pending tasks leave the service queue. Tasks already finished are left
+        untouched.
+
+        Args:
+            handler_id: The id of the task.
+            reason: Why the task was cancelled, recorded in its result.
+
+        Raises:
+            KeyError: If the task doesn't exist.
+        """
+        pending = self._pending_tasks.get(handler_id)
+        if pending is not None:
+            pending.cancel()
+            await asyncio.wait({pending})
+            if handler_id not in self._handlers:
+                return self._end_pending_task(handler_id, TaskStatus.CANCELLED, reason)
+
+        handler = self._handlers[handler_id]
+        if not handler.done():
+            self._cancel_reasons[handler_id] = reason
+            await self._stop_task(handler)
+        return self._task_result(handler_id, handler)
+
+    async def create_session(self, service_id: str | None = None) -> str:
+        """Creates a new session and returns its id.
+
+        Args:
+            service_id: The service the session is created for, the default service if None.
+        """
+        service_id = service_id or self.default_service
+        session_id = generate_id()
+        pool = self._worker_pools.get(service_id)
+        if pool is not None:
+            self._contexts[session_id] = RemoteContext(pool, session_id)
+        else:
+            workflow = await self._get_workflow(service_id)
+            self._contexts[session_id] = Context(workflow)
+            self._share_session(session_id)
+            await self._wait_state_writes(f"sessions:{session_id}")
+        return session_id
+
+    async def get_session(
+        self, session_id: str, service_id: str | None = None
+    ) -> Context | RemoteContext:
+        """Returns the context of a session, restoring it from the session store if needed.
+
+        Args:
+            session_id: The id of the session.
+            service_id: The service used to restore the session, the default service if None.
+
+        Raises:
+            KeyError: If the session doesn't exist.
+        """
+        await self._wait_pending_session(session_id)
+        context = self._contexts.get(session_id)
+        if context is None:
+            workflow = await self._get_workflow(service_id or self.default_service)
+            context = await self._restore_session(session_id, workflow)
+        return context
+
+    async def delete_session(self, session_id: str) -> None:
+        """Deletes a session, whether it's in memory or in the session store.
+
+        Raises:
+            KeyError: If the session doesn't exist.
+        """
+        sessions = self._sessions
+        if (
+            self._contexts.pop(session_id, None) is None
+            and self._spilled_sessions.pop(session_id, None) is None
+        ) and (
+            sessions is None
+            or await self._read_state(
+                f"sessions:{session_id}", "read_session", sessions.get, session_id
+            )
+            is None
+        ):
+            raise KeyError(session_id)
+        self._owned_sessions.discard(session_id)
+        if sessions is not None:
+            write = self._write_state(
+                f"sessions:{session_id}",
+                "delete_session",
+                partial(sessions.delete, session_id),
+            )
+            if write is not None:
+                await asyncio.wait({write})
+
+    async def flush_state(self) -> None:
+        """Waits for the pending writes to the task results and sessions stores."""
+        self._spill_sessions()
+        while self._state_writes:
+            await asyncio.wait(list(self._state_writes.values()))
+
+    async def warmup(self, service_ids: list[str] | None = None) -> None:
+        """Loads services ahead of their first request.
+
+        Args:
+            service_ids: The services to load, all the services of the deployment if None.
+
+        Raises:
+            KeyError: If a service doesn't exist.
+        """
+        await asyncio.gather(
+            *(self._load_service_once(s) for s in service_ids or self.service_names)
+        )
+
+    async def _get_workflow(self, service_id: str) -> Workflow:
+        """Returns the workflow of a service, loading the service on first use."""
+        if service_id in self._served_services:
+            return await self._load_service_once(service_id)
+
+        start = time.perf_counter()
+        workflow = await self._load_service_once(service_id)
+        service_first_request_wait.labels(self._name, service_id).set(
+            time.perf_counter() - start
+        )
+        self._served_services.add(service_id)
+        return workflow
+
+    async def _load_service_once(self, service_id: str) -> Workflow:
+        """Loads a service unless already loaded, sharing the load among concurrent callers.
+
+        Raises:
+            KeyError: If the service doesn't exist.
+        """
+        workflow = self._workflow_services.get(service_id)
+        if workflow is not None:
+            return workflow
+
+        load = self._service_loads.get(service_id)
+        if load is None:
+            # Bind the load to the current version of the deployment, a reload might
+            # happen in the meantime
+            loads = self._service_loads
+            load = asyncio.create_task(
+                self._load_service_lazily(
+                    self._config,
+                    service_id,
+                    self._services[service_id],
+                    self._workflow_services,
+                    self._synced_sources,
+                )
+            )
+            loads[service_id] = load
+            load.add_done_callback(lambda _: loads.pop(service_id, None))
+        # Callers giving up don't cancel the load for the others
+        return await asyncio.shield(load)
+
+    async def _load_service_lazily(
+        self,
+        config: DeploymentConfig,
+        service_id: str,
+        service_config: Service,
+        workflow_services: dict[str, Workflow],
+        synced: dict[tuple[SourceType, str], str | None],
+    ) -> Workflow:
+        """Syncs, installs and imports a single service of a version of the deployment."""
+        destination = self._version_path.resolve()
+        with self._service_phase(service_id, "syncing"):
+            async with self._sync_lock:
+                await self._sync_source(config, service_config, destination, synced)
+        workflow = await self._load_service(service_id, service_config, destination)
+        workflow_services[service_id] = workflow
+        return workflow
+
+    async def get_task_result(self, handler_id: str, wait: float = 0) -> TaskResult:
+        """Returns the result of a task, without waiting for the task to finish by default.
+
+        Results of finished tasks are kept in the result store, so they are still available
+        after the task handler was evicted. With a shared state backend, the status of
+        tasks running on other replicas is read from there too.
+
+        Args:
+            handler_id: The id of the task.
+            wait: Maximum number of seconds to wait for the task to finish.
+
+        Raises:
+            KeyError: If the task doesn't exist.
+        """
+        pending = self._pending_tasks.get(handler_id)
+        if pending is not None:
+            start = time.monotonic()
+            if wait > 0:
+                await asyncio.wait({pending}, timeout=wait)
+            if not pending.done():
+                return TaskResult(
+                    task_id=handler_id, history=[], status=TaskStatus.PENDING
+                )
+            wait = max(0, wait - (time.monotonic() - start))
+
+        handler = self._handlers.get(handler_id)
+        if handler is None:
+            return await self._stored_task_result(handler_id, wait)
+
+        if wait > 0 and not handler.done():
+            await asyncio.wait({handler}, timeout=wait)
+
+        if handler.done():
+            return self._task_result(handler_id, handler)
+
+        return TaskResult(task_id=handler_id, history=[], status=TaskStatus.RUNNING)
+
+    async def _stored_task_result(self, handler_id: str, wait: float) -> TaskResult:
+        deadline = time.monotonic() + wait
+        while True:
+            result = await self._read_state(
+                f"results:{handler_id}",
+                "read_result",
+                self._results.get,
+                handler_id,
+                blocking=self._results.blocking,
+            )
+            if result is None:
+                raise KeyError(handler_id)
+            remaining = deadline - time.monotonic()
+            if (
+                result.status not in (TaskStatus.PENDING, TaskStatus.RUNNING)
+                or remaining <= 0
+            ):
+                return result
+            # The task runs on another replica, poll the shared state until it's done
+            await asyncio.sleep(min(_RESULT_POLL_INTERVAL, remaining))
+
+    def _on_handler_done(self, handler_id: str, handler: WorkflowHandler) -> None:
+        # Restart the ttl countdown when the workflow completes
+        self._handlers.touch(handler_id)
+        self._store_result(self._task_result(handler_id, handler))
+
+    def _store_result(self, result: TaskResult) -> None:
+        self._write_state(
+            f"results:{result.task_id}",
+            "store_result",
+            partial(self._results.put, result),
+            blocking=self._results.blocking,
+        )
+
+    def _write_state(
+        self,
+        key: str | list[str],
+        operation: str,
+        func: Callable[[], None],
+        blocking: bool = True,
+    ) -> asyncio.Task | None:
+        """Writes to a state store after the pending writes of the same keys.
+
+        Blocking writes run in the executor, the returned task completes once the
+        write is done. Failures are logged, since the state is written in the
+        background of the operations changing it.
+        """
+        keys = [key] if isinstance(key, str) else key
+        previous = {self._state_writes[k] for k in keys if k in self._state_writes}
+        if not blocking and not previous:
+            func()
+            return None
+
+        write = asyncio.create_task(
+            self._run_state_write(previous, keys, operation, func, blocking)
+        )
+        for k in keys:
+            self._state_writes[k] = write
+
+        def done(_: asyncio.Task) -> None:
+            for k in keys:
+                if self._state_writes.get(k) is write:
+                    del self._state_writes[k]
+
+        write.add_done_callback(done)
+        return write
+
+    async def _run_state_write(
+        self,
+        previous: set[asyncio.Task],
+        keys: list[str],
+        operation: str,
+        func: Callable[[], None],
+        blocking: bool,
+    ) -> None:
+        if previous:
+            await asyncio.wait(previous)
+        try:
+            if blocking:
+                await self._executor.run(operation, func)
+            else:
+                func()
+        except Exception as e:
+            logger.warning(f"State write {operation} of {', '.join(keys)} failed: {e}")
+
+    async def _wait_state_writes(self, *keys: str) -> None:
+        """Waits for the pending writes of `keys` to be done."""
+        writes = {self._state_writes[key] for key in keys if key in self._state_writes}
+        if writes:
+            await asyncio.wait(writes)
+
+    async def _read_state(
+        self,
+        key: str,
+        operation: str,
+        func: Callable[..., T],
+        *args: Any,
+        blocking: bool = True,
+    ) -> T:
+        """Reads from a state store once the pending writes of the same `key` are done."""
+        write = self._state_writes.get(key)
+        if write is not None:
+            await asyncio.wait({write})
+        if not blocking:
+            return func(*args)
+        return await self._executor.run(operation, func, *args)
+
+    def _task_result(self, handler_id: str, handler: WorkflowHandler) -> TaskResult:
+        """Builds the result of a finished task."""
+        if handler.cancelled() or isinstance(
+            handler.exception(), WorkflowCancelledByUser
+        ):
+            return TaskResult(
+                task_id=handler_id,
+                history=[],
+                status=TaskStatus.CANCELLED,
+                data={
+                    "error": self._cancel_reasons.get(handler_id, "Task was cancelled")
+                },
+            )
+
+        exc = handler.exception()
+        if exc is not None:
+            return TaskResult(
+                task_id=handler_id,
+                history=[],
+                status=TaskStatus.FAILED,
+                data={"error": str(exc)},
+            )
+
+        result = handler.result()
+        return TaskResult(
+            task_id=handler_id,
+            history=[],
+            result=result
+            if isinstance(result, str)
+            else json.dumps(result, default=str),
+            status=TaskStatus.DONE,
+        )
+
+    def _on_task_timeout(self, handler_id: str, timeout: float) -> None:
+        reason = f"Task timed out after {timeout} seconds"
+        task = asyncio.create_task(self.cancel_task(handler_id, reason))
+        self._cancellations.add(task)
+        task.add_done_callback(self._cancellations.discard)
+
+    @staticmethod
+    async def _stop_task(handler: WorkflowHandler) -> None:
+        """Stops a running workflow, giving its steps some time to stop."""
+        await handler.cancel_run()
+        done, _ = await asyncio.wait({handler}, timeout=_CANCEL_GRACE_PERIOD)
+        if not done:
+            handler.cancel()
+
+    def _admission_controller(self, service_id: str) -> AdmissionController:
+        if service_id not in self._admission:
+            self._admission[service_id] = AdmissionController(
+                self._name, service_id, starvation_timeout=settings.starvation_timeout
+            )
+        return self._admission[service_id]
+
+    def _create_admission_controllers(
+        self, config: DeploymentConfig
+    ) -> dict[str, AdmissionController]:
+        return {
+            service_id: AdmissionController(
+                self._name,
+                service_id,
+                max_concurrency=service_config.max_concurrency,
+                max_queue_size=service_config.max_queue_size,
+                overflow_policy=service_config.overflow_policy,
+                queue_timeout=service_config.queue_timeout,
+                starvation_timeout=settings.starvation_timeout,
+            )
+            for service_id, service_config in config.services.items()
+        }
+
+    def _create_result_caches(self, config: DeploymentConfig) -> dict[str, ResultCache]:
+        return {
+            service_id: ResultCache(
+                self._name,
+                service_id,
+                # Changing the configuration of a service invalidates its results
+                hashlib.sha256(service_config.model_dump_json().encode()).hexdigest(),
+                max_size=service_config.cache.max_size,
+                ttl=service_config.cache.ttl,
+                path=service_config.cache.path,
+            )
+            for service_id, service_config in config.services.items()
+            if service_config.cache is not None
+        }
+
+    def _create_worker_pools(self, config: DeploymentConfig) -> dict[str, WorkerPool]:
+        worker_pools = {}
+        for service_id, service_config in config.services.items():
+            if not service_config.workers or service_config.import_path is None:
+                continue
+
+            module_path_str, workflow_name = service_config.import_path.split(":")
+            module_path = Path(module_path_str)
+            worker_pools[service_id] = WorkerPool(
+                self._name,
+                service_id,
+                size=service_config.workers,
+                pythonpath=(
+                    self._version_path.resolve() / module_path.parent
+                ).resolve(),
+                import_path=f"{module_path.name}:{workflow_name}",
+            )
+        return worker_pools
+
+    async def _session_context(
+        self, session_id: str, workflow: Workflow
+    ) -> Context | RemoteContext:
+        await self._wait_pending_session(session_id)
+        if self._state.shared and session_id not in self._owned_sessions:
+            await self._claim_session(session_id)
+        try:
+            return self._contexts[session_id]
+        except KeyError:
+            return await self._restore_session(session_id, workflow)
+
+    async def _wait_pending_session(self, session_id: str) -> None:
+        # The session of a pending task is created when the task starts
+        pending = self._pending_sessions.get(session_id)
+        if pending is not None:
+            await asyncio.wait({pending})
+
+    async def _restore_session(
+        self, session_id: str, workflow: Workflow
+    ) -> Context | RemoteContext:
+        sessions = self._sessions
+        if sessions is None:
+            raise KeyError(session_id)
+        # Sessions waiting to be stored are taken back as they are
+        if (spilled := self._spilled_sessions.pop(session_id, None)) is not None:
+            self._contexts[session_id] = spilled
+            return spilled
+        data = await self._read_state(
+            f"sessions:{session_id}", "read_session", sessions.get, session_id
+        )
+        # Another request might have restored the session in the meantime
+        if (context := self._contexts.get(session_id)) is not None:
+            return context
+        if data is None:
+            raise KeyError(session_id)
+        context = Context.from_dict(workflow, data, serializer=JsonSerializer())
+        self._contexts[session_id] = context
+        # Only remove the stored copy once the context is back in memory, unless other
+        # replicas read it
+        if not self._state.shared:
+            self._write_state(
+                f"sessions:{session_id}",
+                "delete_session",
+                partial(sessions.delete, session_id),
+            )
+        return context
+
+    async def _claim_session(self, session_id: str) -> None:
+        """Takes the ownership of a session not owned by another replica.
+
+        Raises:
+            SessionOwnedError: If another replica owns the session.
+        """
+        sessions = self._sessions
+        if sessions is None:
+            return
+        owner = await self._read_state(
+            f"sessions:{session_id}",
+            "claim_session",
+            sessions.claim,
+            session_id,
+            self._replica_id,
+            _session_lease_ttl(),
+        )
+        if owner is not None:
+            raise SessionOwnedError(session_id, owner)
+        if session_id in self._owned_sessions:
+            # Claimed by another request in the meantime
+            return
+        self._owned_sessions.add(session_id)
+        # A copy read while another replica owned the session might be stale
+        context = self._contexts.peek(session_id)
+        if isinstance(context, Context) and not context.is_running:
+            del self._contexts[session_id]
+
+    def _share_session(self, session_id: str) -> None:
+        # Publish the latest state of the session to the other replicas
+        if self._state.shared and session_id in self._contexts:
+            context = self._contexts[session_id]
+            if isinstance(context, Context):
+                # The context is still in use, take a snapshot on the event loop
+                try:
+                    data = context.to_dict(serializer=JsonSerializer())
+                except Exception as e:
+                    logger.warning(f"Unable to store session {session_id}: {e}")
+                    return
+                self._store_session(session_id, lambda: data)
+                if session_id not in self._owned_sessions:
+                    # Sessions created here are owned by this replica
+                    self._owned_sessions.add(session_id)
+                    self._renew_session_leases([session_id])
+
+    def _renew_session_leases(self, session_ids: list[str]) -> None:
+        """Extends the ownership of sessions, dropping the ones taken by other replicas."""
+        sessions = self._sessions
+        if sessions is None:
+            return
+        lost: list[str] = []
+
+        def claim() -> None:
+            for session_id in session_ids:
+                owner = sessions.claim(
+                    session_id, self._replica_id, _session_lease_ttl()
+                )
+                if owner is not None:
+                    lost.append(session_id)
+
+        write = self._write_state(
+            [f"sessions:{session_id}" for session_id in session_ids],
+            "claim_sessions",
+            claim,
+        )
+        if write is not None:
+            write.add_done_callback(lambda _: self._drop_sessions(lost))
+
+    def _drop_sessions(self, session_ids: list[str]) -> None:
+        for session_id in session_ids:
+            logger.warning(f"Session {session_id} was taken over by another replica")
+            self._owned_sessions.discard(session_id)
+            context = self._contexts.peek(session_id)
+            if isinstance(context, Context) and not context.is_running:
+                del self._contexts[session_id]
+
+    def _on_session_evicted(
+        self, session_id: str, context: Context | RemoteContext
+    ) -> None:
+        # Sessions of worker processes hold no state in this process
+        if self._sessions is None or not isinstance(context, Context):
+            return
+        self._spilled_sessions[session_id] = context
+        if len(self._spilled_sessions) == 1:
+            # Sessions evicted in the same iteration of the event loop are stored
+            # together
+            asyncio.get_running_loop().call_soon(self._spill_sessions)
+
+    def _spill_sessions(self) -> None:
+        sessions = self._sessions
+        spilled = self._spilled_sessions
+        self._spilled_sessions = {}
+        if sessions is None or not spilled:
+            return
+        # Stored sessions can be restored by any replica
+        released = [s for s in spilled if s in self._owned_sessions]
+        self._owned_sessions.difference_update(released)
+
+        def put_many() -> None:
+            # Evicted contexts aren't used anymore, serialize them off the event loop
+            data = {}
+            for session_id, context in spilled.items():
+                try:
+                    data[session_id] = context.to_dict(serializer=JsonSerializer())
+                except Exception as e:
+                    logger.warning(f"Unable to store session {session_id}: {e}")
+            sessions.put_many(data)
+            if released:
+                sessions.release(released, self._replica_id)
+
+        self._write_state(
+            [f"sessions:{session_id}" for session_id in spilled],
+            "store_sessions",
+            put_many,
+        )
+
+    def _watch_idle_sessions(self) -> None:
+        if self._sessions is not None and self._session_idle_task is None:
+            self._session_idle_task = asyncio.create_task(self._expire_idle_sessions())
+
+    async def _expire_idle_sessions(self) -> None:
+        """Moves the idle sessions to the session store, even when no session is created."""
+        while True:
+            await asyncio.sleep(
+                min(settings.session_idle_timeout, _SESSION_IDLE_CHECK_INTERVAL)
+            )
+            self._contexts.expire()
+            if self._state.shared and self._owned_sessions:
+                self._renew_session_leases(list(self._owned_sessions))
+
+    def _store_session(
+        self, session_id: str, serialize: Callable[[], dict[str, Any]]
+    ) -> None:
+        sessions = self._sessions
+        if sessions is None:
+            return
+        self._write_state(
+            f"sessions:{session_id}",
+            "store_session",
+            lambda: sessions.put(session_id, serialize()),
+        )
+
+    def subscribe_events(
+        self, handler_id: str, offset: int = 0
+    ) -> AsyncGenerator[tuple[int, Event], None]:
+        """Subscribes to the events streamed by a running task.
+
+        Any number of subscribers can attach to the same task, each one receiving the
+        same ordered stream of events along with their offset.
+
+        Args:
+            handler_id: The id of the task.
+            offset: The offset of the first event to receive, used to resume a stream.
+
+        Raises:
+            KeyError: If the task doesn't exist.
+        """
+        if handler_id in self._pending_tasks:
+            return self._subscribe_when_started(handler_id, offset)
+
+        broadcaster = self._broadcasters.get(handler_id)
+        if broadcaster is None:
+            broadcaster = EventBroadcaster(
+                self._handlers[handler_id], settings.event_replay_size
+            )
+            self._broadcasters[handler_id] = broadcaster
+        return broadcaster.subscribe(offset)
+
+    async def _subscribe_when_started(
+        self, handler_id: str, offset: int
+    ) -> AsyncGenerator[tuple[int, Event], None]:
+        await asyncio.wait({self._pending_tasks[handler_id]})
+        # Tasks that never started have no events
+        if handler_id in self._handlers:
+            async for item in self.subscribe_events(handler_id, offset):
+                yield item
+
+    def _on_handler_evicted(self, handler_id: str, handler: WorkflowHandler) -> None:
+        self._handler_inputs.pop(handler_id, None)
+        self._cancel_reasons.pop(handler_id, None)
+        self._broadcasters.pop(handler_id, None)
+
     async def start(self) -> None:
         """The task that will be launched in this deployment asyncio loop.
 
@@ -132,76 +1294,539 @@ class Deployment:
         All the tasks are gathered before returning.
         """
         self._running = True
+        if not self._local:
+            await self._executor.run("remove_versions", self._remove_stale_versions)
+        self._services = self._loadable_services(self._config)
+        if not settings.lazy_load_services:
+            self._workflow_services = await self._load_services(
+                self._config, self._version_path, self._synced_sources
+            )
+        self._default_service = self._resolve_default_service(
+            self._config, self._services
+        )
+        deployment_state.labels(self._name).state("ready")
+        self._watch_idle_sessions()
 
         # UI
         if self._config.ui:
             await self._start_ui_server()
 
+        self._ready = True
+
     async def reload(self, config: DeploymentConfig) -> None:
-        # Reset default service, it might change across reloads
-        self._default_service = None
-        # Tear down the UI server
-        self._stop_ui_server()
-        # Reload the services
-        self._workflow_services = self._load_services(config)
+        """Replaces the services of this deployment with the ones defined in `config`.
 
-        # UI
-        if self._config.ui:
-            await self._start_ui_server()
+        The new version is synced into its own folder and loaded next to the current
+        one, which keeps serving requests in the meantime. The UI server of the new
+        version listens on a new port, and requests are routed to the new version only
+        once its UI server answers. Tasks running on the previous version are given
+        `reload_drain_timeout` seconds to finish before its worker processes and UI
+        server are stopped and its folder is deleted.
+
+        Sessions of services running in worker processes live in the workers of the
+        previous version, they end with them.
+
+        With `lazy_load_services` enabled, the new services are loaded on first use
+        instead.
+
+        If the new version fails to start, the current one keeps serving requests.
+        """
+        # The new version imports the workflows again, from its own folder. Tasks of
+        # the current version keep running the modules they were loaded from.
+        for name in self._imported_modules:
+            sys.modules.pop(name, None)
+        self._imported_modules = set()
+        importlib.invalidate_caches()
+        self._versions += 1
+        version_path = (
+            self._deployment_path
+            if self._local
+            else self._deployment_path / f"v{self._versions}"
+        )
+        synced: dict[tuple[SourceType, str], str | None] = {}
+        try:
+            services = self._loadable_services(config)
+            workflow_services = (
+                {}
+                if settings.lazy_load_services
+                else await self._load_services(config, version_path, synced)
+            )
+            ui_process = None
+            ui_port = None
+            if config.ui:
+                ui_port = _free_port()
+                ui_process = await self._spawn_ui_server(config, ui_port, version_path)
+                try:
+                    await self._wait_ui_ready(ui_process, ui_port)
+                except Exception:
+                    ui_process.terminate()
+                    raise
+        except BaseException:
+            await self._remove_version(version_path)
+            raise
+        finally:
+            deployment_state.labels(self._name).state("ready")
+
+        # Route requests to the new version, without yielding to the event loop
+        previous = (
+            self._admission,
+            self._worker_pools,
+            self._ui_server_process,
+            self._result_caches,
+            self._version_path,
+        )
+        self._config = config
+        self._version_path = version_path
+        self._services = services
+        self._workflow_services = workflow_services
+        self._service_loads = {}
+        self._synced_sources = synced
+        self._served_services = set()
+        self._default_service = self._resolve_default_service(config, services)
+        self._admission = self._create_admission_controllers(config)
+        self._worker_pools = self._create_worker_pools(config)
+        self._result_caches = self._create_result_caches(config)
+        self._ui_server_process = ui_process
+        self._ui_port = ui_port
+        self._ui_hibernated = False
+        self._ui_last_active = time.monotonic()
+        if ui_process is not None:
+            self._watch_ui_idle()
+
+        task = asyncio.create_task(self._drain(*previous))
+        self._drain_tasks.add(task)
+        task.add_done_callback(self._drain_tasks.discard)
+
+    async def _drain(
+        self,
+        admission: dict[str, AdmissionController],
+        worker_pools: dict[str, WorkerPool],
+        ui_process: Process | None,
+        result_caches: dict[str, ResultCache],
+        version_path: Path,
+    ) -> None:
+        """Stops a previous version of the deployment once its tasks are done."""
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(a.drain() for a in admission.values())),
+                timeout=settings.reload_drain_timeout,
+            )
+        except asyncio.TimeoutError:
+            logger.warning(
+                f"Tasks of deployment {self._name} still running after reload, stopping them"
+            )
+        # Tasks still running in the worker processes will fail, and the sessions living
+        # there are gone
+        for pool in worker_pools.values():
+            await pool.close()
+        pools = set(worker_pools.values())
+        for session_id in self._contexts:
+            context = self._contexts.peek(session_id)
+            if isinstance(context, RemoteContext) and context.pool in pools:
+                del self._contexts[session_id]
+        if ui_process is not None and ui_process.returncode is None:
+            ui_process.terminate()
+        # Tasks that outlived the drain timeout don't cache their results
+        for cache in result_caches.values():
+            cache.close()
+        await self._remove_version(version_path)
+        await _collect_content_garbage(self._executor)
+
+    def _remove_stale_versions(self) -> None:
+        """Deletes the versions left in the deployment folder by a previous run."""
+        if not self._deployment_path.is_dir():
+            return
+        for entry in self._deployment_path.iterdir():
+            if entry == self._version_path:
+                continue
+            if entry.is_dir() and not entry.is_symlink():
+                shutil.rmtree(entry, ignore_errors=True)
+            else:
+                entry.unlink(missing_ok=True)
+
+    async def _remove_version(self, version_path: Path) -> None:
+        """Deletes the folder of a version of the deployment no longer served."""
+        if self._local or version_path == self._version_path:
+            return
+        prefix = version_path.resolve()
+        sys.path[:] = [p for p in sys.path if not Path(p).is_relative_to(prefix)]
+        if modules := _modules_in(prefix):
+            # Deleted on the next start
+            logger.warning(
+                f"Keeping {version_path}, modules {', '.join(modules)} still loaded from there"
+            )
+            return
+        try:
+            await self._executor.run("remove_version", shutil.rmtree, version_path)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"Unable to delete {version_path}: {e}")
+
+    async def _stop_ui_server(self) -> None:
+        if self._ui_idle_task is not None:
+            self._ui_idle_task.cancel()
+            self._ui_idle_task = None
+
+        if self._ui_client is not None:
+            await self._ui_client.aclose()
+            self._ui_client = None
 
-    def _stop_ui_server(self) -> None:
         if self._ui_server_process is None:
             return
 
         self._ui_server_process.terminate()
 
     async def _start_ui_server(self) -> None:
-        """Creates WorkflowService instances according to the configuration object."""
+        """Starts the UI server on the port set in the configuration, or on a free one."""
         if not self._config.ui:
             raise ValueError("missing ui configuration settings")
 
-        source = self._config.ui.source
+        port = self._config.ui.port or _free_port()
+        self._ui_server_process = await self._spawn_ui_server(
+            self._config, port, self._version_path
+        )
+        self._ui_port = port
+        self._ui_hibernated = False
+        self._ui_last_active = time.monotonic()
+        if self._ui_client is None:
+            self._ui_client = self._create_ui_client()
+        self._watch_ui_idle()
+
+    def _watch_ui_idle(self) -> None:
+        if settings.ui_idle_timeout is not None and self._ui_idle_task is None:
+            self._ui_idle_task = asyncio.create_task(
+                self._hibernate_idle_ui_server(settings.ui_idle_timeout)
+            )
+
+    async def _hibernate_idle_ui_server(self, idle_timeout: float) -> None:
+        """Stops the UI server when no request reached it for `idle_timeout` seconds."""
+        while True:
+            await asyncio.sleep(min(idle_timeout, _UI_IDLE_CHECK_INTERVAL))
+            idle = 0.0
+            if not self._ui_connections:
+                idle = time.monotonic() - self._ui_last_active
+            ui_idle_time.labels(self._name).set(idle)
+            process = self._ui_server_process
+            if self._ui_hibernated or process is None or idle < idle_timeout:
+                continue
+
+            async with self._ui_wake_lock:
+                # A request may have arrived while waiting for the lock
+                idle = time.monotonic() - self._ui_last_active
+                if (
+                    self._ui_connections
+                    or process is not self._ui_server_process
+                    or idle < idle_timeout
+                ):
+                    continue
+
+                logger.info(
+                    f"Stopping the UI server of deployment {self._name}, idle for {idle:.0f} seconds"
+                )
+                process.terminate()
+                # Free the port before the UI server is started again
+                try:
+                    await asyncio.wait_for(process.wait(), _CANCEL_GRACE_PERIOD)
+                except asyncio.TimeoutError:
+                    with suppress(ProcessLookupError):
+                        process.kill()
+                    await process.wait()
+                self._ui_server_process = None
+                self._ui_hibernated = True
+
+    async def _spawn_ui_server(
+        self, config: DeploymentConfig, port: int, destination: Path
+    ) -> Process:
+        """Syncs the UI server defined in `config` into `destination`, installs and runs it."""
+        installed_path = await self._install_ui_server(config, destination)
+        return await self._run_ui_server(config, installed_path, port)
+
+    async def _install_ui_server(
+        self, config: DeploymentConfig, destination: Path
+    ) -> Path:
+        """Syncs the UI server defined in `config` into `destination` and installs its dependencies."""
+        if not config.ui:
+            raise ValueError("missing ui configuration settings")
+
+        source = config.ui.source
         if source is None:
             raise ValueError("source must be defined")
 
         # Sync the service source
-        destination = self._deployment_path.resolve()
-        source_manager = SOURCE_MANAGERS[source.type](self._config, self._base_path)
+        source_manager = SOURCE_MANAGERS[source.type](config, self._base_path)
         policy = source.sync_policy or (
             SyncPolicy.SKIP if self._local else SyncPolicy.REPLACE
         )
-        source_manager.sync(source.location, str(destination), policy)
-        installed_path = destination / source_manager.relative_path(source.location)
+        await self._executor.run(
+            "sync",
+            source_manager.sync,
+            source.location,
+            str(destination.resolve()),
+            policy,
+            timeout=settings.sync_timeout,
+        )
+        installed_path = self._ui_installed_path(config, destination)
+
+        if config.ui.mode == UIMode.production:
+            await self._build_ui_server(config, installed_path)
+        else:
+            await self._run_ui_command(
+                ["pnpm", "install"], installed_path, "UI dependencies not installed"
+            )
+        return installed_path
+
+    async def _build_ui_server(
+        self, config: DeploymentConfig, installed_path: Path
+    ) -> None:
+        """Installs the dependencies of the UI server and builds it for production.
 
-        install = await asyncio.create_subprocess_exec(
-            "pnpm", "install", cwd=installed_path
+        Builds are kept in the cache folder, keyed by a hash of the UI sources and
+        lockfile, and the source folder links to them. Syncing the sources, or a new
+        version with the same UI, leaves the build alone: it's linked again as is.
+        """
+        build_hash = await self._executor.run(
+            "hash_ui", self._ui_build_hash, config.name, installed_path
         )
-        await install.wait()
+        cached = settings.cache_dir / "ui" / build_hash
+        if (cached / _UI_BUILD_STAMP).is_file():
+            logger.info(f"UI of deployment {config.name} found in the build cache")
+        else:
+            # Don't build over a cached build of other sources
+            await self._executor.run("unlink_ui", self._unlink_ui_build, installed_path)
+            env = self._ui_env(config)
+            await self._run_ui_command(
+                ["pnpm", "install"], installed_path, "UI dependencies not installed"
+            )
+            await self._run_ui_command(
+                ["pnpm", "run", "build"], installed_path, "UI not built", env
+            )
+            await self._executor.run(
+                "cache_ui", self._cache_ui_build, installed_path, cached, build_hash
+            )
+        await self._executor.run("link_ui", self._link_ui_build, cached, installed_path)
+
+    @staticmethod
+    async def _run_ui_command(
+        args: list[str],
+        cwd: Path,
+        failure: str,
+        env: dict[str, str] | None = None,
+    ) -> None:
+        """Runs a command preparing the UI server, within the install timeout."""
+        process = await asyncio.create_subprocess_exec(*args, cwd=cwd, env=env)
+        try:
+            returncode = await asyncio.wait_for(
+                process.wait(), settings.install_timeout
+            )
+        except asyncio.TimeoutError:
+            process.kill()
+            msg = f"{failure} after {settings.install_timeout} seconds"
+            raise DeploymentError(msg) from None
+        if returncode:
+            msg = f"{failure}, '{' '.join(args)}' exited with code {returncode}"
+            raise DeploymentError(msg)
+
+    @staticmethod
+    def _ui_build_hash(deployment_name: str, installed_path: Path) -> str:
+        """Returns a key identifying the production build of the UI sources in `installed_path`."""
+        # The base path of the deployment is baked into the build
+        digest = hashlib.sha256(deployment_name.encode() + b"\0")
+        for root, dirs, files in os.walk(installed_path):
+            dirs[:] = sorted(d for d in dirs if d not in _UI_BUILD_IGNORE)
+            for name in sorted(files):
+                if name in _UI_BUILD_IGNORE:
+                    continue
+                path = Path(root) / name
+                digest.update(str(path.relative_to(installed_path)).encode() + b"\0")
+                digest.update(path.read_bytes())
+        return digest.hexdigest()
+
+    @staticmethod
+    def _cache_ui_build(installed_path: Path, cached: Path, build_hash: str) -> None:
+        """Moves the dependencies and the build of the UI to the build cache."""
+        cached.parent.mkdir(parents=True, exist_ok=True)
+        staging = Path(tempfile.mkdtemp(dir=cached.parent))
+        try:
+            # Dependencies installed by pnpm are linked with relative symlinks, they
+            # survive the move
+            for name in _UI_BUILD_OUTPUTS:
+                if (installed_path / name).is_dir():
+                    shutil.move(installed_path / name, staging / name)
+            (staging / _UI_BUILD_STAMP).write_text(build_hash)
+            staging.rename(cached)
+        except OSError as e:
+            # Another deployment might have cached the same build in the meantime,
+            # otherwise the build stays in the source folder
+            if not (cached / _UI_BUILD_STAMP).is_file():
+                logger.warning(f"UI build not cached: {e}")
+                for name in _UI_BUILD_OUTPUTS:
+                    if (staging / name).is_dir():
+                        shutil.move(staging / name, installed_path / name)
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+    @staticmethod
+    def _link_ui_build(cached: Path, installed_path: Path) -> None:
+        """Links the dependencies and the build of the UI in the build cache to `installed_path`."""
+        if not (cached / _UI_BUILD_STAMP).is_file():
+            return
+        Deployment._unlink_ui_build(installed_path)
+        for name in _UI_BUILD_OUTPUTS:
+            if not (cached / name).is_dir():
+                continue
+            path = installed_path / name
+            if path.is_dir():
+                shutil.rmtree(path)
+            path.symlink_to(cached / name, target_is_directory=True)
 
+    @staticmethod
+    def _unlink_ui_build(installed_path: Path) -> None:
+        """Removes the links to a build of the UI in the build cache from `installed_path`."""
+        for name in _UI_BUILD_OUTPUTS:
+            if (installed_path / name).is_symlink():
+                (installed_path / name).unlink()
+
+    @staticmethod
+    def _ui_env(config: DeploymentConfig) -> dict[str, str]:
         env = os.environ.copy()
-        env["LLAMA_DEPLOY_NEXTJS_BASE_PATH"] = f"/deployments/{self._config.name}/ui"
-        env["LLAMA_DEPLOY_NEXTJS_DEPLOYMENT_NAME"] = self._config.name
-        # Override PORT and force using the one from the deployment.yaml file
-        env["PORT"] = str(self._config.ui.port)
+        env["LLAMA_DEPLOY_NEXTJS_BASE_PATH"] = f"/deployments/{config.name}/ui"
+        env["LLAMA_DEPLOY_NEXTJS_DEPLOYMENT_NAME"] = config.name
+        return env
+
+    def _ui_installed_path(self, config: DeploymentConfig, destination: Path) -> Path:
+        """Returns the folder where the source of the UI server is synced in `destination`."""
+        if not config.ui or config.ui.source is None:
+            raise ValueError("missing ui configuration settings")
+
+        source = config.ui.source
+        source_manager = SOURCE_MANAGERS[source.type](config, self._base_path)
+        return destination.resolve() / source_manager.relative_path(source.location)
 
-        self._ui_server_process = await asyncio.create_subprocess_exec(
+    async def _run_ui_server(
+        self, config: DeploymentConfig, installed_path: Path, port: int
+    ) -> Process:
+        """Runs the UI server installed in `installed_path` on `port`."""
+        env = self._ui_env(config)
+        # Override PORT and force using the one assigned by the deployment
+        env["PORT"] = str(port)
+
+        production = config.ui is not None and config.ui.mode == UIMode.production
+        process = await asyncio.create_subprocess_exec(
             "pnpm",
             "run",
-            "dev",
+            "start" if production else "dev",
             cwd=installed_path,
             env=env,
         )
 
-        print(f"Started Next.js app with PID {self._ui_server_process.pid}")
+        print(f"Started Next.js app with PID {process.pid}")
+        return process
+
+    async def _wait_ui_ready(self, process: Process, port: int) -> None:
+        """Waits until the UI server listening on `port` answers requests.
+
+        Raises:
+            DeploymentError: If the UI server exits or doesn't answer in time.
+        """
+        url = f"http://localhost:{port}/deployments/{self._name}/ui"
+        deadline = time.monotonic() + settings.ui_ready_timeout
+        while time.monotonic() < deadline:
+            if process.returncode is not None:
+                msg = f"UI server exited with code {process.returncode}"
+                raise DeploymentError(msg)
+            try:
+                response = await self.ui_client.get(url)
+                if response.status_code < 500:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.5)
+
+        msg = f"UI server not ready after {settings.ui_ready_timeout} seconds"
+        raise DeploymentError(msg)
+
+    @staticmethod
+    def _create_ui_client() -> httpx.AsyncClient:
+        """Creates a connection pool towards the UI server."""
+        return httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=settings.ui_proxy_max_connections,
+                max_keepalive_connections=settings.ui_proxy_max_keepalive_connections,
+            ),
+            timeout=httpx.Timeout(
+                settings.ui_proxy_read_timeout,
+                connect=settings.ui_proxy_connect_timeout,
+            ),
+        )
 
-    def _load_services(self, config: DeploymentConfig) -> dict[str, Workflow]:
-        """Creates WorkflowService instances according to the configuration object."""
+    async def _load_services(
+        self,
+        config: DeploymentConfig,
+        destination: Path,
+        synced: dict[tuple[SourceType, str], str | None],
+    ) -> dict[str, Workflow]:
+        """Creates WorkflowService instances according to the configuration object.
+
+        Services are loaded concurrently and off the event loop thread. All the services
+        share the deployment folder, so each distinct source is synced once, and sources
+        are synced concurrently unless they are synced into overlapping folders. The
+        versions of the synced sources are recorded in `synced`.
+        """
         deployment_state.labels(self._name).state("loading_services")
-        workflow_services = {}
-        for service_id, service_config in config.services.items():
+        services = self._loadable_services(config)
+        for service_id in services:
             service_state.labels(self._name, service_id).state("loading")
+
+        # Sync the service sources
+        destination = destination.resolve()
+        syncs: dict[tuple[SourceType, str], tuple[Path, asyncio.Task[None]]] = {}
+        for service_id, service_config in services.items():
             source = service_config.source
-            if source is None:
+            assert source is not None
+            if (source.type, source.location) in syncs:
+                continue
+            target = self._sync_target(config, service_config, destination)
+            # A sync replaces the content of its folder, wait for the ones sharing it
+            overlapping = [
+                sync
+                for path, sync in syncs.values()
+                if path.is_relative_to(target) or target.is_relative_to(path)
+            ]
+            syncs[(source.type, source.location)] = (
+                target,
+                asyncio.create_task(
+                    self._sync_source_after(
+                        overlapping,
+                        service_id,
+                        config,
+                        service_config,
+                        destination,
+                        synced,
+                    )
+                ),
+            )
+        sync_tasks = [sync for _, sync in syncs.values()]
+        try:
+            await asyncio.gather(*sync_tasks)
+        except BaseException:
+            for sync in sync_tasks:
+                sync.cancel()
+            raise
+
+        workflows = await asyncio.gather(
+            *(
+                self._load_service(service_id, service_config, destination)
+                for service_id, service_config in services.items()
+            )
+        )
+        return dict(zip(services, workflows))
+
+    def _loadable_services(self, config: DeploymentConfig) -> dict[str, Service]:
+        """Returns the services of `config` that are loaded by this deployment."""
+        services: dict[str, Service] = {}
+        for service_id, service_config in config.services.items():
+            if service_config.source is None:
                 # this is a default service, skip for now
                 # TODO: check the service name is valid and supported
                 # TODO: possibly start the default service if not running already
@@ -211,42 +1836,148 @@ class Deployment:
                 msg = "path field in service definition must be set"
                 raise ValueError(msg)
 
-            # Sync the service source
-            service_state.labels(self._name, service_id).state("syncing")
-            destination = self._deployment_path.resolve()
-            source_manager = SOURCE_MANAGERS[source.type](config, self._base_path)
-            policy = SyncPolicy.SKIP if self._local else SyncPolicy.REPLACE
-            source_manager.sync(source.location, str(destination), policy)
+            services[service_id] = service_config
+            if settings.lazy_load_services:
+                service_state.labels(self._name, service_id).state("pending")
+        return services
+
+    async def _sync_source_after(
+        self,
+        overlapping: list[asyncio.Task[None]],
+        service_id: str,
+        config: DeploymentConfig,
+        service_config: Service,
+        destination: Path,
+        synced: dict[tuple[SourceType, str], str | None],
+    ) -> None:
+        """Syncs the source of a service once the `overlapping` syncs are done."""
+        await asyncio.gather(*overlapping)
+        with self._service_phase(service_id, "syncing"):
+            await self._sync_source(config, service_config, destination, synced)
+
+    def _sync_target(
+        self, config: DeploymentConfig, service_config: Service, destination: Path
+    ) -> Path:
+        """Returns the folder where the source of a service is synced in `destination`."""
+        source = service_config.source
+        assert source is not None
+        source_manager = SOURCE_MANAGERS[source.type](config, self._base_path)
+        return Path(
+            os.path.normpath(
+                destination / source_manager.relative_path(source.location)
+            )
+        )
+
+    async def _sync_source(
+        self,
+        config: DeploymentConfig,
+        service_config: Service,
+        destination: Path,
+        synced: dict[tuple[SourceType, str], str | None],
+    ) -> None:
+        """Syncs the source of a service into `destination`, unless already in `synced`.
+
+        The version of the synced source is recorded in `synced`.
+        """
+        source = service_config.source
+        assert source is not None
+        if (source.type, source.location) in synced:
+            return
+        policy = SyncPolicy.SKIP if self._local else SyncPolicy.REPLACE
+        source_manager = SOURCE_MANAGERS[source.type](config, self._base_path)
+        version = await self._executor.run(
+            "sync",
+            source_manager.sync,
+            source.location,
+            str(destination),
+            policy,
+            timeout=settings.sync_timeout,
+        )
+        synced[(source.type, source.location)] = version
 
-            # Install dependencies
-            service_state.labels(self._name, service_id).state("installing")
-            self._install_dependencies(service_config, destination)
+    @staticmethod
+    def _resolve_default_service(
+        config: DeploymentConfig, services: dict[str, Service]
+    ) -> str | None:
+        if not config.default_service:
+            return None
+        if config.default_service not in services:
+            msg = f"Service with id '{config.default_service}' does not exist, cannot set it as default."
+            logger.warning(msg)
+            return None
+        return config.default_service
+
+    async def _load_service(
+        self, service_id: str, service_config: Service, destination: Path
+    ) -> Workflow:
+        """Installs the dependencies of a synced service and imports its workflow."""
+        with self._service_phase(service_id, "installing"):
+            # The install stops by itself at the deadline, instead of holding the
+            # install lock after the caller gave up
+            deadline = (
+                None
+                if settings.install_timeout is None
+                else time.monotonic() + settings.install_timeout
+            )
+            await self._executor.run(
+                "install",
+                self._install_dependencies_cached,
+                service_config,
+                destination,
+                deadline,
+                timeout=settings.install_timeout,
+            )
 
-            # Set environment variables
-            self._set_environment_variables(service_config, destination)
+        # Set environment variables
+        await self._executor.run(
+            "set_env", self._set_environment_variables, service_config, destination
+        )
 
-            # Search for a workflow instance in the service path
+        # Search for a workflow instance in the service path
+        with self._service_phase(service_id, "importing"):
+            assert service_config.import_path is not None
             module_path_str, workflow_name = service_config.import_path.split(":")
             module_path = Path(module_path_str)
             module_name = module_path.name
             pythonpath = (destination / module_path.parent).resolve()
-            logger.debug("Extending PYTHONPATH to %s", pythonpath)
-            sys.path.append(str(pythonpath))
-
-            module = importlib.import_module(module_name)
-            workflow_services[service_id] = getattr(module, workflow_name)
-
-            service_state.labels(self._name, service_id).state("ready")
+            # Modules are imported from the folder of this version only
+            root = self._deployment_path.resolve()
+            sys.path[:] = [
+                p
+                for p in sys.path
+                if not Path(p).is_relative_to(root)
+                or Path(p).is_relative_to(destination)
+            ]
+            if str(pythonpath) not in sys.path:
+                logger.debug("Extending PYTHONPATH to %s", pythonpath)
+                sys.path.append(str(pythonpath))
+
+            before = set(sys.modules)
+            module = await self._executor.run(
+                "import",
+                importlib.import_module,
+                module_name,
+                timeout=settings.import_timeout,
+            )
+            imported = set(sys.modules) - before
+            self._imported_modules.update(
+                name for name in _modules_in(root) if name in imported
+            )
 
-        if config.default_service:
-            if config.default_service in workflow_services:
-                self._default_service = config.default_service
-            else:
-                msg = f"Service with id '{config.default_service}' does not exist, cannot set it as default."
-                logger.warning(msg)
-                self._default_service = None
+        service_state.labels(self._name, service_id).state("ready")
+        return getattr(module, workflow_name)
 
-        return workflow_services
+    @contextmanager
+    def _service_phase(self, service_id: str, phase: str) -> Iterator[None]:
+        """Sets the state of a service and records the time spent in it."""
+        service_state.labels(self._name, service_id).state(phase)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            service_phase_duration.labels(self._name, service_id, phase).observe(
+                time.perf_counter() - start
+            )
 
     @staticmethod
     def _validate_path_is_safe(
@@ -290,10 +2021,65 @@ class Deployment:
                 os.environ[k] = v
 
     @staticmethod
-    def _install_dependencies(service_config: Service, source_root: Path) -> None:
-        """Runs `pip install` on the items listed under `python-dependencies` in the service configuration."""
+    def _install_dependencies_cached(
+        service_config: Service, source_root: Path, deadline: float | None = None
+    ) -> None:
+        """Installs the service dependencies, unless the same set was already installed.
+
+        Installed sets are recorded in the cache folder, keyed by a hash of the resolved
+        install arguments and of the requirement files they point to. Waiting for other
+        installs and installing stop at `deadline`, a `time.monotonic()` value.
+        """
         if not service_config.python_dependencies:
             return
+
+        install_args = Deployment._dependencies_install_args(
+            service_config, source_root
+        )
+        marker = (
+            settings.cache_dir / "deps" / Deployment._dependencies_hash(install_args)
+        )
+        lock = _install_lock(_install_prefix())
+        timeout = _remaining(deadline)
+        if not lock.acquire(timeout=-1 if timeout is None else timeout):
+            msg = "Dependencies not installed, another install is still running"
+            raise DeploymentError(msg)
+        try:
+            if marker.exists():
+                logger.info(
+                    "Dependencies already installed, skipping: %s", install_args
+                )
+                return
+            Deployment._install_dependencies(service_config, source_root, deadline)
+            marker.parent.mkdir(parents=True, exist_ok=True)
+            marker.touch()
+        finally:
+            lock.release()
+
+    @staticmethod
+    def _dependencies_hash(install_args: list[str]) -> str:
+        """Returns a key identifying a set of dependencies installed in this environment.
+
+        The key changes with the interpreter and when its environment is recreated.
+        """
+        digest = hashlib.sha256(sys.executable.encode() + b"\0")
+        digest.update(_environment_id().encode() + b"\0")
+        for arg in install_args:
+            digest.update(arg.encode() + b"\0")
+            path = Path(arg)
+            if path.is_file():
+                digest.update(path.read_bytes())
+            elif path.is_dir():
+                for name in ("pyproject.toml", "setup.py", "setup.cfg"):
+                    if (path / name).is_file():
+                        digest.update((path / name).read_bytes())
+        return digest.hexdigest()
+
+    @staticmethod
+    def _dependencies_install_args(
+        service_config: Service, source_root: Path
+    ) -> list[str]:
+        """Resolves the items listed under `python-dependencies` into `pip install` arguments."""
         install_args = []
         for dep in service_config.python_dependencies or []:
             if dep.endswith("requirements.txt"):
@@ -313,6 +2099,21 @@ class Deployment:
                         install_args.append(dep)
                 else:
                     install_args.append(dep)
+        return install_args
+
+    @staticmethod
+    def _install_dependencies(
+        service_config: Service, source_root: Path, deadline: float | None = None
+    ) -> None:
+        """Runs `pip install` on the items listed under `python-dependencies` in the service configuration.
+
+        The install is killed when still running at `deadline`, a `time.monotonic()` value.
+        """
+        if not service_config.python_dependencies:
+            return
+        install_args = Deployment._dependencies_install_args(
+            service_config, source_root
+        )
 
         # Check if uv is available on the path
         uv_available = False
@@ -335,19 +2136,20 @@ class Deployment:
                         "pip",
                         "install",
                         "uv",
-                    ]
+                    ],
+                    timeout=_remaining(deadline),
                 )
             except subprocess.CalledProcessError as e:
                 msg = f"Unable to install uv. Environment must include uv, or uv must be installed with pip: {e.stderr}"
                 raise DeploymentError(msg)
+            except subprocess.TimeoutExpired:
+                raise DeploymentError("Timed out installing uv") from None
 
         # Bit of an ugly hack, install to whatever python environment we're currently in
         # Find the python bin path and get its parent dir, and install into whatever that
         # python is. Hopefully we're in a container or a venv, otherwise this is installing to
         # the system python
         # https://docs.astral.sh/uv/concepts/projects/config/#project-environment-path
-        python_bin_path = os.path.dirname(sys.executable)
-        python_parent_dir = os.path.dirname(python_bin_path)
         if install_args:
             try:
                 subprocess.check_call(
@@ -355,10 +2157,11 @@ class Deployment:
                         "uv",
                         "pip",
                         "install",
-                        f"--prefix={python_parent_dir}",  # installs to the current python environment
+                        f"--prefix={_install_prefix()}",  # installs to the current python environment
                         *install_args,
                     ],
                     cwd=source_root,
+                    timeout=_remaining(deadline),
                 )
 
                 # Force Python to refresh its package discovery after installing new packages
@@ -369,6 +2172,58 @@ class Deployment:
             except subprocess.CalledProcessError as e:
                 msg = f"Unable to install service dependencies using command '{e.cmd}': {e.stderr}"
                 raise DeploymentError(msg) from None
+            except subprocess.TimeoutExpired as e:
+                msg = (
+                    f"Timed out installing service dependencies using command '{e.cmd}'"
+                )
+                raise DeploymentError(msg) from None
+
+
+def _install_prefix() -> str:
+    """Returns the prefix of the Python environment dependencies are installed into."""
+    return os.path.dirname(os.path.dirname(sys.executable))
+
+
+def _install_lock(prefix: str) -> threading.Lock:
+    """Returns the lock serializing the installs into the environment at `prefix`."""
+    with _install_locks_guard:
+        return _install_locks.setdefault(prefix, threading.Lock())
+
+
+def _environment_id() -> str:
+    """Returns an id of the current Python environment, stored in its site-packages.
+
+    A recreated environment gets a new id, so dependencies installed in the previous
+    one aren't taken as installed.
+    """
+    stamp = Path(sysconfig.get_paths()["purelib"]) / _ENVIRONMENT_STAMP
+    try:
+        if not stamp.exists():
+            stamp.write_text(generate_id())
+        return stamp.read_text().strip()
+    except OSError:
+        # Read-only environments can't be recreated by us, the folder identifies them
+        return str(stamp.parent.stat().st_ino) if stamp.parent.exists() else ""
+
+
+def _session_lease_ttl() -> float:
+    """Returns the seconds a replica owns a session without renewing its lease."""
+    # Leases are renewed by the loop moving idle sessions to the session store
+    return 3 * min(settings.session_idle_timeout, _SESSION_IDLE_CHECK_INTERVAL)
+
+
+def _remaining(deadline: float | None) -> float | None:
+    """Returns the seconds left until `deadline`, a `time.monotonic()` value."""
+    if deadline is None:
+        return None
+    return max(0.0, deadline - time.monotonic())
+
+
+def _free_port() -> int:
+    """Returns a TCP port currently free on localhost."""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("localhost", 0))
+        return sock.getsockname()[1]
 
 
 class Manager:
@@ -392,9 +2247,15 @@ class Manager:
             max_deployments: The maximum number of deployments supported by this manager.
         """
         self._deployments: dict[str, Deployment] = {}
+        # Deployments waiting to start, and the ones that failed to
+        self._pending_deployments: set[str] = set()
+        self._failed_deployments: dict[str, str] = {}
         self._deployments_path: Path | None = None
         self._max_deployments = max_deployments
-        self._pool = ThreadPool(processes=max_deployments)
+        # Blocking operations of all the deployments share a bounded pool of threads
+        self._executor = BlockingExecutor(settings.executor_max_workers)
+        # Created on first use, since it might connect to an external service
+        self._state_backend: StateBackend | None = None
         self._last_control_plane_port = 8002
         self._simple_message_queue_server: asyncio.Task | None = None
         self._serving = False
@@ -415,21 +2276,57 @@ class Manager:
             path or Path(tempfile.gettempdir()) / "llama_deploy" / "deployments"
         )
 
+    @property
+    def state_backend(self) -> StateBackend:
+        """The backend storing task results and sessions of all the deployments."""
+        if self._state_backend is None:
+            self._state_backend = create_state_backend(settings)
+        return self._state_backend
+
     def get_deployment(self, deployment_name: str) -> Deployment | None:
         return self._deployments.get(deployment_name)
 
+    def mark_failed(self, name: str, error: str) -> None:
+        """Reports a deployment that could not be created, e.g. an invalid config file."""
+        self._failed_deployments[name] = error
+
+    def deployment_statuses(self) -> dict[str, DeploymentStatusEnum]:
+        """Returns the startup status of each deployment known to the manager."""
+        statuses = {
+            name: DeploymentStatusEnum.PENDING for name in self._pending_deployments
+        }
+        statuses.update(
+            (name, DeploymentStatusEnum.FAILED) for name in self._failed_deployments
+        )
+        for name, deployment in self._deployments.items():
+            statuses[name] = (
+                DeploymentStatusEnum.READY
+                if deployment.ready
+                else DeploymentStatusEnum.STARTING
+            )
+        return statuses
+
     async def serve(self) -> None:
         """The server loop, it keeps the manager running."""
         if self._deployments_path is None:
             raise RuntimeError("Deployments path not set")
 
         self._serving = True
+        # Sources of deployments removed since the last run are still stored
+        garbage_collection = asyncio.create_task(
+            _collect_content_garbage(self._executor)
+        )
 
         event = asyncio.Event()
         try:
             # Waits indefinitely since `event` will never be set
             await event.wait()
         except asyncio.CancelledError:
+            garbage_collection.cancel()
+            await asyncio.gather(*(d.flush_state() for d in self._deployments.values()))
+            self._executor.shutdown()
+            if self._state_backend is not None:
+                self._state_backend.close()
             if self._simple_message_queue_server is not None:
                 self._simple_message_queue_server.cancel()
                 await self._simple_message_queue_server
@@ -471,9 +2368,17 @@ class Manager:
                 base_path=Path(base_path),
                 deployment_path=self.deployments_path,
                 local=local,
+                executor=self._executor,
+                state_backend=self.state_backend,
             )
             self._deployments[config.name] = deployment
-            await deployment.start()
+            self._failed_deployments.pop(config.name, None)
+            try:
+                await deployment.start()
+            except Exception as e:
+                del self._deployments[config.name]
+                self._failed_deployments[config.name] = str(e)
+                raise
         else:
             if config.name not in self._deployments:
                 msg = f"Cannot find deployment to reload: {config.name}"
@@ -481,3 +2386,28 @@ class Manager:
 
             deployment = self._deployments[config.name]
             await deployment.reload(config)
+
+    async def deploy_many(
+        self, configs: list[DeploymentConfig], base_path: str, max_concurrency: int
+    ) -> None:
+        """Deploys several configurations concurrently.
+
+        Failures are logged and don't affect the other deployments.
+
+        Args:
+            configs: The deployment configurations.
+            base_path: The path the sources of the deployments are relative to.
+            max_concurrency: The maximum number of deployments started at the same time.
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+        self._pending_deployments.update(config.name for config in configs)
+
+        async def deploy_one(config: DeploymentConfig) -> None:
+            async with semaphore:
+                self._pending_deployments.discard(config.name)
+                try:
+                    await self.deploy(config, base_path=base_path)
+                except Exception as e:
+                    logger.error(f"Failed to deploy {config.name}: {str(e)}")
+
+        await asyncio.gather(*(deploy_one(config) for config in configs))
@@ -30,6 +30,20 @@ class SyncPolicy(Enum):
     FAIL = "fail"
 
 
+class OverflowPolicy(str, Enum):
+    """Supported values for the `Service.overflow_policy` parameter."""
+
+    reject = "reject"
+    queue = "queue"
+
+
+class UIMode(str, Enum):
+    """Supported values for the `UIService.mode` parameter."""
+
+    dev = "dev"
+    production = "production"
+
+
 class ServiceSource(BaseModel):
     """Configuration for the `source` parameter of a service."""
 
@@ -50,6 +64,23 @@ class ServiceSource(BaseModel):
         return data
 
 
+class ResultCacheConfig(BaseModel):
+    """Configuration for the `cache` parameter of a service."""
+
+    max_size: int = Field(default=1000, ge=1)
+    ttl: float | None = Field(default=3600.0, gt=0)
+    path: Path | None = None
+
+    @model_validator(mode="before")
+    @classmethod
+    def validate_fields(cls, data: Any) -> Any:
+        # Handle YAML aliases
+        if isinstance(data, dict):
+            if "max-size" in data:
+                data["max_size"] = data.pop("max-size")
+        return data
+
+
 class Service(BaseModel):
     """Configuration for a single service."""
 
@@ -62,6 +93,13 @@ class Service(BaseModel):
     env_files: list[str] | None = Field(None)
     python_dependencies: list[str] | None = Field(None)
     ts_dependencies: dict[str, str] | None = Field(None)
+    max_concurrency: int | None = Field(default=None, ge=1)
+    max_queue_size: int | None = Field(default=None, ge=0)
+    overflow_policy: OverflowPolicy = OverflowPolicy.queue
+    queue_timeout: float | None = Field(default=None, gt=0)
+    workers: int = Field(default=0, ge=0)
+    deterministic: bool = False
+    cache: ResultCacheConfig | None = None
 
     @model_validator(mode="before")
     @classmethod
@@ -83,6 +121,16 @@ class Service(BaseModel):
                 data["python_dependencies"] = data.pop("python-dependencies")
             if "ts-dependencies" in data:
                 data["ts_dependencies"] = data.pop("ts-dependencies")
+            if "max-concurrency" in data:
+                data["max_concurrency"] = data.pop("max-concurrency")
+            if "max-queue-size" in data:
+                data["max_queue_size"] = data.pop("max-queue-size")
+            if "overflow-policy" in data:
+                data["overflow_policy"] = data.pop("overflow-policy")
+            if "queue-timeout" in data:
+                data["queue_timeout"] = data.pop("queue-timeout")
+            if isinstance(data.get("cache"), bool):
+                data["cache"] = {} if data["cache"] else None
 
         return data
 
@@ -92,6 +140,10 @@ class UIService(Service):
         default=3000,
         description="The TCP port to use for the nextjs server",
     )
+    mode: UIMode = Field(
+        default=UIMode.dev,
+        description="Run the nextjs server in development mode, or build it once and serve the production build",
+    )
 
 
 class DeploymentConfig(BaseModel):
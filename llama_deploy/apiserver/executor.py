@@ -0,0 +1,89 @@
+import asyncio
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, TypeVar
+
+from .stats import (
+    executor_operation_duration,
+    executor_queue_depth,
+    executor_timeouts,
+    executor_wait_time,
+)
+
+T = TypeVar("T")
+
+
+class BlockingExecutor:
+    """Runs the blocking operations of the deployments in a bounded pool of threads.
+
+    Operations like syncing sources, installing dependencies or importing modules
+    block for a long time, running them here keeps the event loop free to serve
+    requests. Each operation is labeled with a name used in metrics and can be given a
+    timeout.
+
+    Threads can't be interrupted: operations timing out or cancelled while waiting for
+    a thread never start, while running ones are left to complete in the background.
+    """
+
+    def __init__(self, max_workers: int) -> None:
+        """Creates a BlockingExecutor instance.
+
+        Args:
+            max_workers: The maximum number of operations running at the same time.
+        """
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="llama_deploy_io"
+        )
+
+    async def run(
+        self,
+        operation: str,
+        func: Callable[..., T],
+        *args: Any,
+        timeout: float | None = None,
+    ) -> T:
+        """Runs `func(*args)` in a thread and waits for its result.
+
+        Args:
+            operation: The name of the operation, used to label metrics.
+            func: The blocking function to run.
+            args: The arguments passed to `func`.
+            timeout: Maximum number of seconds to wait for the result, None means no limit.
+
+        Raises:
+            TimeoutError: If the operation didn't complete in time.
+        """
+        # Like asyncio.to_thread, run the function in the context of the caller
+        ctx = contextvars.copy_context()
+        submitted = time.perf_counter()
+
+        def call() -> T:
+            executor_queue_depth.labels(operation).dec()
+            executor_wait_time.labels(operation).observe(
+                time.perf_counter() - submitted
+            )
+            start = time.perf_counter()
+            try:
+                return ctx.run(func, *args)
+            finally:
+                executor_operation_duration.labels(operation).observe(
+                    time.perf_counter() - start
+                )
+
+        executor_queue_depth.labels(operation).inc()
+        future = self._executor.submit(call)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError:
+            executor_timeouts.labels(operation).inc()
+            msg = f"Operation {operation} timed out after {timeout} seconds"
+            raise TimeoutError(msg) from None
+        finally:
+            # Giving up cancels the operation if it didn't start yet
+            if future.cancelled():
+                executor_queue_depth.labels(operation).dec()
+
+    def shutdown(self) -> None:
+        """Drops the operations waiting for a thread and stops accepting new ones."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
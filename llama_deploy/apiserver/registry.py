@@ -0,0 +1,141 @@
+import logging
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Iterator, MutableMapping
+from typing import TypeVar
+
+from .stats import registry_evictions, registry_size
+
+logger = logging.getLogger(__name__)
+
+V = TypeVar("V")
+
+
+class BoundedRegistry(MutableMapping[str, V]):
+    """A dict-like container with a maximum size and an idle time-to-live.
+
+    Entries are kept in least-recently-used order: reading or writing a key marks it as
+    the most recently used. When the registry grows beyond `max_size`, the least recently
+    used entries are evicted first; entries left untouched for longer than `ttl` seconds
+    are evicted on the next write or on an explicit call to `expire()`.
+
+    Entries for which `is_active` returns True (e.g. a workflow handler still running) are
+    never evicted, so the registry can temporarily hold more than `max_size` items.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        deployment_name: str,
+        *,
+        max_size: int | None = None,
+        ttl: float | None = None,
+        is_active: Callable[[V], bool] | None = None,
+        on_evict: Callable[[str, V], None] | None = None,
+    ) -> None:
+        """Creates a BoundedRegistry instance.
+
+        Args:
+            name: The name of the registry, used to label metrics.
+            deployment_name: The name of the deployment owning the registry.
+            max_size: The maximum number of entries, None means unbounded.
+            ttl: Seconds an entry can stay idle before being evicted, None means forever.
+            is_active: Optional callable telling whether an entry must not be evicted.
+            on_evict: Optional callback invoked with key and value of evicted entries.
+        """
+        self._name = name
+        self._deployment_name = deployment_name
+        self._max_size = max_size
+        self._ttl = ttl
+        self._is_active = is_active
+        self._on_evict = on_evict
+        self._items: OrderedDict[str, V] = OrderedDict()
+        self._last_access: dict[str, float] = {}
+
+    def __getitem__(self, key: str) -> V:
+        value = self._items[key]
+        self.touch(key)
+        return value
+
+    def __setitem__(self, key: str, value: V) -> None:
+        self._items[key] = value
+        self.touch(key)
+        self._evict()
+
+    def __delitem__(self, key: str) -> None:
+        del self._items[key]
+        self._last_access.pop(key, None)
+        self._update_size()
+
+    def __contains__(self, key: object) -> bool:
+        # Don't refresh the entry on membership tests
+        return key in self._items
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._items))
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def peek(self, key: str) -> V | None:
+        """Returns the entry `key` if it exists, without marking it as used."""
+        return self._items.get(key)
+
+    def touch(self, key: str) -> None:
+        """Marks the entry `key` as the most recently used, if it exists."""
+        if key not in self._items:
+            return
+        self._items.move_to_end(key)
+        self._last_access[key] = time.monotonic()
+
+    def expire(self) -> int:
+        """Evicts the inactive entries that have been idle for longer than the ttl.
+
+        Returns:
+            The number of evicted entries.
+        """
+        if self._ttl is None:
+            return 0
+
+        deadline = time.monotonic() - self._ttl
+        expired = []
+        # Items are sorted by last access, the scan stops at the first recent one
+        for key in self._items:
+            if self._last_access[key] >= deadline:
+                break
+            if not self._active(key):
+                expired.append(key)
+        for key in expired:
+            self._remove(key, "expired")
+        return len(expired)
+
+    def _evict(self) -> None:
+        self.expire()
+        if self._max_size is not None:
+            overflow = len(self._items) - self._max_size
+            if overflow > 0:
+                # Items are sorted from the least to the most recently used
+                candidates = [k for k in self._items if not self._active(k)][:overflow]
+                for key in candidates:
+                    self._remove(key, "capacity")
+                if len(candidates) < overflow:
+                    logger.warning(
+                        f"Registry '{self._name}' of deployment '{self._deployment_name}' "
+                        f"holds {len(self._items)} active entries, above the limit of {self._max_size}"
+                    )
+        self._update_size()
+
+    def _active(self, key: str) -> bool:
+        if self._is_active is None:
+            return False
+        return self._is_active(self._items[key])
+
+    def _remove(self, key: str, reason: str) -> None:
+        value = self._items.pop(key)
+        self._last_access.pop(key, None)
+        registry_evictions.labels(self._deployment_name, self._name, reason).inc()
+        if self._on_evict is not None:
+            self._on_evict(key, value)
+
+    def _update_size(self) -> None:
+        registry_size.labels(self._deployment_name, self._name).set(len(self._items))
@@ -0,0 +1,219 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from enum import Enum
+from pathlib import Path
+from typing import Any
+
+from .stats import result_cache_lookups, result_cache_size
+
+logger = logging.getLogger(__name__)
+
+
+class CacheMode(str, Enum):
+    """How a task uses the result cache of its service.
+
+    With `use` the cached result is returned when there's one, `refresh` runs the task
+    and replaces the cached result, `bypass` runs the task leaving the cache untouched.
+    """
+
+    use = "use"
+    refresh = "refresh"
+    bypass = "bypass"
+
+    @classmethod
+    def from_cache_control(cls, cache_control: str | None) -> "CacheMode":
+        """Maps the directives of a `Cache-Control` request header to a cache mode.
+
+        `no-store` bypasses the cache, `no-cache` and `max-age=0` refresh it.
+        """
+        directives = {
+            directive.strip().lower().replace(" ", "")
+            for directive in (cache_control or "").split(",")
+        }
+        if "no-store" in directives:
+            return cls.bypass
+        if "no-cache" in directives or "max-age=0" in directives:
+            return cls.refresh
+        return cls.use
+
+
+class ResultCache:
+    """Caches the results of a service returning the same output for the same input.
+
+    Results are keyed by the name and configuration of the service and by the version
+    of its source, so that changing the service invalidates them, and by a canonical
+    hash of the task input. The most recently used results are kept in memory; when
+    `path` is set, results are also persisted in a SQLite database and survive
+    restarts. Results older than `ttl` seconds are ignored.
+
+    Lookups of persistent caches block on the database, they're safe to run from
+    several threads.
+    """
+
+    def __init__(
+        self,
+        deployment_name: str,
+        service_name: str,
+        version: str,
+        *,
+        max_size: int,
+        ttl: float | None = None,
+        path: Path | None = None,
+    ) -> None:
+        """Creates a ResultCache instance.
+
+        Args:
+            deployment_name: The name of the deployment, used to label metrics.
+            service_name: The name of the service whose results are cached.
+            version: Identifies the configuration of the service, part of the cache keys.
+            max_size: The maximum number of results kept in memory, the least recently used are dropped first.
+            ttl: Seconds a result is valid, None means forever.
+            path: Optional path to a SQLite database where results are persisted.
+        """
+        self._deployment_name = deployment_name
+        self._service_name = service_name
+        self._version = version
+        self._max_size = max_size
+        self._ttl = ttl
+        self._items: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._conn: sqlite3.Connection | None = None
+        if path is not None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            with self._conn:
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS result_cache ("
+                    "key TEXT PRIMARY KEY, "
+                    "stored_at REAL NOT NULL, "
+                    "data TEXT NOT NULL)"
+                )
+                self._conn.execute(
+                    "CREATE INDEX IF NOT EXISTS result_cache_stored_at "
+                    "ON result_cache (stored_at)"
+                )
+
+    @property
+    def persistent(self) -> bool:
+        """Whether results are persisted in a database."""
+        return self._conn is not None
+
+    def key(self, run_kwargs: dict[str, Any], source_version: str | None = None) -> str:
+        """Returns the cache key of a task run with `run_kwargs`.
+
+        Args:
+            run_kwargs: The input of the task.
+            source_version: The version of the source the service was loaded from.
+        """
+        canonical = json.dumps(
+            [
+                self._deployment_name,
+                self._service_name,
+                self._version,
+                source_version,
+                run_kwargs,
+            ],
+            sort_keys=True,
+            separators=(",", ":"),
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(canonical.encode()).hexdigest()
+
+    def get(self, key: str) -> tuple[bool, Any]:
+        """Looks up a result, nothing is found once the cache is closed.
+
+        Returns:
+            A tuple telling whether the result was found, and the result itself.
+        """
+        with self._lock:
+            found, result = self._get(key)
+        result_cache_lookups.labels(
+            self._deployment_name, self._service_name, "hit" if found else "miss"
+        ).inc()
+        return found, result
+
+    def put(self, key: str, result: Any) -> None:
+        """Caches a result, replacing any previous one for the same key.
+
+        Results are dropped once the cache is closed.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._put_memory(key, time.time(), result)
+            if self._conn is None:
+                return
+
+            try:
+                data = json.dumps(result)
+            except (TypeError, ValueError):
+                logger.debug(f"Result of service {self._service_name} not persisted")
+                return
+            with self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO result_cache VALUES (?, ?, ?)",
+                    (key, time.time(), data),
+                )
+                if self._ttl is not None:
+                    self._conn.execute(
+                        "DELETE FROM result_cache WHERE stored_at < ?",
+                        (self._deadline(),),
+                    )
+
+    def close(self) -> None:
+        """Releases the resources held by the cache."""
+        with self._lock:
+            self._closed = True
+            self._items.clear()
+            self._update_size()
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _get(self, key: str) -> tuple[bool, Any]:
+        if self._closed:
+            return False, None
+        item = self._items.get(key)
+        if item is not None:
+            stored_at, result = item
+            if stored_at >= self._deadline():
+                self._items.move_to_end(key)
+                return True, result
+            del self._items[key]
+            self._update_size()
+
+        if self._conn is None:
+            return False, None
+        row = self._conn.execute(
+            "SELECT stored_at, data FROM result_cache WHERE key = ? AND stored_at >= ?",
+            (key, self._deadline()),
+        ).fetchone()
+        if row is None:
+            return False, None
+        # Promote the result to the memory tier
+        result = json.loads(row[1])
+        self._put_memory(key, row[0], result)
+        return True, result
+
+    def _put_memory(self, key: str, stored_at: float, result: Any) -> None:
+        self._items[key] = (stored_at, result)
+        self._items.move_to_end(key)
+        while len(self._items) > self._max_size:
+            self._items.popitem(last=False)
+        self._update_size()
+
+    def _deadline(self) -> float:
+        if self._ttl is None:
+            return 0.0
+        return time.time() - self._ttl
+
+    def _update_size(self) -> None:
+        result_cache_size.labels(self._deployment_name, self._service_name).set(
+            len(self._items)
+        )
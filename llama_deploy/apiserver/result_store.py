@@ -0,0 +1,163 @@
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any
+
+from llama_deploy.types.core import TaskResult
+
+
+class ResultStore(ABC):
+    """Protocol to be implemented by classes storing the results of finished tasks."""
+
+    #: Whether the store performs I/O, its methods are then called off the event loop
+    blocking: bool = True
+
+    @abstractmethod
+    def get(self, task_id: str) -> TaskResult | None:  # pragma: no cover
+        """Returns the result of the task `task_id`, or None if it's not stored."""
+
+    @abstractmethod
+    def put(self, result: TaskResult) -> None:  # pragma: no cover
+        """Stores a task result, replacing any previous result for the same task."""
+
+    def close(self) -> None:
+        """Releases the resources held by the store."""
+
+
+class InMemoryResultStore(ResultStore):
+    """A ResultStore keeping the most recent results in memory."""
+
+    blocking = False
+
+    def __init__(self, max_size: int | None = None) -> None:
+        """Creates an InMemoryResultStore instance.
+
+        Args:
+            max_size: The maximum number of results kept, the oldest are dropped first.
+        """
+        self._max_size = max_size
+        self._results: OrderedDict[str, TaskResult] = OrderedDict()
+
+    def get(self, task_id: str) -> TaskResult | None:
+        return self._results.get(task_id)
+
+    def put(self, result: TaskResult) -> None:
+        self._results[result.task_id] = result
+        self._results.move_to_end(result.task_id)
+        if self._max_size is not None:
+            while len(self._results) > self._max_size:
+                self._results.popitem(last=False)
+
+
+class SqliteResultStore(ResultStore):
+    """A ResultStore persisting results in a SQLite database.
+
+    Multiple deployments can share the same database file, each one using a different
+    `namespace`.
+    """
+
+    def __init__(self, path: Path, namespace: str, max_size: int | None = None) -> None:
+        """Creates a SqliteResultStore instance.
+
+        Args:
+            path: The path to the database file, created if it doesn't exist.
+            namespace: The namespace results are stored into, usually the deployment name.
+            max_size: The maximum number of results kept in the namespace, the oldest are dropped first.
+        """
+        self._namespace = namespace
+        self._max_size = max_size
+        self._puts = 0
+        self._lock = threading.Lock()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS task_results ("
+                "namespace TEXT NOT NULL, "
+                "task_id TEXT NOT NULL, "
+                "created_at REAL NOT NULL, "
+                "data TEXT NOT NULL, "
+                "PRIMARY KEY (namespace, task_id))"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS task_results_created_at "
+                "ON task_results (namespace, created_at)"
+            )
+
+    def get(self, task_id: str) -> TaskResult | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM task_results WHERE namespace = ? AND task_id = ?",
+                (self._namespace, task_id),
+            ).fetchone()
+        if row is None:
+            return None
+        return TaskResult.model_validate_json(row[0])
+
+    def put(self, result: TaskResult) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO task_results VALUES (?, ?, ?, ?)",
+                (
+                    self._namespace,
+                    result.task_id,
+                    time.time(),
+                    result.model_dump_json(),
+                ),
+            )
+            self._puts += 1
+            # Pruning scans the namespace, amortize it over several writes
+            if (
+                self._max_size is not None
+                and self._puts % max(1, self._max_size // 10) == 0
+            ):
+                self._conn.execute(
+                    "DELETE FROM task_results WHERE namespace = ? AND task_id NOT IN ("
+                    "SELECT task_id FROM task_results WHERE namespace = ? "
+                    "ORDER BY created_at DESC LIMIT ?)",
+                    (self._namespace, self._namespace, self._max_size),
+                )
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class RedisResultStore(ResultStore):
+    """A ResultStore keeping results in Redis, shared by all the API Server replicas.
+
+    Multiple deployments can share the same Redis database, each one using a different
+    `namespace`.
+    """
+
+    def __init__(self, client: Any, namespace: str, ttl: float | None = None) -> None:
+        """Creates a RedisResultStore instance.
+
+        Args:
+            client: A `redis.Redis` client.
+            namespace: The namespace results are stored into, usually the deployment name.
+            ttl: Seconds a result is kept, None means forever.
+        """
+        self._client = client
+        self._namespace = namespace
+        self._ttl = ttl
+
+    def get(self, task_id: str) -> TaskResult | None:
+        data = self._client.get(self._key(task_id))
+        if data is None:
+            return None
+        return TaskResult.model_validate_json(data)
+
+    def put(self, result: TaskResult) -> None:
+        self._client.set(
+            self._key(result.task_id),
+            result.model_dump_json(),
+            # Milliseconds, so that ttls below one second don't disable the expiry
+            px=max(1, int(self._ttl * 1000)) if self._ttl is not None else None,
+        )
+
+    def _key(self, task_id: str) -> str:
+        return f"llama_deploy:{self._namespace}:results:{task_id}"
@@ -1,7 +1,17 @@
 import asyncio
 import json
 import logging
-from typing import Annotated, AsyncGenerator, List, Optional
+import math
+import time
+from typing import (
+    Annotated,
+    Any,
+    AsyncGenerator,
+    AsyncIterator,
+    List,
+    Optional,
+    TypeVar,
+)
 
 import httpx
 import websockets
@@ -9,32 +19,46 @@ from fastapi import (
     APIRouter,
     Depends,
     File,
+    Header,
     HTTPException,
+    Query,
     Request,
     UploadFile,
     WebSocket,
 )
 from fastapi.responses import JSONResponse, StreamingResponse
 from starlette.background import BackgroundTask
-from workflows import Context
 from workflows.context import JsonSerializer
-from workflows.handler import WorkflowHandler
+from workflows.events import Event
 
-from llama_deploy.apiserver.deployment import Deployment
+from llama_deploy.apiserver.admission import AdmissionRejected
+from llama_deploy.apiserver.deployment import (
+    Deployment,
+    DeploymentError,
+    SessionOwnedError,
+)
 from llama_deploy.apiserver.deployment_config_parser import DeploymentConfig
+from llama_deploy.apiserver.result_cache import CacheMode
 from llama_deploy.apiserver.server import manager
+from llama_deploy.apiserver.settings import settings
+from llama_deploy.apiserver.stats import ui_proxy_request_duration
 from llama_deploy.types import (
     DeploymentDefinition,
     EventDefinition,
     SessionDefinition,
     TaskDefinition,
 )
-from llama_deploy.types.core import TaskResult, generate_id
+from llama_deploy.types.core import TaskResult
 
 deployments_router = APIRouter(
     prefix="/deployments",
 )
 logger = logging.getLogger(__name__)
+# Seconds between checks of the client connection while running a task
+_DISCONNECT_POLL_INTERVAL = 1.0
+# Seconds clients are asked to wait before retrying a deployment still starting
+_NOT_READY_RETRY_AFTER = 5
+_T = TypeVar("_T")
 
 
 def deployment(deployment_name: str) -> Deployment:
@@ -42,6 +66,12 @@ def deployment(deployment_name: str) -> Deployment:
     deployment = manager.get_deployment(deployment_name)
     if deployment is None:
         raise HTTPException(status_code=404, detail="Deployment not found")
+    if not deployment.ready:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Deployment {deployment_name} is still starting",
+            headers={"Retry-After": str(_NOT_READY_RETRY_AFTER)},
+        )
     return deployment
 
 
@@ -74,31 +104,75 @@ async def create_deployment(
     return DeploymentDefinition(name=config.name)
 
 
+@deployments_router.post("/{deployment_name}/warmup")
+async def warmup_deployment(
+    deployment: Annotated[Deployment, Depends(deployment)],
+    service_id: str | None = None,
+) -> DeploymentDefinition:
+    """Loads the services of a deployment, or only `service_id`, ahead of their first request."""
+    if service_id is not None and service_id not in deployment.service_names:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Service '{service_id}' not found in deployment '{deployment.name}'",
+        )
+
+    try:
+        await deployment.warmup([service_id] if service_id else None)
+    except Exception as e:
+        raise HTTPException(
+            status_code=500, detail=f"Unable to load services: {e}"
+        ) from e
+
+    return DeploymentDefinition(name=deployment.name)
+
+
 @deployments_router.post("/{deployment_name}/tasks/run")
 async def create_deployment_task(
+    request: Request,
     deployment: Annotated[Deployment, Depends(deployment)],
     task_definition: TaskDefinition,
     session_id: str | None = None,
+    cache_control: Annotated[str | None, Header()] = None,
 ) -> JSONResponse:
-    """Create a task for the deployment, wait for result and delete associated session."""
+    """Create a task for the deployment, wait for result and delete associated session.
 
-    service_id = task_definition.service_id or deployment.default_service
-    if service_id is None:
-        raise HTTPException(
-            status_code=400,
-            detail="Service is None and deployment has no default service",
-        )
-
-    if service_id not in deployment.service_names:
-        raise HTTPException(
-            status_code=404,
-            detail=f"Service '{task_definition.service_id}' not found in deployment 'deployment_name'",
-        )
+    The task is cancelled when it exceeds its `timeout`, or when the client disconnects
+    before the result is sent.
 
+    Services with a result cache return the cached result of a previous task with the
+    same input. The `Cache-Control: no-cache` request header forces the task to run and
+    refreshes the cached result, `Cache-Control: no-store` bypasses the cache.
+    """
+    service_id = _get_service_id(deployment, task_definition)
     run_kwargs = json.loads(task_definition.input) if task_definition.input else {}
-    result = await deployment.run_workflow(
-        service_id=service_id, session_id=session_id, **run_kwargs
+    run = asyncio.create_task(
+        deployment.run_workflow(
+            service_id=service_id,
+            session_id=session_id,
+            task_timeout=task_definition.timeout,
+            priority=task_definition.priority,
+            tenant_id=task_definition.tenant_id,
+            cache_mode=CacheMode.from_cache_control(cache_control),
+            **run_kwargs,
+        )
     )
+    try:
+        while not run.done():
+            await asyncio.wait({run}, timeout=_DISCONNECT_POLL_INTERVAL)
+            if not run.done() and await request.is_disconnected():
+                run.cancel()
+                await asyncio.wait({run})
+                # Nobody is left to read the response
+                return JSONResponse(None, status_code=499)
+        result = run.result()
+    except AdmissionRejected as e:
+        raise _too_many_requests(e)
+    except SessionOwnedError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except TimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    finally:
+        run.cancel()
     return JSONResponse(result)
 
 
@@ -108,7 +182,118 @@ async def create_deployment_task_nowait(
     task_definition: TaskDefinition,
     session_id: str | None = None,
 ) -> TaskDefinition:
-    """Create a task for the deployment but don't wait for result."""
+    """Create a task for the deployment but don't wait for result.
+
+    When the service is at capacity the task waits in the service queue, its result has
+    status `pending` until it starts.
+    """
+    service_id = _get_service_id(deployment, task_definition)
+    run_kwargs = json.loads(task_definition.input) if task_definition.input else {}
+    try:
+        handler_id, session_id = await deployment.run_workflow_no_wait(
+            service_id=service_id,
+            session_id=session_id,
+            task_timeout=task_definition.timeout,
+            priority=task_definition.priority,
+            tenant_id=task_definition.tenant_id,
+            **run_kwargs,
+        )
+    except AdmissionRejected as e:
+        raise _too_many_requests(e)
+    except SessionOwnedError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    task_definition.session_id = session_id
+    task_definition.task_id = handler_id
+
+    return task_definition
+
+
+@deployments_router.post("/{deployment_name}/tasks/batch")
+async def create_deployment_tasks_batch(
+    deployment: Annotated[Deployment, Depends(deployment)],
+    task_definitions: list[TaskDefinition],
+) -> list[TaskDefinition]:
+    """Create multiple tasks for the deployment in one request, without waiting for results.
+
+    Tasks are started in the order they're listed, each one in the session set in its
+    `session_id` field or in a new session. Returns the task definitions with their
+    task and session ids assigned.
+
+    The batch is validated as a whole, an invalid service or input fails the request
+    before any task starts. A batch can still be started partially: if a service
+    rejects a task the request fails with status 429, on any other error with status
+    500. The tasks already started keep running and are listed in the `started` field
+    of the error detail.
+    """
+    if len(task_definitions) > settings.max_batch_size:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Batch too large, max {settings.max_batch_size} tasks per request",
+        )
+
+    # Validate the whole batch before starting any task
+    service_ids = [_get_service_id(deployment, td) for td in task_definitions]
+    inputs = [_get_run_kwargs(i, td) for i, td in enumerate(task_definitions)]
+    for i, (service_id, run_kwargs, task_definition) in enumerate(
+        zip(service_ids, inputs, task_definitions)
+    ):
+        try:
+            handler_id, session_id = await deployment.run_workflow_no_wait(
+                service_id=service_id,
+                session_id=task_definition.session_id,
+                task_timeout=task_definition.timeout,
+                priority=task_definition.priority,
+                tenant_id=task_definition.tenant_id,
+                **run_kwargs,
+            )
+        except AdmissionRejected as e:
+            started = [td.model_dump() for td in task_definitions[:i]]
+            raise _too_many_requests(e, started=started)
+        except SessionOwnedError as e:
+            started = [td.model_dump() for td in task_definitions[:i]]
+            raise HTTPException(
+                status_code=409, detail={"message": str(e), "started": started}
+            ) from e
+        except Exception as e:
+            started = [td.model_dump() for td in task_definitions[:i]]
+            raise HTTPException(
+                status_code=500, detail={"message": str(e), "started": started}
+            ) from e
+        task_definition.session_id = session_id
+        task_definition.task_id = handler_id
+
+    return task_definitions
+
+
+def _too_many_requests(e: AdmissionRejected, **extra: Any) -> HTTPException:
+    """Returns the error sent when a service rejects a task."""
+    return HTTPException(
+        status_code=429,
+        detail={"message": str(e), **extra} if extra else str(e),
+        headers={"Retry-After": str(math.ceil(e.retry_after))},
+    )
+
+
+def _get_run_kwargs(index: int, task_definition: TaskDefinition) -> dict[str, Any]:
+    """Returns the input of the task at `index` of a batch."""
+    if not task_definition.input:
+        return {}
+    try:
+        run_kwargs = json.loads(task_definition.input)
+    except json.JSONDecodeError as e:
+        raise HTTPException(
+            status_code=400, detail=f"Input of task {index} is not valid JSON: {e}"
+        )
+    if not isinstance(run_kwargs, dict):
+        raise HTTPException(
+            status_code=400, detail=f"Input of task {index} is not a JSON object"
+        )
+    return run_kwargs
+
+
+def _get_service_id(deployment: Deployment, task_definition: TaskDefinition) -> str:
+    """Returns the id of the service that should run the task."""
     service_id = task_definition.service_id or deployment.default_service
     if service_id is None:
         raise HTTPException(
@@ -122,15 +307,7 @@ async def create_deployment_task_nowait(
             detail=f"Service '{task_definition.service_id}' not found in deployment 'deployment_name'",
         )
 
-    run_kwargs = json.loads(task_definition.input) if task_definition.input else {}
-    handler_id, session_id = deployment.run_workflow_no_wait(
-        service_id=service_id, session_id=session_id, **run_kwargs
-    )
-
-    task_definition.session_id = session_id
-    task_definition.task_id = handler_id
-
-    return task_definition
+    return service_id
 
 
 @deployments_router.post("/{deployment_name}/tasks/{task_id}/events")
@@ -141,7 +318,7 @@ async def send_event(
     event_def: EventDefinition,
 ) -> EventDefinition:
     """Send a human response event to a service for a specific task and session."""
-    ctx = deployment._contexts[session_id]
+    ctx = await deployment.get_session(session_id, event_def.service_id)
     serializer = JsonSerializer()
     event = serializer.deserialize(event_def.event_obj_str)
     ctx.send_event(event)
@@ -149,49 +326,161 @@ async def send_event(
     return event_def
 
 
+@deployments_router.post("/{deployment_name}/tasks/{task_id}/cancel")
+async def cancel_task(
+    deployment: Annotated[Deployment, Depends(deployment)],
+    session_id: str,
+    task_id: str,
+) -> TaskResult:
+    """Cancel a running task, and return its result.
+
+    Tasks already finished are left untouched.
+    """
+    try:
+        return await deployment.cancel_task(task_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Task not found")
+
+
 @deployments_router.get("/{deployment_name}/tasks/{task_id}/events")
 async def get_events(
+    request: Request,
     deployment: Annotated[Deployment, Depends(deployment)],
     session_id: str,
     task_id: str,
     raw_event: bool = False,
+    offset: int = 0,
+    max_events: int = 1,
+    max_delay: float | None = None,
+    last_event_id: Annotated[int | None, Header()] = None,
 ) -> StreamingResponse:
     """
     Get the stream of events from a given task and session.
 
+    Any number of clients can watch the same task, each one receiving the same
+    stream. Events are streamed as NDJSON by default, or as Server-Sent Events
+    when the request has the header `Accept: text/event-stream`. With SSE, each
+    event carries its offset as id so clients can resume the stream through the
+    `Last-Event-ID` header.
+
     Args:
         raw_event (bool, default=False): Whether to return the raw event object
             or just the event data.
+        offset (int, default=0): The offset of the first event to stream, recent
+            events are replayed to clients attaching late.
+        max_events (int, default=1): Maximum number of events sent in a single
+            chunk. Events already available are always flushed immediately.
+        max_delay (float, default=None): Seconds to wait for a chunk to fill up
+            to `max_events` before flushing it.
     """
+    sse = "text/event-stream" in request.headers.get("accept", "")
+    serializer = JsonSerializer()
+
+    def format_event(event_id: int, event: Event) -> str:
+        data = json.loads(serializer.serialize(event))
+        payload = json.dumps(data if raw_event else data.get("value"))
+        if sse:
+            return f"id: {event_id}\ndata: {payload}\n\n"
+        return payload + "\n"
 
-    async def event_stream(handler: WorkflowHandler) -> AsyncGenerator[str, None]:
-        serializer = JsonSerializer()
-        # need to convert back to str to use SSE
-        async for event in handler.stream_events():
-            data = json.loads(serializer.serialize(event))
-            if raw_event:
-                yield json.dumps(data) + "\n"
-            else:
-                yield json.dumps(data.get("value")) + "\n"
-            await asyncio.sleep(0.01)
-        await handler
+    async def event_stream(
+        events: AsyncGenerator[tuple[int, Event], None],
+    ) -> AsyncGenerator[str, None]:
+        # Each yield is awaited by the socket write, no need to throttle here
+        async for batch in _batched(events, max_events, max_delay):
+            yield "".join(format_event(event_id, ev) for event_id, ev in batch)
+
+    if last_event_id is not None:
+        offset = last_event_id + 1
+
+    try:
+        events = deployment.subscribe_events(task_id, offset)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Task not found")
 
     return StreamingResponse(
-        event_stream(deployment._handlers[task_id]),
-        media_type="application/x-ndjson",
+        event_stream(events),
+        media_type="text/event-stream" if sse else "application/x-ndjson",
     )
 
 
+async def _batched(
+    items: AsyncIterator[_T], max_items: int, max_delay: float | None
+) -> AsyncGenerator[list[_T], None]:
+    """Groups the elements of `items` in lists of at most `max_items` elements.
+
+    Elements already available are grouped without waiting, `max_delay` is the time
+    to wait for more elements before returning an incomplete group.
+    """
+    if max_items <= 1:
+        async for element in items:
+            yield [element]
+        return
+
+    # A bounded queue keeps the backpressure of the consumer on the producer
+    queue: asyncio.Queue[Any] = asyncio.Queue(maxsize=max_items)
+    end = object()
+    errors: list[BaseException] = []
+
+    async def pump() -> None:
+        try:
+            async for item in items:
+                await queue.put(item)
+        except Exception as e:
+            errors.append(e)
+        await queue.put(end)
+
+    loop = asyncio.get_running_loop()
+    pump_task = asyncio.create_task(pump())
+    try:
+        finished = False
+        while not finished:
+            item = await queue.get()
+            if item is end:
+                break
+
+            batch = [item]
+            deadline = loop.time() + (max_delay or 0)
+            while len(batch) < max_items:
+                try:
+                    if max_delay:
+                        item = await asyncio.wait_for(
+                            queue.get(), max(deadline - loop.time(), 0)
+                        )
+                    else:
+                        item = queue.get_nowait()
+                except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                    break
+                if item is end:
+                    finished = True
+                    break
+                batch.append(item)
+
+            yield batch
+
+        if errors:
+            raise errors[0]
+    finally:
+        pump_task.cancel()
+
+
 @deployments_router.get("/{deployment_name}/tasks/{task_id}/results")
 async def get_task_result(
     deployment: Annotated[Deployment, Depends(deployment)],
     session_id: str,
     task_id: str,
+    wait: Annotated[float, Query(ge=0, le=300)] = 0,
 ) -> TaskResult | None:
-    """Get the task result associated with a task and session."""
+    """Get the task result associated with a task and session.
 
-    handler = deployment._handlers[task_id]
-    return TaskResult(task_id=task_id, history=[], result=await handler)
+    The response is sent immediately, with the status of the task and its result
+    once done. Use `wait` to long-poll: the request is held up to `wait` seconds
+    for the task to finish.
+    """
+    try:
+        return await deployment.get_task_result(task_id, wait)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Task not found")
 
 
 @deployments_router.get("/{deployment_name}/tasks")
@@ -201,10 +490,9 @@ async def get_tasks(
     """Get all the tasks from all the sessions in a given deployment."""
 
     tasks: list[TaskDefinition] = []
-    for task_id in deployment._handlers.keys():
-        tasks.append(
-            TaskDefinition(task_id=task_id, input=deployment._handler_inputs[task_id])
-        )
+    # Pending tasks included
+    for task_id, task_input in deployment._handler_inputs.items():
+        tasks.append(TaskDefinition(task_id=task_id, input=task_input))
 
     return tasks
 
@@ -233,9 +521,7 @@ async def create_session(
 ) -> SessionDefinition:
     """Create a new session for a deployment."""
 
-    workflow = deployment._workflow_services[deployment.default_service]
-    session_id = generate_id()
-    deployment._contexts[session_id] = Context(workflow)
+    session_id = await deployment.create_session()
 
     return SessionDefinition(session_id=session_id)
 
@@ -246,7 +532,7 @@ async def delete_session(
 ) -> None:
     """Get the active sessions in a deployment and service."""
 
-    deployment._contexts.pop(session_id)
+    await deployment.delete_session(session_id)
 
 
 async def _ws_proxy(ws: WebSocket, upstream_url: str) -> None:
@@ -335,14 +621,20 @@ async def websocket_proxy(
     slash_path = f"/{path}" if path else ""
     upstream_path = f"/deployments/{deployment.name}/ui{slash_path}"
 
+    try:
+        ui_port = await deployment.wake_ui_server()
+    except DeploymentError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
     # Convert to WebSocket URL
-    upstream_url = f"ws://localhost:{deployment._config.ui.port}{upstream_path}"
+    upstream_url = f"ws://localhost:{ui_port}{upstream_path}"
     if websocket.url.query:
         upstream_url += f"?{websocket.url.query}"
 
     logger.debug(f"Proxying WebSocket {websocket.url} -> {upstream_url}")
 
-    await _ws_proxy(websocket, upstream_url)
+    with deployment.ui_connection():
+        await _ws_proxy(websocket, upstream_url)
 
 
 @deployments_router.api_route(
@@ -365,9 +657,15 @@ async def proxy(
     slash_path = f"/{path}" if path else ""
     upstream_path = f"/deployments/{deployment.name}/ui{slash_path}"
 
-    upstream_url = httpx.URL(
-        f"http://localhost:{deployment._config.ui.port}{upstream_path}"
-    ).copy_with(params=request.query_params)
+    # Hold the request until a stopped UI server is started again
+    try:
+        ui_port = await deployment.wake_ui_server()
+    except DeploymentError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+    upstream_url = httpx.URL(f"http://localhost:{ui_port}{upstream_path}").copy_with(
+        params=request.query_params
+    )
 
     # Debug logging
     logger.debug(f"Proxying {request.method} {request.url} -> {upstream_url}")
@@ -387,7 +685,8 @@ async def proxy(
     headers = {k: v for k, v in request.headers.items() if k.lower() not in hop_by_hop}
 
     try:
-        client = httpx.AsyncClient(timeout=None)
+        client = deployment.ui_client
+        start = time.perf_counter()
 
         req = client.build_request(
             request.method,
@@ -401,10 +700,12 @@ async def proxy(
             k: v for k, v in upstream.headers.items() if k.lower() not in hop_by_hop
         }
 
-        # Close client when upstream response is done
+        # Release the pooled connection when upstream response is done
         async def cleanup() -> None:
             await upstream.aclose()
-            await client.aclose()
+            ui_proxy_request_duration.labels(
+                deployment.name, request.method, upstream.status_code
+            ).observe(time.perf_counter() - start)
 
         return StreamingResponse(
             upstream.aiter_raw(),  # stream downloads
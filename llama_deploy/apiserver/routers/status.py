@@ -5,7 +5,12 @@ from fastapi.responses import PlainTextResponse
 
 from llama_deploy.apiserver.server import manager
 from llama_deploy.apiserver.settings import settings
-from llama_deploy.types.apiserver import Status, StatusEnum
+from llama_deploy.types.apiserver import (
+    DeploymentStatusEnum,
+    Readiness,
+    Status,
+    StatusEnum,
+)
 
 status_router = APIRouter(
     prefix="/status",
@@ -22,6 +27,31 @@ async def status() -> Status:
     )
 
 
+@status_router.get("/ready")
+async def ready(deployment_name: str | None = None) -> Readiness:
+    """Reports which deployments finished starting and accept requests.
+
+    The API Server serves requests while deployments are still starting, so readiness
+    is reported per deployment. When `deployment_name` is set, the response status is
+    503 until that deployment is ready, so it can be used as a readiness probe.
+    """
+    statuses = manager.deployment_statuses()
+    if deployment_name is None:
+        return Readiness(
+            ready=all(s == DeploymentStatusEnum.READY for s in statuses.values()),
+            deployments=statuses,
+        )
+
+    if deployment_name not in statuses:
+        raise HTTPException(status_code=404, detail="Deployment not found")
+    status = statuses[deployment_name]
+    if status != DeploymentStatusEnum.READY:
+        raise HTTPException(
+            status_code=503, detail=f"Deployment {deployment_name}: {status.value}"
+        )
+    return Readiness(ready=True, deployments={deployment_name: status})
+
+
 @status_router.get("/metrics")
 async def metrics() -> PlainTextResponse:
     """Proxies the Prometheus metrics endpoint through the API Server.
@@ -0,0 +1,434 @@
+import asyncio
+import bisect
+import hashlib
+import json
+import logging
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, AsyncGenerator, Iterable
+
+import httpx
+from fastapi import FastAPI, HTTPException, Request, Response, WebSocket
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
+
+from llama_deploy.types.core import generate_id
+
+from .routers.deployments import _ws_proxy
+from .settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Headers that only make sense for a single connection and must not be forwarded
+_HOP_BY_HOP = {
+    "connection",
+    "keep-alive",
+    "proxy-authenticate",
+    "proxy-authorization",
+    "te",  # codespell:ignore
+    "trailers",
+    "transfer-encoding",
+    "upgrade",
+    "host",
+}
+
+
+class HashRing:
+    """A consistent hash ring mapping keys to replicas.
+
+    Each replica is placed at `virtual_nodes` points of the ring and owns the keys
+    hashing right before them. When a replica joins or leaves, only the keys of the
+    segments it gains or loses move, about 1/N of them with N replicas.
+    """
+
+    def __init__(self, replicas: Iterable[str] = (), virtual_nodes: int = 100) -> None:
+        """Creates a HashRing instance.
+
+        Args:
+            replicas: The replicas initially in the ring.
+            virtual_nodes: The number of points of each replica, more points spread keys more evenly.
+        """
+        self._virtual_nodes = virtual_nodes
+        self._replicas: set[str] = set()
+        self._points: list[int] = []
+        self._owners: dict[int, str] = {}
+        for replica in replicas:
+            self.add(replica)
+
+    @property
+    def replicas(self) -> list[str]:
+        """The replicas in the ring."""
+        return sorted(self._replicas)
+
+    def __contains__(self, replica: object) -> bool:
+        return replica in self._replicas
+
+    def add(self, replica: str) -> None:
+        """Adds a replica to the ring, if not already there."""
+        if replica in self:
+            return
+        self._replicas.add(replica)
+        for i in range(self._virtual_nodes):
+            point = self._hash(f"{replica}#{i}")
+            # Collisions are unlikely with 64 bits points, keep the first owner
+            if point not in self._owners:
+                self._owners[point] = replica
+                bisect.insort(self._points, point)
+
+    def remove(self, replica: str) -> None:
+        """Removes a replica from the ring, if there."""
+        if replica not in self:
+            return
+        self._replicas.discard(replica)
+        points = {p for p, owner in self._owners.items() if owner == replica}
+        for point in points:
+            del self._owners[point]
+        self._points = [p for p in self._points if p not in points]
+
+    def owner(self, key: str) -> str:
+        """Returns the replica owning `key`.
+
+        Raises:
+            LookupError: If the ring is empty.
+        """
+        if not self._points:
+            raise LookupError("No replica available")
+        index = bisect.bisect(self._points, self._hash(key)) % len(self._points)
+        return self._owners[self._points[index]]
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        digest = hashlib.blake2b(value.encode(), digest_size=8).digest()
+        return int.from_bytes(digest, "big")
+
+
+class RoutingFront:
+    """Routes the requests to the deployments of a set of API Server replicas.
+
+    Requests referencing a session go to the replica owning the session on the hash
+    ring, so that workflows run where the session context lives. Sessions created by a
+    replica other than their ring owner, because the replica generated the session id
+    after the request was routed, are pinned to it. Replicas failing their health check
+    leave the ring until they recover, moving only their own sessions.
+    """
+
+    def __init__(
+        self,
+        replicas: list[str],
+        *,
+        health_interval: float | None = None,
+        max_pinned_sessions: int | None = None,
+    ) -> None:
+        """Creates a RoutingFront instance.
+
+        Args:
+            replicas: The base URLs of the API Server replicas.
+            health_interval: Seconds between health checks of the replicas, None disables them.
+            max_pinned_sessions: Maximum number of pinned sessions, least recently used are dropped first.
+        """
+        self._members = {r.rstrip("/") for r in replicas}
+        self._ring = HashRing(self._members)
+        self._health_interval = health_interval
+        self._max_pinned_sessions = max_pinned_sessions
+        self._pins: OrderedDict[str, str] = OrderedDict()
+        # Streams and long polls can stay open for a long time
+        self._client = httpx.AsyncClient(
+            timeout=httpx.Timeout(None, connect=settings.ui_proxy_connect_timeout)
+        )
+
+    @property
+    def replicas(self) -> list[str]:
+        """The healthy replicas requests are routed to."""
+        return self._ring.replicas
+
+    def add_replica(self, replica: str) -> None:
+        """Adds a replica, taking over its share of the sessions."""
+        replica = replica.rstrip("/")
+        self._members.add(replica)
+        self._ring.add(replica)
+
+    def remove_replica(self, replica: str) -> None:
+        """Removes a replica, its sessions move to the other replicas."""
+        replica = replica.rstrip("/")
+        self._members.discard(replica)
+        self._ring.remove(replica)
+
+    def session_owner(self, deployment_name: str, session_id: str) -> str:
+        """Returns the replica serving a session."""
+        key = f"{deployment_name}/{session_id}"
+        pinned = self._pins.get(key)
+        if pinned is not None:
+            if pinned in self._ring:
+                self._pins.move_to_end(key)
+                return pinned
+            # The replica left, the ring owner restores the session from the shared state
+            del self._pins[key]
+        return self._ring.owner(key)
+
+    def deployment_owner(self, deployment_name: str) -> str:
+        """Returns the replica serving the requests of a deployment bound to no session."""
+        return self._ring.owner(deployment_name)
+
+    def pick_replica(self, deployment_name: str) -> str:
+        """Returns a replica for a request creating new sessions, spreading the load."""
+        return self._ring.owner(f"{deployment_name}/{generate_id()}")
+
+    def pin(self, deployment_name: str, session_id: str, replica: str) -> None:
+        """Routes a session to `replica` instead of its ring owner."""
+        key = f"{deployment_name}/{session_id}"
+        if self._ring.owner(key) == replica:
+            return
+        self._pins[key] = replica
+        self._pins.move_to_end(key)
+        if self._max_pinned_sessions is not None:
+            while len(self._pins) > self._max_pinned_sessions:
+                self._pins.popitem(last=False)
+
+    async def forward(
+        self,
+        request: Request,
+        replica: str,
+        content: bytes | None = None,
+        pin: str | None = None,
+    ) -> Response:
+        """Forwards a request to a replica and streams back its response.
+
+        Args:
+            request: The request to forward.
+            replica: The replica to forward the request to.
+            content: The body of the request if already read, otherwise it's streamed.
+            pin: The deployment name to pin the sessions found in the response to, if any.
+        """
+        upstream = await self._send(request, replica, content)
+        headers = {
+            k: v for k, v in upstream.headers.items() if k.lower() not in _HOP_BY_HOP
+        }
+        if pin is None:
+            return StreamingResponse(
+                upstream.aiter_raw(),
+                status_code=upstream.status_code,
+                headers=headers,
+                background=BackgroundTask(upstream.aclose),
+            )
+
+        # Responses creating sessions are small, read them to find the session ids
+        try:
+            await upstream.aread()
+        finally:
+            await upstream.aclose()
+        if upstream.is_success:
+            for session_id in _session_ids(upstream.content):
+                self.pin(pin, session_id, replica)
+        headers.pop("content-encoding", None)
+        headers.pop("content-length", None)
+        return Response(
+            upstream.content, status_code=upstream.status_code, headers=headers
+        )
+
+    async def broadcast(self, request: Request) -> Response:
+        """Forwards a request to all the replicas, returning the first failure if any."""
+        content = await request.body()
+        responses = await asyncio.gather(
+            *(self._send(request, r, content, read=True) for r in self.replicas),
+            return_exceptions=True,
+        )
+        result: httpx.Response | None = None
+        for response in responses:
+            if isinstance(response, BaseException):
+                raise response
+            if result is None or (result.is_success and not response.is_success):
+                result = response
+        if result is None:
+            raise HTTPException(status_code=503, detail="No replica available")
+        return _to_response(result)
+
+    async def gather(self, request: Request) -> Response:
+        """Forwards a request to all the replicas, merging the lists they return."""
+        responses = await asyncio.gather(
+            *(self._send(request, r, b"", read=True) for r in self.replicas)
+        )
+        merged: list[Any] = []
+        for response in responses:
+            if not response.is_success:
+                return _to_response(response)
+            merged.extend(response.json())
+        return JSONResponse(merged)
+
+    async def check_health(self) -> None:
+        """Updates the ring with the replicas answering their status endpoint."""
+
+        async def healthy(replica: str) -> bool:
+            try:
+                response = await self._client.get(
+                    f"{replica}/status/", timeout=settings.ui_proxy_connect_timeout
+                )
+            except httpx.HTTPError:
+                return False
+            return response.is_success
+
+        members = sorted(self._members)
+        results = await asyncio.gather(*(healthy(r) for r in members))
+        for replica, ok in zip(members, results):
+            if ok and replica not in self._ring:
+                logger.info(f"Replica {replica} joined the ring")
+                self._ring.add(replica)
+            elif not ok and replica in self._ring:
+                logger.warning(f"Replica {replica} left the ring, health check failed")
+                self._ring.remove(replica)
+
+    async def run_health_checks(self) -> None:
+        """Checks the health of the replicas until cancelled."""
+        if self._health_interval is None:
+            return
+        while True:
+            await self.check_health()
+            await asyncio.sleep(self._health_interval)
+
+    async def aclose(self) -> None:
+        """Closes the connections to the replicas."""
+        await self._client.aclose()
+
+    async def _send(
+        self,
+        request: Request,
+        replica: str,
+        content: bytes | None,
+        read: bool = False,
+    ) -> httpx.Response:
+        url = httpx.URL(f"{replica}{request.url.path}").copy_with(
+            params=request.query_params
+        )
+        headers = {
+            k: v for k, v in request.headers.items() if k.lower() not in _HOP_BY_HOP
+        }
+        req = self._client.build_request(
+            request.method,
+            url,
+            headers=headers,
+            content=request.stream() if content is None else content,
+        )
+        try:
+            return await self._client.send(req, stream=not read)
+        except httpx.TransportError as e:
+            # Take the replica out of the ring until its health check passes again
+            logger.warning(f"Replica {replica} unavailable: {e}")
+            self._ring.remove(replica)
+            raise HTTPException(status_code=502, detail="Replica unavailable")
+
+
+def _session_ids(content: bytes) -> list[str]:
+    """Returns the session ids found in a JSON object or list of objects."""
+    try:
+        data = json.loads(content)
+    except ValueError:
+        return []
+    items = data if isinstance(data, list) else [data]
+    return [
+        item["session_id"]
+        for item in items
+        if isinstance(item, dict) and isinstance(item.get("session_id"), str)
+    ]
+
+
+def _to_response(response: httpx.Response) -> Response:
+    headers = {
+        k: v
+        for k, v in response.headers.items()
+        if k.lower() not in _HOP_BY_HOP | {"content-encoding", "content-length"}
+    }
+    return Response(response.content, status_code=response.status_code, headers=headers)
+
+
+def create_routing_app(front: RoutingFront) -> FastAPI:
+    """Creates the app routing the deployments API to the replicas behind `front`."""
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI) -> AsyncGenerator[None, Any]:
+        health_checks = asyncio.create_task(front.run_health_checks())
+        yield
+        health_checks.cancel()
+        await front.aclose()
+
+    app = FastAPI(lifespan=lifespan)
+
+    @app.get("/router/replicas")
+    async def get_replicas() -> list[str]:
+        """Get the replicas requests are currently routed to."""
+        return front.replicas
+
+    @app.post("/router/replicas/add")
+    async def add_replica(url: str) -> list[str]:
+        """Add a replica to the ring."""
+        front.add_replica(url)
+        return front.replicas
+
+    @app.post("/router/replicas/remove")
+    async def remove_replica(url: str) -> list[str]:
+        """Remove a replica from the ring."""
+        front.remove_replica(url)
+        return front.replicas
+
+    @app.websocket("/deployments/{deployment_name}/ui/{path:path}")
+    @app.websocket("/deployments/{deployment_name}/ui")
+    async def route_websocket(
+        websocket: WebSocket, deployment_name: str, path: str | None = None
+    ) -> None:
+        replica = front.deployment_owner(deployment_name)
+        upstream_url = httpx.URL(f"{replica}{websocket.url.path}")
+        upstream_url = upstream_url.copy_with(
+            scheme="wss" if upstream_url.scheme == "https" else "ws",
+            query=websocket.url.query.encode(),
+        )
+        await _ws_proxy(websocket, str(upstream_url))
+
+    @app.api_route(
+        "/deployments/{path:path}",
+        methods=["GET", "POST", "PUT", "DELETE", "OPTIONS", "HEAD", "PATCH"],
+    )
+    async def route(request: Request, path: str) -> Response:
+        try:
+            return await _route(front, request, path.strip("/").split("/"))
+        except LookupError as e:
+            raise HTTPException(status_code=503, detail=str(e))
+
+    return app
+
+
+async def _route(front: RoutingFront, request: Request, parts: list[str]) -> Response:
+    deployment_name, rest = parts[0], parts[1:]
+
+    # Deployments exist on every replica
+    if parts == ["create"] or rest == ["warmup"]:
+        return await front.broadcast(request)
+    if not deployment_name:
+        return await front.forward(request, front.deployment_owner(""))
+
+    # Tasks and sessions are listed by the replica holding them
+    if request.method == "GET" and rest in (["tasks"], ["sessions"]):
+        return await front.gather(request)
+
+    session_id = request.query_params.get("session_id")
+    if rest[:1] == ["sessions"] and len(rest) == 2 and rest[1] != "create":
+        session_id = rest[1]
+    if session_id:
+        replica = front.session_owner(deployment_name, session_id)
+        return await front.forward(request, replica)
+
+    if rest == ["tasks", "batch"]:
+        # Run the batch where its first session lives, new sessions are pinned there
+        content = await request.body()
+        session_ids = _session_ids(content)
+        replica = (
+            front.session_owner(deployment_name, session_ids[0])
+            if session_ids
+            else front.pick_replica(deployment_name)
+        )
+        return await front.forward(request, replica, content, pin=deployment_name)
+
+    if rest[:1] == ["ui"] or not rest:
+        return await front.forward(request, front.deployment_owner(deployment_name))
+
+    # Requests creating a session, that will be pinned where it's created
+    return await front.forward(
+        request, front.pick_replica(deployment_name), pin=deployment_name
+    )
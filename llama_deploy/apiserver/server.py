@@ -25,6 +25,7 @@ async def lifespan(app: FastAPI) -> AsyncGenerator[None, Any]:
     logger.info(f"deployments folder: {manager.deployments_path}")
     logger.info(f"rc folder: {settings.rc_path}")
 
+    startup: asyncio.Task | None = None
     if settings.rc_path.exists():
         if settings.deployment_file_path:
             logger.info(
@@ -44,17 +45,30 @@ async def lifespan(app: FastAPI) -> AsyncGenerator[None, Any]:
                 x for x in settings.rc_path.iterdir() if x.suffix in (".yml", ".yaml")
             ]
         )
+        configs = []
         for yaml_file in files:
             try:
                 logger.info(f"Deploying startup configuration from {yaml_file}")
-                config = DeploymentConfig.from_yaml(yaml_file)
-                await manager.deploy(config, base_path=str(settings.rc_path))
+                configs.append(DeploymentConfig.from_yaml(yaml_file))
             except Exception as e:
                 logger.error(f"Failed to deploy {yaml_file}: {str(e)}")
+                # The deployment name is unknown, the file name identifies it
+                manager.mark_failed(yaml_file.name, str(e))
+
+        # Start serving right away, readiness of each deployment is reported by /status/ready
+        startup = asyncio.create_task(
+            manager.deploy_many(
+                configs,
+                base_path=str(settings.rc_path),
+                max_concurrency=settings.rc_deploy_concurrency,
+            )
+        )
 
     apiserver_state.state("running")
     yield
 
+    if startup is not None:
+        startup.cancel()
     t.cancel()
 
     apiserver_state.state("stopped")
@@ -0,0 +1,225 @@
+import json
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any
+
+from .stats import session_store_lookups, session_store_size
+
+
+class SessionStore(ABC):
+    """Protocol to be implemented by classes storing the serialized context of idle sessions."""
+
+    #: Whether the store performs I/O, its methods are then called off the event loop
+    blocking: bool = True
+
+    @abstractmethod
+    def get(self, session_id: str) -> dict[str, Any] | None:  # pragma: no cover
+        """Returns the serialized context of `session_id`, or None if it's not stored."""
+
+    @abstractmethod
+    def put(self, session_id: str, data: dict[str, Any]) -> None:  # pragma: no cover
+        """Stores the serialized context of a session, replacing any previous one."""
+
+    def put_many(self, sessions: dict[str, dict[str, Any]]) -> None:
+        """Stores the serialized context of several sessions, by session id."""
+        for session_id, data in sessions.items():
+            self.put(session_id, data)
+
+    @abstractmethod
+    def delete(self, session_id: str) -> None:  # pragma: no cover
+        """Removes a session from the store, if it's stored."""
+
+    def claim(self, session_id: str, owner: str, ttl: float) -> str | None:
+        """Makes `owner` the owner of a session for `ttl` seconds, unless another owner holds it.
+
+        Only the owner of a session runs its tasks, so that replicas sharing the store
+        don't fork it. Stores used by a single API Server don't track owners.
+
+        Returns:
+            The current owner when it's not `owner`, None once `owner` holds the session.
+        """
+        return None
+
+    def release(self, session_ids: list[str], owner: str) -> None:
+        """Gives up the ownership of sessions held by `owner`."""
+
+    def close(self) -> None:
+        """Releases the resources held by the store."""
+
+
+class SqliteSessionStore(SessionStore):
+    """A SessionStore persisting sessions in a SQLite database.
+
+    Multiple deployments can share the same database file, each one using a different
+    `namespace`. Sessions not restored within `ttl` seconds are dropped.
+
+    The number of stored sessions is counted once when the store is created, and kept
+    up to date by the writes of this instance.
+    """
+
+    def __init__(self, path: Path, namespace: str, ttl: float | None = None) -> None:
+        """Creates a SqliteSessionStore instance.
+
+        Args:
+            path: The path to the database file, created if it doesn't exist.
+            namespace: The namespace sessions are stored into, usually the deployment name.
+            ttl: Seconds a session is kept in the store, None means forever.
+        """
+        self._namespace = namespace
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "namespace TEXT NOT NULL, "
+                "session_id TEXT NOT NULL, "
+                "stored_at REAL NOT NULL, "
+                "data TEXT NOT NULL, "
+                "PRIMARY KEY (namespace, session_id))"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS sessions_stored_at "
+                "ON sessions (namespace, stored_at)"
+            )
+        with self._lock:
+            (self._size,) = self._conn.execute(
+                "SELECT COUNT(*) FROM sessions WHERE namespace = ?", (self._namespace,)
+            ).fetchone()
+            self._update_size()
+
+    def get(self, session_id: str) -> dict[str, Any] | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM sessions "
+                "WHERE namespace = ? AND session_id = ? AND stored_at >= ?",
+                (self._namespace, session_id, self._deadline()),
+            ).fetchone()
+        session_store_lookups.labels(
+            self._namespace, "miss" if row is None else "hit"
+        ).inc()
+        if row is None:
+            return None
+        return json.loads(row[0])
+
+    def put(self, session_id: str, data: dict[str, Any]) -> None:
+        self.put_many({session_id: data})
+
+    def put_many(self, sessions: dict[str, dict[str, Any]]) -> None:
+        rows = [
+            (self._namespace, session_id, time.time(), json.dumps(data))
+            for session_id, data in sessions.items()
+        ]
+        with self._lock, self._conn:
+            for row in rows:
+                inserted = self._conn.execute(
+                    "INSERT OR IGNORE INTO sessions VALUES (?, ?, ?, ?)", row
+                ).rowcount
+                if inserted:
+                    self._size += 1
+                else:
+                    self._conn.execute(
+                        "UPDATE sessions SET stored_at = ?, data = ? "
+                        "WHERE namespace = ? AND session_id = ?",
+                        (row[2], row[3], row[0], row[1]),
+                    )
+            if self._ttl is not None:
+                self._size -= self._conn.execute(
+                    "DELETE FROM sessions WHERE namespace = ? AND stored_at < ?",
+                    (self._namespace, self._deadline()),
+                ).rowcount
+            self._update_size()
+
+    def delete(self, session_id: str) -> None:
+        with self._lock, self._conn:
+            self._size -= self._conn.execute(
+                "DELETE FROM sessions WHERE namespace = ? AND session_id = ?",
+                (self._namespace, session_id),
+            ).rowcount
+            self._update_size()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _deadline(self) -> float:
+        if self._ttl is None:
+            return 0.0
+        return time.time() - self._ttl
+
+    def _update_size(self) -> None:
+        session_store_size.labels(self._namespace).set(self._size)
+
+
+class RedisSessionStore(SessionStore):
+    """A SessionStore keeping sessions in Redis, shared by all the API Server replicas.
+
+    Multiple deployments can share the same Redis database, each one using a different
+    `namespace`. Sessions not updated within `ttl` seconds are dropped.
+    """
+
+    def __init__(self, client: Any, namespace: str, ttl: float | None = None) -> None:
+        """Creates a RedisSessionStore instance.
+
+        Args:
+            client: A `redis.Redis` client.
+            namespace: The namespace sessions are stored into, usually the deployment name.
+            ttl: Seconds a session is kept in the store, None means forever.
+        """
+        self._client = client
+        self._namespace = namespace
+        self._ttl = ttl
+
+    def get(self, session_id: str) -> dict[str, Any] | None:
+        data = self._client.get(self._key(session_id))
+        session_store_lookups.labels(
+            self._namespace, "miss" if data is None else "hit"
+        ).inc()
+        if data is None:
+            return None
+        return json.loads(data)
+
+    def put(self, session_id: str, data: dict[str, Any]) -> None:
+        self._client.set(
+            self._key(session_id),
+            json.dumps(data),
+            # Milliseconds, so that ttls below one second don't disable the expiry
+            px=max(1, int(self._ttl * 1000)) if self._ttl is not None else None,
+        )
+
+    def delete(self, session_id: str) -> None:
+        self._client.delete(self._key(session_id))
+        self._client.delete(self._owner_key(session_id))
+
+    def claim(self, session_id: str, owner: str, ttl: float) -> str | None:
+        key = self._owner_key(session_id)
+        px = max(1, int(ttl * 1000))
+        if self._client.set(key, owner, nx=True, px=px):
+            return None
+        current = _decode(self._client.get(key))
+        if current is not None and current != owner:
+            return current
+        # Renew the lease, or take it over if it expired in the meantime
+        self._client.set(key, owner, px=px)
+        return None
+
+    def release(self, session_ids: list[str], owner: str) -> None:
+        for session_id in session_ids:
+            key = self._owner_key(session_id)
+            if _decode(self._client.get(key)) == owner:
+                self._client.delete(key)
+
+    def _key(self, session_id: str) -> str:
+        return f"llama_deploy:{self._namespace}:sessions:{session_id}"
+
+    def _owner_key(self, session_id: str) -> str:
+        return f"llama_deploy:{self._namespace}:session_owners:{session_id}"
+
+
+def _decode(value: bytes | str | None) -> str | None:
+    # Redis clients return bytes unless created with decode_responses=True
+    return value.decode() if isinstance(value, bytes) else value
@@ -1,5 +1,6 @@
 from pathlib import Path
 
+from platformdirs import user_cache_dir
 from pydantic import Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -27,6 +28,122 @@ class ApiserverSettings(BaseSettings):
         default=None,
         description="Optional path, relative to the rc_path, where the deployment file is located. If not provided, will glob all .yml/.yaml files in the rc_path",
     )
+    rc_deploy_concurrency: int = Field(
+        default=4,
+        description="Maximum number of deployments from the rc folder started at the same time",
+    )
+    executor_max_workers: int = Field(
+        default=8,
+        description="Maximum number of blocking operations, like syncing sources or installing dependencies, running at the same time",
+    )
+    sync_timeout: float | None = Field(
+        default=None,
+        description="Seconds to wait for the source of a service to be synced, defaults to no timeout",
+    )
+    install_timeout: float | None = Field(
+        default=None,
+        description="Seconds to wait for the dependencies of a service to be installed, defaults to no timeout",
+    )
+    import_timeout: float | None = Field(
+        default=None,
+        description="Seconds to wait for the workflow of a service to be imported, defaults to no timeout",
+    )
+    max_handlers: int | None = Field(
+        default=10000,
+        description="Maximum number of task handlers kept in memory by each deployment. Running tasks are never evicted",
+    )
+    handler_ttl: float | None = Field(
+        default=3600.0,
+        description="Seconds a completed task handler is kept in memory after its last access",
+    )
+    max_sessions: int | None = Field(
+        default=10000,
+        description="Maximum number of sessions kept in memory by each deployment, least recently used are evicted first",
+    )
+    session_ttl: float | None = Field(
+        default=86400.0,
+        description="Seconds an idle session is kept after its last access",
+    )
+    session_store_path: Path | None = Field(
+        default=None,
+        description="Path to a SQLite database where idle sessions are moved out of memory, defaults to keeping them in memory until they expire",
+    )
+    session_idle_timeout: float = Field(
+        default=300.0,
+        description="Seconds an idle session stays in memory before being moved to the session store, when one is set",
+    )
+    starvation_timeout: float | None = Field(
+        default=30.0,
+        description="Seconds a task queued in a service at capacity waits before being served ahead of higher priority tasks",
+    )
+    max_batch_size: int = Field(
+        default=1000,
+        description="Maximum number of tasks that can be submitted in a single batch request",
+    )
+    max_results: int | None = Field(
+        default=10000,
+        description="Maximum number of task results stored by each deployment, the oldest are dropped first",
+    )
+    result_store_path: Path | None = Field(
+        default=None,
+        description="Path to a SQLite database where task results are persisted, defaults to storing them in memory",
+    )
+    result_ttl: float | None = Field(
+        default=86400.0,
+        description="Seconds task results are kept by a shared state backend",
+    )
+    state_backend_url: str | None = Field(
+        default=None,
+        description="URL of a Redis database where task results and sessions are shared by all the API Server replicas, e.g. redis://localhost:6379/0. Defaults to keeping them local",
+    )
+    event_replay_size: int = Field(
+        default=1000,
+        description="Number of past events kept for each task, so that late subscribers can replay or resume the stream",
+    )
+    ui_proxy_max_connections: int = Field(
+        default=100,
+        description="Maximum number of concurrent connections from the API Server to each deployment UI server",
+    )
+    ui_proxy_max_keepalive_connections: int = Field(
+        default=20,
+        description="Maximum number of idle connections kept alive to each deployment UI server",
+    )
+    ui_proxy_connect_timeout: float = Field(
+        default=5.0,
+        description="Seconds to wait for a connection to a deployment UI server",
+    )
+    ui_proxy_read_timeout: float | None = Field(
+        default=None,
+        description="Seconds to wait for data from a deployment UI server, defaults to no timeout",
+    )
+    ui_idle_timeout: float | None = Field(
+        default=None,
+        description="Seconds without requests after which the UI server of a deployment is stopped, it's started again on the next request. Defaults to never stopping it",
+    )
+    lazy_load_services: bool = Field(
+        default=False,
+        description="Load the services of a deployment on their first request instead of when deploying",
+    )
+    ui_ready_timeout: float = Field(
+        default=60.0,
+        description="Seconds to wait for a new deployment UI server to answer requests when reloading a deployment",
+    )
+    reload_drain_timeout: float = Field(
+        default=30.0,
+        description="Seconds given to the tasks running on the previous version of a reloaded deployment to finish",
+    )
+    cache_path: Path | None = Field(
+        default=None,
+        description="Path to the folder where the API Server caches installed dependencies, defaults to the user cache folder",
+    )
+    router_replicas: list[str] = Field(
+        default=[],
+        description="Base URLs of the API Server replicas behind the routing front",
+    )
+    router_health_interval: float | None = Field(
+        default=5.0,
+        description="Seconds between health checks of the replicas behind the routing front, None disables them",
+    )
     use_tls: bool = Field(
         default=False,
         description="Use TLS (HTTPS) to communicate with the API Server",
@@ -79,5 +196,9 @@ class ApiserverSettings(BaseSettings):
             return f"{protocol}{self.host}"
         return f"{protocol}{self.host}:{self.port}"
 
+    @property
+    def cache_dir(self) -> Path:
+        return self.cache_path or Path(user_cache_dir("llama_deploy"))
+
 
 settings = ApiserverSettings()
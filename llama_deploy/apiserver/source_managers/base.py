@@ -17,11 +17,14 @@ class SourceManager(ABC):
         source: str,
         destination: str | None = None,
         sync_policy: SyncPolicy = SyncPolicy.REPLACE,
-    ) -> None:  # pragma: no cover
+    ) -> str | None:  # pragma: no cover
         """Fetches resources from `source` so they can be used in a deployment.
 
         Optionally uses `destination` to store data when this makes sense for the
         specific source type.
+
+        Returns:
+            An id of the version of the source that was synced, None if unknown.
         """
 
     def relative_path(self, source: str) -> str:
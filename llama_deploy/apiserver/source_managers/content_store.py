@@ -0,0 +1,296 @@
+import errno
+import hashlib
+import json
+import logging
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Read the files to hash in chunks of this size
+_CHUNK_SIZE = 1 << 20
+# ioctl cloning a file on copy-on-write filesystems, FICLONE on Linux
+_FICLONE = 0x40049409
+# Seconds a stored file is kept after being linked, even when no manifest uses it
+_GC_GRACE_PERIOD = 3600.0
+
+
+class ContentStore:
+    """A content-addressed store of files, linked into the folders that use them.
+
+    Each distinct file content is stored once under its SHA-256 and linked into
+    destination folders. On copy-on-write filesystems links are clones, so identical
+    files across deployments take disk space once; elsewhere they're copies. Either
+    way linked files are writable, e.g. by the build of a UI, and changing one leaves
+    the stored file and the other links untouched. Stored files are never hardlinked
+    for this reason.
+    """
+
+    def __init__(self, path: Path) -> None:
+        """Creates a ContentStore instance.
+
+        Args:
+            path: The folder where the store keeps its files.
+        """
+        self._path = path
+
+    def object_path(self, digest: str) -> Path:
+        """Returns the path of the stored file with the given digest."""
+        return self._path / "objects" / digest[:2] / digest
+
+    def manifest_path(self, key: str) -> Path:
+        """Returns the path of the manifest of a source folder."""
+        return self._path / "manifests" / key
+
+    def put(
+        self, source: Path, digest: str, stored: list[int] | None = None
+    ) -> list[int]:
+        """Stores the file at `source` under `digest`, unless already stored.
+
+        A stored file is read again only when its size differs from the one of `source`,
+        or its modification time from the one in `stored`, the state returned when it
+        was last put. It's replaced when its content doesn't match its digest anymore.
+
+        Returns:
+            The state of the stored file, its size and modification time.
+        """
+        obj = self.object_path(digest)
+        try:
+            st = obj.stat()
+        except FileNotFoundError:
+            pass
+        else:
+            state = [st.st_size, st.st_mtime_ns]
+            unchanged = st.st_size == source.stat().st_size and (
+                stored is None or state == stored
+            )
+            if unchanged or file_digest(obj) == digest:
+                # Refresh the ctime, the garbage collection keeps recently used files
+                os.chmod(obj, stat.S_IMODE(st.st_mode))
+                return state
+            logger.warning(f"Stored file {obj} was modified, storing it again")
+
+        obj.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=obj.parent)
+        os.close(fd)
+        try:
+            shutil.copy2(source, tmp)
+            os.chmod(tmp, stat.S_IMODE(os.stat(tmp).st_mode) & ~0o222)
+            os.replace(tmp, obj)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        st = obj.stat()
+        return [st.st_size, st.st_mtime_ns]
+
+    def link(self, digest: str, destination: Path, st: os.stat_result) -> None:
+        """Makes `destination` a clone of the stored file with the given digest.
+
+        Falls back to copying the file when the filesystem doesn't support clones. The
+        linked file gets the permissions and modification time in `st`, the status of
+        the source file.
+        """
+        obj = self.object_path(digest)
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        tmp = destination.with_name(f".{destination.name}.tmp")
+        if tmp.exists():
+            tmp.unlink()
+        try:
+            _reflink(obj, tmp)
+        except OSError:
+            shutil.copy2(obj, tmp)
+        os.chmod(tmp, stat.S_IMODE(st.st_mode))
+        os.utime(tmp, ns=(st.st_atime_ns, st.st_mtime_ns))
+        os.replace(tmp, destination)
+
+    def collect_garbage(self, grace_period: float = _GC_GRACE_PERIOD) -> int:
+        """Deletes the stored files that no synced folder uses anymore.
+
+        Manifests of source folders that don't exist anymore are deleted first. Files
+        stored or used less than `grace_period` seconds ago are kept, since a running
+        sync might be about to link them.
+
+        Returns:
+            The number of deleted files.
+        """
+        used: set[str] = set()
+        manifests = self._path / "manifests"
+        for manifest in manifests.iterdir() if manifests.is_dir() else []:
+            try:
+                data = json.loads(manifest.read_text())
+            except (OSError, ValueError):
+                continue
+            if "source" not in data or not Path(data["source"]).exists():
+                manifest.unlink(missing_ok=True)
+                continue
+            used.update(entry[2] for entry in data["files"].values())
+
+        deleted = 0
+        # Storing or using a file changes its ctime
+        deadline = time.time() - grace_period
+        objects = self._path / "objects"
+        for obj in objects.glob("*/*") if objects.is_dir() else []:
+            try:
+                if obj.name in used or obj.stat().st_ctime > deadline:
+                    continue
+                obj.unlink()
+            except FileNotFoundError:
+                continue
+            deleted += 1
+        return deleted
+
+
+def _reflink(source: Path, destination: Path) -> None:
+    """Makes `destination` a copy-on-write clone of `source`.
+
+    Raises:
+        OSError: If the filesystem doesn't support clones.
+    """
+    if sys.platform != "linux":
+        raise OSError(errno.EOPNOTSUPP, "File clones not supported")
+
+    import fcntl
+
+    try:
+        with open(source, "rb") as src, open(destination, "wb") as dst:
+            fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+        shutil.copystat(source, destination)
+    except OSError:
+        destination.unlink(missing_ok=True)
+        raise
+
+
+def file_digest(path: Path) -> str:
+    """Returns the SHA-256 of the content of a file."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def sync_tree(
+    source: Path,
+    destination: Path,
+    store: ContentStore,
+    manifest_path: Path,
+    delete: bool = True,
+) -> str:
+    """Makes the files in `destination` match the files in `source`.
+
+    The manifest of `source` records the size, modification time and digest of its
+    files when last synced, to any destination, so unchanged files are not read
+    again. Files in `destination` with the size, modification time and permissions
+    of the source file are left alone, the others are linked again. Symbolic links are
+    recreated as links, they're not followed.
+
+    Args:
+        source: The folder to sync from.
+        destination: The folder to sync to.
+        store: The store keeping the content of the files.
+        manifest_path: The file where to keep the manifest of `source`.
+        delete: Whether to delete the files in `destination` that are not in `source`.
+
+    Returns:
+        A digest of the paths and contents of the files and links in `source`.
+    """
+    if not source.is_dir():
+        raise FileNotFoundError(f"No such directory: '{source}'")
+
+    previous: dict[str, list] = {}
+    if manifest_path.exists():
+        previous = json.loads(manifest_path.read_text()).get("files", {})
+
+    current: dict[str, list] = {}
+    links: dict[str, str] = {}
+    for root, dirs, files in os.walk(source):
+        for name in dirs + files:
+            path = Path(root) / name
+            if path.is_symlink():
+                rel = path.relative_to(source).as_posix()
+                links[rel] = _sync_link(path, destination / rel)
+        for name in files:
+            path = Path(root) / name
+            if path.is_symlink():
+                continue
+            rel = path.relative_to(source).as_posix()
+            st = path.stat()
+            entry = previous.get(rel)
+            if entry and entry[:2] == [st.st_size, st.st_mtime_ns]:
+                digest = entry[2]
+            else:
+                digest = file_digest(path)
+            stored = entry[3:] if entry and entry[2] == digest and entry[3:] else None
+            linked = destination / rel
+            if not _is_synced(linked, st):
+                stored = store.put(path, digest, stored)
+                store.link(digest, linked, st)
+            current[rel] = [st.st_size, st.st_mtime_ns, digest, *(stored or [])]
+
+    if delete:
+        for root, dirs, files in os.walk(destination, topdown=False):
+            root_path = Path(root)
+            for name in files:
+                path = root_path / name
+                rel = path.relative_to(destination).as_posix()
+                if rel not in current and rel not in links:
+                    path.unlink()
+            for name in dirs:
+                path = root_path / name
+                if path.is_symlink():
+                    if path.relative_to(destination).as_posix() not in links:
+                        path.unlink()
+                    continue
+                try:
+                    path.rmdir()
+                except OSError:
+                    # Not empty
+                    pass
+
+    manifest_path.parent.mkdir(parents=True, exist_ok=True)
+    manifest_path.write_text(json.dumps({"source": str(source), "files": current}))
+
+    tree = hashlib.sha256()
+    for rel, entry in sorted(current.items()):
+        tree.update(f"{rel}\0{entry[2]}\0".encode())
+    for rel, target in sorted(links.items()):
+        tree.update(f"{rel}\0->{target}\0".encode())
+    return tree.hexdigest()
+
+
+def _sync_link(source: Path, destination: Path) -> str:
+    """Makes `destination` a symbolic link with the same target as the one at `source`.
+
+    Returns:
+        The target of the link.
+    """
+    target = os.readlink(source)
+    if destination.is_symlink():
+        if os.readlink(destination) == target:
+            return target
+        destination.unlink()
+    elif destination.is_dir():
+        shutil.rmtree(destination)
+    elif destination.exists():
+        destination.unlink()
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    os.symlink(target, destination)
+    return target
+
+
+def _is_synced(path: Path, st: os.stat_result) -> bool:
+    """Tells whether the file at `path` was synced from a source file with status `st`."""
+    try:
+        linked = path.lstat()
+    except FileNotFoundError:
+        return False
+    return (linked.st_size, linked.st_mtime_ns, linked.st_mode) == (
+        st.st_size,
+        st.st_mtime_ns,
+        st.st_mode,
+    )
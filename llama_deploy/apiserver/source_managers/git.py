@@ -1,11 +1,19 @@
+import hashlib
 import shutil
+import threading
 from pathlib import Path
-from typing import Any
+from urllib.parse import urlsplit, urlunsplit
 
-from git import Repo
+from git import GitCommandError, Repo
+
+from llama_deploy.apiserver.settings import settings
 
 from .base import SourceManager, SyncPolicy
 
+# Serializes the operations on a mirror within this process
+_mirror_locks: dict[Path, threading.Lock] = {}
+_mirror_locks_lock = threading.Lock()
+
 
 class GitSourceManager(SourceManager):
     """A SourceManager specialized for sources of type `git`."""
@@ -15,27 +23,65 @@ class GitSourceManager(SourceManager):
         source: str,
         destination: str | None = None,
         sync_policy: SyncPolicy = SyncPolicy.REPLACE,
-    ) -> None:
-        """Clones the repository at URL `source` into a local path `destination`.
+    ) -> str | None:
+        """Checks out the repository at URL `source` into a local path `destination`.
+
+        Repositories are fetched into a local mirror and checked out as worktrees, so
+        that syncing again only downloads the changes. When all the paths referenced by
+        the services using this source live in subfolders, only those are checked out.
 
         Args:
             source: The URL of the git repository. It can optionally contain a branch target using the name convention
                 `git_repo_url@branch_name`. For example, "https://example.com/llama_deploy.git@branch_name".
-            destination: The path in the local filesystem where to clone the git repository.
+            destination: The path in the local filesystem where to check out the git repository.
+
+        Returns:
+            The SHA of the commit checked out.
         """
         if not destination:
             raise ValueError("Destination cannot be empty")
 
-        if Path(destination).exists():
-            # FIXME: pull when SyncPolicy is MERGE
-            shutil.rmtree(destination)
-
         url, branch_name = self._parse_source(source)
-        kwargs: dict[str, Any] = {"url": url, "to_path": destination}
-        if branch_name:
-            kwargs["multi_options"] = [f"-b {branch_name}", "--single-branch"]
+        return sync_repo(
+            url, branch_name, Path(destination), self._sparse_paths(source)
+        )
+
+    def _sparse_paths(self, source: str) -> list[str] | None:
+        """Returns the folders the services using `source` need, None if they need the whole repository.
+
+        Files at the root of the repository are always checked out.
+        """
+        if self._config.ui is not None and self._config.ui.source.location == source:
+            return None
 
-        Repo.clone_from(**kwargs)
+        # Modules and packages might be folders, while other paths are files
+        modules: list[str] = []
+        files: list[str] = []
+        for service in self._config.services.values():
+            if service.source.location != source:
+                continue
+            if service.import_path:
+                modules.append(service.import_path.split(":")[0])
+            for dep in service.python_dependencies or []:
+                if dep.endswith("requirements.txt"):
+                    files.append(dep)
+                elif "/" in dep or dep == ".":
+                    modules.append(dep)
+            files.extend(service.env_files or [])
+
+        paths: set[Path] = set()
+        referenced = [(Path(m), True) for m in modules] + [
+            (Path(f), False) for f in files
+        ]
+        for path, is_module in referenced:
+            if path.is_absolute() or ".." in path.parts or path == Path("."):
+                return None
+            if path.parent != Path("."):
+                paths.add(path.parent)
+            elif is_module:
+                paths.add(path)
+
+        return sorted(p.as_posix() for p in paths) or None
 
     @staticmethod
     def _parse_source(source: str) -> tuple[str, str | None]:
@@ -46,3 +92,107 @@ class GitSourceManager(SourceManager):
             branch_name = toks[1]
 
         return url, branch_name
+
+
+def sync_repo(
+    url: str,
+    ref: str | None,
+    destination: Path,
+    sparse_paths: list[str] | None = None,
+    cache_dir: Path | None = None,
+) -> str:
+    """Checks out a git repository into `destination`, reusing a local mirror.
+
+    The mirror is a bare, blobless repository shared by all the checkouts of the same
+    URL. Refs are fetched shallow when possible, and file contents are downloaded only
+    when checked out. `destination` becomes a worktree of the mirror, updated in place
+    when it already is one.
+
+    Args:
+        url: The URL of the repository.
+        ref: The branch, tag or commit to check out, the default branch if None.
+        destination: The path where to check out the repository.
+        sparse_paths: The folders to check out, everything if None.
+        cache_dir: The folder where mirrors are stored, defaults to the cache of the API Server.
+
+    Returns:
+        The SHA of the commit checked out.
+    """
+    mirror_path = (cache_dir or settings.cache_dir) / "git" / _mirror_key(url)
+    with _mirror_lock(mirror_path):
+        mirror = _open_mirror(mirror_path, url)
+        commit = _fetch(mirror, ref)
+
+        destination = destination.absolute()
+        if not _is_worktree_of(destination, mirror_path):
+            if destination.exists():
+                shutil.rmtree(destination)
+            mirror.git.worktree("prune")
+            mirror.git.worktree(
+                "add", "--no-checkout", "--detach", str(destination), commit
+            )
+
+        worktree = Repo(destination)
+        if sparse_paths:
+            worktree.git.sparse_checkout("set", "--cone", *sparse_paths)
+        elif Path(worktree.git_dir, "info", "sparse-checkout").exists():
+            worktree.git.sparse_checkout("disable")
+        worktree.git.checkout("--force", "--detach", commit)
+        # Drop leftovers from the previous checkout, but keep ignored files like
+        # installed dependencies
+        worktree.git.clean("-ffd")
+
+    return commit
+
+
+def _mirror_key(url: str) -> str:
+    # Credentials can change over time, don't make them part of the key
+    parts = urlsplit(url)
+    netloc = parts.netloc.rsplit("@", 1)[-1]
+    bare_url = urlunsplit(parts._replace(netloc=netloc))
+    return hashlib.sha256(bare_url.encode()).hexdigest()[:32]
+
+
+def _mirror_lock(mirror_path: Path) -> threading.Lock:
+    with _mirror_locks_lock:
+        return _mirror_locks.setdefault(mirror_path, threading.Lock())
+
+
+def _open_mirror(mirror_path: Path, url: str) -> Repo:
+    if not mirror_path.exists():
+        mirror = Repo.init(mirror_path, bare=True, mkdir=True)
+        mirror.git.remote("add", "origin", url)
+        with mirror.config_writer() as config:
+            config.set_value('remote "origin"', "promisor", "true")
+            config.set_value('remote "origin"', "partialclonefilter", "blob:none")
+        return mirror
+
+    mirror = Repo(mirror_path)
+    mirror.git.remote("set-url", "origin", url)
+    return mirror
+
+
+def _fetch(mirror: Repo, ref: str | None) -> str:
+    """Fetches `ref` into the mirror and returns the SHA of its commit."""
+    try:
+        mirror.git.fetch("--depth=1", "--filter=blob:none", "origin", ref or "HEAD")
+        return mirror.git.rev_parse("FETCH_HEAD^{commit}")
+    except GitCommandError:
+        if ref is None:
+            raise
+
+    # Abbreviated SHAs can't be fetched directly, fetch the history of all the
+    # branches and tags to resolve them
+    args = ["--filter=blob:none", "--tags"]
+    if mirror.git.rev_parse("--is-shallow-repository") == "true":
+        args.append("--unshallow")
+    mirror.git.fetch(*args, "origin", "+refs/heads/*:refs/heads/*")
+    return mirror.git.rev_parse(f"{ref}^{{commit}}")
+
+
+def _is_worktree_of(path: Path, mirror_path: Path) -> bool:
+    dot_git = path / ".git"
+    if not dot_git.is_file():
+        return False
+    gitdir = dot_git.read_text().removeprefix("gitdir:").strip()
+    return Path(gitdir).resolve().is_relative_to(mirror_path.resolve())
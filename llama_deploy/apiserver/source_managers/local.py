@@ -1,7 +1,10 @@
-import shutil
+import hashlib
 from pathlib import Path
 
+from llama_deploy.apiserver.settings import settings
+
 from .base import SourceManager, SyncPolicy
+from .content_store import ContentStore, sync_tree
 
 
 class LocalSourceManager(SourceManager):
@@ -12,15 +15,22 @@ class LocalSourceManager(SourceManager):
         source: str,
         destination: str | None = None,
         sync_policy: SyncPolicy = SyncPolicy.REPLACE,
-    ) -> None:
+    ) -> str | None:
         """Copies the folder with path `source` into a local path `destination`.
 
+        Files are linked from a content-addressed store in the cache of the API Server,
+        so syncing again only updates the files that changed since the last sync, and
+        identical files across deployments are stored once.
+
         Args:
             source: The filesystem path to the folder containing the source code.
             destination: The path in the local filesystem where to copy the source directory.
+
+        Returns:
+            A digest of the content of the source folder, None when not synced.
         """
         if sync_policy == SyncPolicy.SKIP:
-            return
+            return None
 
         if not destination:
             raise ValueError("Destination cannot be empty")
@@ -29,19 +39,22 @@ class LocalSourceManager(SourceManager):
             raise ValueError("Source path must be relative to the deployment file")
 
         base = self._base_path or Path()
-        final_path = base / source
-        destination_path = Path(destination)
-        dirs_exist_ok: bool = False
-        if destination_path.exists():
-            # Path is a non-empty directory
-            if sync_policy == SyncPolicy.REPLACE:
-                shutil.rmtree(destination_path)
-            elif sync_policy == SyncPolicy.MERGE:
-                dirs_exist_ok = True
+        final_path = (base / source).absolute()
+        destination_path = (Path(destination) / source).absolute()
+        store = ContentStore(settings.cache_dir / "content")
+        # The digests of the source files are reused whatever the destination
+        manifest_key = hashlib.sha256(str(final_path).encode()).hexdigest()
+        manifest_path = store.manifest_path(manifest_key)
 
         try:
-            shutil.copytree(
-                final_path, destination_path / source, dirs_exist_ok=dirs_exist_ok
+            if sync_policy == SyncPolicy.FAIL and destination_path.exists():
+                raise FileExistsError(f"Destination exists: '{destination_path}'")
+            return sync_tree(
+                final_path,
+                destination_path,
+                store,
+                manifest_path,
+                delete=sync_policy == SyncPolicy.REPLACE,
             )
         except Exception as e:
             msg = f"Unable to copy {source} into {destination}: {e}"
@@ -0,0 +1,120 @@
+from abc import ABC, abstractmethod
+from typing import Any
+
+from .result_store import (
+    InMemoryResultStore,
+    RedisResultStore,
+    ResultStore,
+    SqliteResultStore,
+)
+from .session_store import RedisSessionStore, SessionStore, SqliteSessionStore
+from .settings import ApiserverSettings
+
+
+class StateBackend(ABC):
+    """Protocol to be implemented by classes creating the stores of the deployments state.
+
+    The state of a deployment is made of the results of its tasks and the context of its
+    sessions. A shared backend makes this state readable from every replica of the API
+    Server, while workflows keep running on the replica that started them. Tasks of a
+    session only run on the replica owning it, until the owner moves the session to the
+    store or stops renewing its lease.
+    """
+
+    #: Whether the state is shared with other replicas of the API Server
+    shared: bool = False
+
+    @abstractmethod
+    def result_store(self, deployment_name: str) -> ResultStore:  # pragma: no cover
+        """Returns the store for the task results of a deployment."""
+
+    @abstractmethod
+    def session_store(
+        self, deployment_name: str
+    ) -> SessionStore | None:  # pragma: no cover
+        """Returns the store for the sessions of a deployment, None to keep them in memory."""
+
+    def close(self) -> None:
+        """Releases the resources held by the backend."""
+
+
+class LocalStateBackend(StateBackend):
+    """A StateBackend keeping the state in this process, or in local SQLite databases."""
+
+    def __init__(self, settings: ApiserverSettings) -> None:
+        """Creates a LocalStateBackend instance.
+
+        Args:
+            settings: The settings defining where results and sessions are stored.
+        """
+        self._settings = settings
+
+    def result_store(self, deployment_name: str) -> ResultStore:
+        if self._settings.result_store_path is not None:
+            return SqliteResultStore(
+                self._settings.result_store_path,
+                deployment_name,
+                self._settings.max_results,
+            )
+        return InMemoryResultStore(self._settings.max_results)
+
+    def session_store(self, deployment_name: str) -> SessionStore | None:
+        if self._settings.session_store_path is not None:
+            return SqliteSessionStore(
+                self._settings.session_store_path,
+                deployment_name,
+                self._settings.session_ttl,
+            )
+        return None
+
+
+class RedisStateBackend(StateBackend):
+    """A StateBackend keeping the state in Redis, shared by all the API Server replicas."""
+
+    shared = True
+
+    def __init__(self, client: Any, settings: ApiserverSettings) -> None:
+        """Creates a RedisStateBackend instance.
+
+        Args:
+            client: A `redis.Redis` client, or any object implementing `get`, `set` and `delete` the same way.
+            settings: The settings defining how long results and sessions are kept.
+        """
+        self._client = client
+        self._settings = settings
+
+    def result_store(self, deployment_name: str) -> ResultStore:
+        return RedisResultStore(
+            self._client, deployment_name, self._settings.result_ttl
+        )
+
+    def session_store(self, deployment_name: str) -> SessionStore | None:
+        return RedisSessionStore(
+            self._client, deployment_name, self._settings.session_ttl
+        )
+
+    def close(self) -> None:
+        self._client.close()
+
+
+def create_state_backend(settings: ApiserverSettings) -> StateBackend:
+    """Creates the state backend configured in the settings.
+
+    Raises:
+        ValueError: If the backend URL is not supported.
+        ImportError: If the `redis` extra is not installed.
+    """
+    url = settings.state_backend_url
+    if url is None:
+        return LocalStateBackend(settings)
+
+    if not url.startswith(("redis://", "rediss://", "unix://")):
+        raise ValueError(f"Unsupported state backend URL: {url}")
+
+    try:
+        import redis
+    except ImportError as e:
+        msg = "The Redis state backend requires the redis extra: pip install llama_deploy[redis]"
+        raise ImportError(msg) from e
+
+    return RedisStateBackend(redis.Redis.from_url(url), settings)
@@ -1,4 +1,4 @@
-from prometheus_client import Enum
+from prometheus_client import Counter, Enum, Gauge, Histogram
 
 apiserver_state = Enum(
     "apiserver_state",
@@ -28,9 +28,133 @@ service_state = Enum(
     "Current state of a service attached to a deployment",
     ["deployment_name", "service_name"],
     states=[
+        "pending",
         "loading",
         "syncing",
         "installing",
+        "importing",
         "ready",
     ],
 )
+
+service_phase_duration = Histogram(
+    "service_phase_duration_seconds",
+    "Time spent by a service in each phase of its loading",
+    ["deployment_name", "service_name", "phase"],
+    buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, 600),
+)
+
+service_first_request_wait = Gauge(
+    "service_first_request_wait_seconds",
+    "Time the first request to a service waited for the service to be loaded",
+    ["deployment_name", "service_name"],
+)
+
+registry_size = Gauge(
+    "registry_size",
+    "Number of entries held by a deployment registry",
+    ["deployment_name", "registry"],
+)
+
+registry_evictions = Counter(
+    "registry_evictions",
+    "Number of entries evicted from a deployment registry",
+    ["deployment_name", "registry", "reason"],
+)
+
+ui_proxy_request_duration = Histogram(
+    "ui_proxy_request_duration_seconds",
+    "Time spent proxying a request to a deployment UI server, until the response is fully sent",
+    ["deployment_name", "method", "status_code"],
+)
+
+ui_cold_starts = Counter(
+    "ui_cold_starts",
+    "Number of times the UI server of a deployment was started again after being stopped for being idle",
+    ["deployment_name"],
+)
+
+ui_cold_start_duration = Histogram(
+    "ui_cold_start_duration_seconds",
+    "Time the first request to a stopped UI server waited for it to start again",
+    ["deployment_name"],
+)
+
+ui_idle_time = Gauge(
+    "ui_idle_seconds",
+    "Seconds since the UI server of a deployment last received a request",
+    ["deployment_name"],
+)
+
+admission_queue_depth = Gauge(
+    "admission_queue_depth",
+    "Number of tasks waiting for a free slot to run in a service",
+    ["deployment_name", "service_name"],
+)
+
+admission_wait_time = Histogram(
+    "admission_wait_seconds",
+    "Time spent by tasks waiting for a free slot to run in a service",
+    ["deployment_name", "service_name", "priority"],
+)
+
+admission_rejections = Counter(
+    "admission_rejections",
+    "Number of tasks rejected because a service was at capacity",
+    ["deployment_name", "service_name", "reason"],
+)
+
+executor_queue_depth = Gauge(
+    "executor_queue_depth",
+    "Number of blocking operations waiting for a free thread",
+    ["operation"],
+)
+
+executor_wait_time = Histogram(
+    "executor_wait_seconds",
+    "Time spent by blocking operations waiting for a free thread",
+    ["operation"],
+)
+
+executor_operation_duration = Histogram(
+    "executor_operation_duration_seconds",
+    "Time spent running blocking operations",
+    ["operation"],
+    buckets=(0.01, 0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, 600),
+)
+
+executor_timeouts = Counter(
+    "executor_timeouts",
+    "Number of blocking operations that didn't complete in time",
+    ["operation"],
+)
+
+session_store_size = Gauge(
+    "session_store_size",
+    "Number of idle sessions moved out of memory into the session store",
+    ["deployment_name"],
+)
+
+session_store_lookups = Counter(
+    "session_store_lookups",
+    "Number of lookups of sessions missing from memory in the session store",
+    ["deployment_name", "result"],
+)
+
+result_cache_size = Gauge(
+    "result_cache_size",
+    "Number of task results held in memory by the result cache of a service",
+    ["deployment_name", "service_name"],
+)
+
+result_cache_lookups = Counter(
+    "result_cache_lookups",
+    "Number of lookups in the result cache of a service",
+    ["deployment_name", "service_name", "result"],
+)
+
+coalesced_tasks = Counter(
+    "coalesced_tasks",
+    "Number of tasks that waited for the result of a running task with the same input",
+    ["deployment_name", "service_name"],
+)
@@ -0,0 +1,145 @@
+"""Entry point of the worker processes running the workflows of a service.
+
+Workers talk to the apiserver over their standard streams, exchanging one JSON
+message per line. Messages received on stdin:
+
+- `{"op": "run", "task_id": ..., "session_id": ..., "kwargs": {...}}`
+- `{"op": "send_event", "session_id": ..., "event": <serialized event>}`
+- `{"op": "cancel", "task_id": ...}`
+
+Messages sent on stdout:
+
+- `{"op": "event", "task_id": ..., "event": <serialized event>}`
+- `{"op": "result", "task_id": ..., "result": ...}`
+- `{"op": "error", "task_id": ..., "error": ...}`
+- `{"op": "cancelled", "task_id": ...}`
+
+Anything the workflows print to stdout is redirected to stderr.
+"""
+
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import sys
+from typing import IO, Any
+
+from workflows import Context, Workflow
+from workflows.context import JsonSerializer
+from workflows.errors import WorkflowCancelledByUser
+from workflows.handler import WorkflowHandler
+
+from .registry import BoundedRegistry
+from .settings import settings
+
+
+class _Worker:
+    def __init__(self, name: str, workflow: Workflow, output: IO[bytes]) -> None:
+        self._workflow = workflow
+        self._output = output
+        self._serializer = JsonSerializer()
+        self._contexts: BoundedRegistry[Context] = BoundedRegistry(
+            "worker_sessions",
+            name,
+            max_size=settings.max_sessions,
+            ttl=settings.session_ttl,
+        )
+        self._tasks: set[asyncio.Task] = set()
+        self._handlers: dict[str, WorkflowHandler] = {}
+
+    def handle(self, message: dict[str, Any]) -> None:
+        if message["op"] == "run":
+            self._spawn(self._run(message))
+        elif message["op"] == "cancel":
+            handler = self._handlers.get(message["task_id"])
+            if handler is not None:
+                self._spawn(handler.cancel_run())
+        elif message["op"] == "send_event":
+            ctx = self._contexts.get(message["session_id"])
+            if ctx is not None:
+                ctx.send_event(self._serializer.deserialize(message["event"]))
+
+    async def _run(self, message: dict[str, Any]) -> None:
+        task_id = message["task_id"]
+        session_id = message["session_id"]
+        try:
+            handler = self._workflow.run(
+                ctx=self._contexts.get(session_id), **message["kwargs"]
+            )
+            self._contexts[session_id] = handler.ctx or Context(self._workflow)
+        except Exception as e:
+            self._send({"op": "error", "task_id": task_id, "error": str(e)})
+            return
+
+        async def forward_events() -> None:
+            async for ev in handler.stream_events():
+                self._send_event(task_id, ev)
+
+        forward = asyncio.create_task(forward_events())
+        self._handlers[task_id] = handler
+        try:
+            await asyncio.wait({handler})
+        finally:
+            del self._handlers[task_id]
+        forward.cancel()
+        # Flush the events left in the stream after the workflow completed
+        if handler.ctx is not None:
+            while not handler.ctx.streaming_queue.empty():
+                self._send_event(task_id, handler.ctx.streaming_queue.get_nowait())
+
+        if handler.cancelled() or isinstance(
+            handler.exception(), WorkflowCancelledByUser
+        ):
+            self._send({"op": "cancelled", "task_id": task_id})
+        elif handler.exception() is not None:
+            error = str(handler.exception())
+            self._send({"op": "error", "task_id": task_id, "error": error})
+        else:
+            self._send({"op": "result", "task_id": task_id, "result": handler.result()})
+
+    def _spawn(self, coro: Any) -> None:
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _send_event(self, task_id: str, event: Any) -> None:
+        serialized = self._serializer.serialize(event)
+        self._send({"op": "event", "task_id": task_id, "event": serialized})
+
+    def _send(self, message: dict[str, Any]) -> None:
+        self._output.write(json.dumps(message, default=str).encode() + b"\n")
+        self._output.flush()
+
+
+async def _serve(worker: _Worker) -> None:
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader(limit=2**26)
+    await loop.connect_read_pipe(
+        lambda: asyncio.StreamReaderProtocol(reader), sys.stdin
+    )
+    # The apiserver closes stdin to stop the worker
+    while line := await reader.readline():
+        worker.handle(json.loads(line))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--name", required=True)
+    parser.add_argument("--pythonpath", required=True)
+    parser.add_argument("--import-path", required=True)
+    args = parser.parse_args()
+
+    # Keep stdout for the protocol messages
+    output = os.fdopen(os.dup(sys.stdout.fileno()), "wb")
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+    sys.path.append(args.pythonpath)
+    module_name, workflow_name = args.import_path.split(":")
+    workflow = getattr(importlib.import_module(module_name), workflow_name)
+
+    asyncio.run(_serve(_Worker(args.name, workflow, output)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+import asyncio
+import json
+import logging
+import sys
+import zlib
+from asyncio.subprocess import Process
+from functools import partial
+from pathlib import Path
+from typing import Any, AsyncGenerator, Awaitable, Callable
+
+from workflows.context import JsonSerializer
+from workflows.errors import WorkflowCancelledByUser
+from workflows.events import Event
+from workflows.handler import WorkflowHandler
+
+logger = logging.getLogger(__name__)
+
+# Max size of a single message exchanged with a worker
+_MESSAGE_LIMIT = 2**26
+
+
+class WorkerError(Exception):
+    """Raised when a task fails in a worker process."""
+
+
+class RemoteHandler(WorkflowHandler):
+    """The handler of a workflow running in a worker process.
+
+    The handler completes when the worker reports the result of the task, and streams
+    the events forwarded by the worker.
+    """
+
+    def __init__(self, cancel: Callable[[], Awaitable[None]] | None = None) -> None:
+        super().__init__()
+        self._events: asyncio.Queue[Event | None] = asyncio.Queue()
+        self._cancel = cancel
+
+    async def cancel_run(self) -> None:
+        """Asks the worker to cancel the workflow, the handler completes once it stops."""
+        if self._cancel is not None and not self.done():
+            await self._cancel()
+
+    async def stream_events(self) -> AsyncGenerator[Event, None]:
+        while True:
+            ev = await self._events.get()
+            if ev is None:
+                break
+            yield ev
+
+
+class RemoteContext:
+    """Stands for the context of a session living in a worker process."""
+
+    def __init__(self, pool: "WorkerPool", session_id: str) -> None:
+        self._pool = pool
+        self._session_id = session_id
+
+    @property
+    def pool(self) -> "WorkerPool":
+        """The pool running the worker where the session lives."""
+        return self._pool
+
+    def send_event(self, event: Event) -> None:
+        self._pool.send_event(self._session_id, event)
+
+
+class _WorkerProcess:
+    def __init__(self, process: Process) -> None:
+        self.process = process
+        self.handlers: dict[str, RemoteHandler] = {}
+        self.reader: asyncio.Task | None = None
+
+
+class WorkerPool:
+    """Runs the workflows of a service in a pool of worker processes.
+
+    Each worker process runs its own event loop, so that CPU bound steps in one
+    workflow don't stall the apiserver or the other workflows. Tasks of the same
+    session always run in the same worker, where the session context lives.
+    Workers are started on the first task, and restarted if they exit.
+    """
+
+    def __init__(
+        self,
+        deployment_name: str,
+        service_name: str,
+        *,
+        size: int,
+        pythonpath: Path,
+        import_path: str,
+    ) -> None:
+        """Creates a WorkerPool instance.
+
+        Args:
+            deployment_name: The name of the deployment.
+            service_name: The name of the service.
+            size: The number of worker processes.
+            pythonpath: The path added to the PYTHONPATH of the workers to import the workflow.
+            import_path: The workflow to run, in the form `module:attribute`.
+        """
+        self._name = f"{deployment_name}/{service_name}"
+        self._size = size
+        self._pythonpath = pythonpath
+        self._import_path = import_path
+        self._workers: list[_WorkerProcess | None] = [None] * size
+        self._lock = asyncio.Lock()
+        self._serializer = JsonSerializer()
+
+    @property
+    def size(self) -> int:
+        """The number of worker processes."""
+        return self._size
+
+    async def run(
+        self, task_id: str, session_id: str, run_kwargs: dict[str, Any]
+    ) -> RemoteHandler:
+        """Starts a task in the worker owning the session `session_id`."""
+        worker = await self._get_worker(session_id)
+        handler = RemoteHandler(
+            partial(self._send, worker, {"op": "cancel", "task_id": task_id})
+        )
+        worker.handlers[task_id] = handler
+        await self._send(
+            worker,
+            {
+                "op": "run",
+                "task_id": task_id,
+                "session_id": session_id,
+                "kwargs": run_kwargs,
+            },
+        )
+        return handler
+
+    def send_event(self, session_id: str, event: Event) -> None:
+        """Sends an event to the context of the session `session_id`."""
+        worker = self._workers[self._worker_index(session_id)]
+        if worker is None:
+            raise KeyError(session_id)
+        message = {
+            "op": "send_event",
+            "session_id": session_id,
+            "event": self._serializer.serialize(event),
+        }
+        assert worker.process.stdin is not None
+        worker.process.stdin.write(json.dumps(message).encode() + b"\n")
+
+    async def close(self) -> None:
+        """Stops the worker processes, failing the tasks still running."""
+        for index, worker in enumerate(self._workers):
+            if worker is None:
+                continue
+            self._workers[index] = None
+            assert worker.process.stdin is not None
+            worker.process.stdin.close()
+            try:
+                await asyncio.wait_for(worker.process.wait(), timeout=5)
+            except asyncio.TimeoutError:
+                worker.process.kill()
+                await worker.process.wait()
+            if worker.reader is not None:
+                await worker.reader
+
+    def _worker_index(self, session_id: str) -> int:
+        return zlib.crc32(session_id.encode()) % self._size
+
+    async def _get_worker(self, session_id: str) -> _WorkerProcess:
+        index = self._worker_index(session_id)
+        async with self._lock:
+            worker = self._workers[index]
+            if worker is None or worker.process.returncode is not None:
+                worker = await self._start_worker()
+                self._workers[index] = worker
+            return worker
+
+    async def _start_worker(self) -> _WorkerProcess:
+        process = await asyncio.create_subprocess_exec(
+            sys.executable,
+            "-m",
+            "llama_deploy.apiserver.worker",
+            "--name",
+            self._name,
+            "--pythonpath",
+            str(self._pythonpath),
+            "--import-path",
+            self._import_path,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            limit=_MESSAGE_LIMIT,
+        )
+        logger.info(f"Started worker for {self._name} with PID {process.pid}")
+        worker = _WorkerProcess(process)
+        worker.reader = asyncio.create_task(self._read(worker))
+        return worker
+
+    async def _send(self, worker: _WorkerProcess, message: dict[str, Any]) -> None:
+        assert worker.process.stdin is not None
+        worker.process.stdin.write(json.dumps(message).encode() + b"\n")
+        await worker.process.stdin.drain()
+
+    async def _read(self, worker: _WorkerProcess) -> None:
+        assert worker.process.stdout is not None
+        try:
+            while line := await worker.process.stdout.readline():
+                message = json.loads(line)
+                handler = worker.handlers.get(message["task_id"])
+                if handler is None:
+                    continue
+                if message["op"] == "event":
+                    ev = self._serializer.deserialize(message["event"])
+                    handler._events.put_nowait(ev)
+                    continue
+
+                del worker.handlers[message["task_id"]]
+                handler._events.put_nowait(None)
+                if handler.done():
+                    continue
+                if message["op"] == "result":
+                    handler.set_result(message["result"])
+                elif message["op"] == "cancelled":
+                    handler.set_exception(WorkflowCancelledByUser())
+                else:
+                    handler.set_exception(WorkerError(message["error"]))
+        except Exception as e:
+            logger.error(f"Error reading from worker of {self._name}: {e}")
+            worker.process.kill()
+        finally:
+            await worker.process.wait()
+            for handler in worker.handlers.values():
+                handler._events.put_nowait(None)
+                if not handler.done():
+                    handler.set_exception(WorkerError("Worker process exited"))
+            worker.handlers.clear()
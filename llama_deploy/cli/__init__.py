@@ -6,6 +6,7 @@ from .config import config as config_cmd
 from .deploy import deploy as deploy_cmd
 from .init import init as init_cmd
 from .internal.config import DEFAULT_PROFILE_NAME, load_config
+from .route import route as route_cmd
 from .run import run as run_cmd
 from .serve import serve as serve_cmd
 from .sessions import sessions as sessions_cmd
@@ -80,6 +81,7 @@ def llamactl(
 llamactl.add_command(config_cmd)
 llamactl.add_command(deploy_cmd)
 llamactl.add_command(init_cmd)
+llamactl.add_command(route_cmd)
 llamactl.add_command(run_cmd)
 llamactl.add_command(serve_cmd)
 llamactl.add_command(sessions_cmd)
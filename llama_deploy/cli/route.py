@@ -0,0 +1,29 @@
+import click
+import uvicorn
+
+from llama_deploy.apiserver.routing import RoutingFront, create_routing_app
+from llama_deploy.apiserver.settings import settings
+
+
+@click.command()
+@click.option(
+    "-r",
+    "--replica",
+    "replicas",
+    multiple=True,
+    help="Base URL of an API Server replica, repeat the option for each replica",
+)
+@click.option("--host", default="127.0.0.1", help="The host where to run the router")
+@click.option("--port", default=4500, type=int, help="The port where to run the router")
+def route(replicas: tuple[str, ...], host: str, port: int) -> None:
+    """Route requests to API Server replicas, keeping each session on one replica."""
+    replica_urls = list(replicas) or settings.router_replicas
+    if not replica_urls:
+        raise click.ClickException("At least one replica is required")
+
+    front = RoutingFront(
+        replica_urls,
+        health_interval=settings.router_health_interval,
+        max_pinned_sessions=settings.max_sessions,
+    )
+    uvicorn.run(create_routing_app(front), host=host, port=port)
@@ -1,4 +1,7 @@
+import asyncio
 import json
+from pathlib import Path
+from typing import Any
 
 import click
 import httpx
@@ -24,6 +27,12 @@ from .internal.config import ConfigProfile
 )
 @click.option("-s", "--service", is_flag=False, help="Service name")
 @click.option("-i", "--session-id", is_flag=False, help="Session ID")
+@click.option(
+    "-f",
+    "--input-file",
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    help="NDJSON file with the arguments of one task per line, results are printed as NDJSON",
+)
 @click.pass_context
 def run(
     ctx: click.Context,
@@ -32,6 +41,7 @@ def run(
     arg: tuple[tuple[str, str]],
     service: str,
     session_id: str,
+    input_file: Path | None,
 ) -> None:
     """Run tasks from a given service."""
     client = Client(
@@ -40,6 +50,31 @@ def run(
         timeout=config_profile.timeout,
     )
 
+    if input_file:
+        tasks = []
+        with open(input_file) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                payload: dict[str, Any] = {
+                    "input": json.dumps({**dict(arg), **json.loads(line)})
+                }
+                if service:
+                    payload["service_id"] = service
+                if session_id:
+                    payload["session_id"] = session_id
+                tasks.append(TaskDefinition(**payload))
+
+        try:
+            asyncio.run(_run_many(client, deployment, tasks))
+        except Exception as e:
+            extra_info = ""
+            if isinstance(e, httpx.HTTPStatusError):
+                extra_info = f" {e.response.text}"
+
+            raise click.ClickException(f"{str(e)}{extra_info}")
+        return
+
     payload = {"input": json.dumps(dict(arg))}
     if service:
         payload["service_id"] = service
@@ -57,3 +92,17 @@ def run(
         raise click.ClickException(f"{str(e)}{extra_info}")
 
     click.echo(result)
+
+
+async def _run_many(
+    client: Client, deployment: str, tasks: list[TaskDefinition]
+) -> None:
+    """Runs the tasks in batches and prints each result as soon as it's available."""
+    async with client:
+        d = await client.apiserver.deployments.get(deployment)
+        async for index, result in d.tasks.run_many(tasks):
+            line = {
+                "index": index,
+                **result.model_dump(mode="json", exclude={"history"}),
+            }
+            click.echo(json.dumps(line))
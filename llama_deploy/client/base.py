@@ -1,7 +1,13 @@
-from typing import Any
+import asyncio
+import importlib.util
+from contextlib import asynccontextmanager
+from types import TracebackType
+from typing import Any, AsyncIterator
 
 import httpx
+from pydantic import PrivateAttr, field_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
+from typing_extensions import Self
 
 
 class _BaseClient(BaseSettings):
@@ -9,6 +15,9 @@ class _BaseClient(BaseSettings):
 
     Settings can be passed to the Client constructor when creating an instance, or defined with environment variables
     having names prefixed with the string `LLAMA_DEPLOY_`, e.g. `LLAMA_DEPLOY_DISABLE_SSL`.
+
+    HTTP connections are pooled and kept alive across requests. The pool is bound to the running event loop and
+    can be released explicitly with `aclose()`, or by using the client as an async context manager.
     """
 
     model_config = SettingsConfigDict(env_prefix="LLAMA_DEPLOY_")
@@ -17,6 +26,47 @@ class _BaseClient(BaseSettings):
     disable_ssl: bool = False
     timeout: float | None = 120.0
     poll_interval: float = 0.5
+    http2: bool = False
+    max_connections: int | None = 100
+    max_keepalive_connections: int | None = 20
+    keepalive_expiry: float | None = 5.0
+
+    _http_clients: dict[bool, httpx.AsyncClient] = PrivateAttr(default_factory=dict)
+    _http_loop: asyncio.AbstractEventLoop | None = PrivateAttr(default=None)
+
+    @field_validator("http2")
+    @classmethod
+    def _check_http2(cls, http2: bool) -> bool:
+        # httpx only fails on the first request when h2 is missing
+        if http2 and importlib.util.find_spec("h2") is None:
+            msg = "HTTP/2 requires the http2 extra: pip install llama_deploy[http2]"
+            raise ImportError(msg)
+        return http2
+
+    async def __aenter__(self) -> Self:
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_val: BaseException | None,
+        exc_tb: TracebackType | None,
+    ) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        """Closes the pooled HTTP connections."""
+        clients = list(self._http_clients.values())
+        self._http_clients = {}
+        self._http_loop = None
+        for client in clients:
+            await client.aclose()
+
+    async def _close_loop_clients(self) -> None:
+        # Closes the pool if it was opened in the running loop, the sync client runs each
+        # call in a fresh loop and the connections can't be used once it's gone.
+        if self._http_loop is asyncio.get_running_loop():
+            await self.aclose()
 
     async def request(
         self, method: str, url: str | httpx.URL, **kwargs: Any
@@ -24,7 +74,38 @@ class _BaseClient(BaseSettings):
         """Performs an async HTTP request using httpx."""
         verify = kwargs.pop("verify", True)
         timeout = kwargs.pop("timeout", self.timeout)
-        async with httpx.AsyncClient(verify=verify) as client:
-            response = await client.request(method, url, timeout=timeout, **kwargs)
-            response.raise_for_status()
-            return response
+        client = self._get_http_client(verify)
+        response = await client.request(method, url, timeout=timeout, **kwargs)
+        response.raise_for_status()
+        return response
+
+    @asynccontextmanager
+    async def stream(
+        self, method: str, url: str | httpx.URL, **kwargs: Any
+    ) -> AsyncIterator[httpx.Response]:
+        """Performs an async HTTP request using httpx, without reading the response body upfront."""
+        verify = kwargs.pop("verify", True)
+        timeout = kwargs.pop("timeout", self.timeout)
+        client = self._get_http_client(verify)
+        async with client.stream(method, url, timeout=timeout, **kwargs) as response:
+            yield response
+
+    def _get_http_client(self, verify: bool) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if loop is not self._http_loop:
+            # Pooled connections can't be shared across event loops. The sync client
+            # closes its pool at the end of each call, see `_close_loop_clients()`.
+            self._http_clients = {}
+            self._http_loop = loop
+
+        if verify not in self._http_clients:
+            self._http_clients[verify] = httpx.AsyncClient(
+                verify=verify,
+                http2=self.http2,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive_connections,
+                    keepalive_expiry=self.keepalive_expiry,
+                ),
+            )
+        return self._http_clients[verify]
@@ -23,6 +23,11 @@ class Client(_BaseClient):
 
     def normal_function():
         status = client.sync.apiserver.status()
+
+    # Connections are pooled across calls, release them when done
+    async def with_lifecycle():
+        async with Client() as c:
+            status = await c.apiserver.status()
     ```
     """
 
@@ -21,10 +21,14 @@ from llama_deploy.types.core import (
     SessionDefinition,
     TaskDefinition,
     TaskResult,
+    TaskStatus,
 )
 
 from .model import Collection, Model
 
+# Seconds the server holds a result request while waiting for a task to finish
+_RESULT_POLL_WAIT = 10.0
+
 
 class SessionCollection(Collection):
     """A model representing a collection of session for a given deployment."""
@@ -100,21 +104,60 @@ class Task(Model):
     )
     session_id: str = Field(description="The ID of the session this task belongs to.")
 
-    async def results(self) -> TaskResult | None:
-        """Returns the result of a given task."""
+    async def results(self, wait: float | None = None) -> TaskResult | None:
+        """Returns the result of a given task.
+
+        Waits for the task to finish by default. With `wait`, the result is returned
+        after at most `wait` seconds, right away with `wait=0`: check its `status` to
+        know whether the task is done.
+
+        Args:
+            wait: Maximum number of seconds the server waits for the task to finish before answering, None to wait until it's done.
+        """
+        if wait is not None:
+            return await self._fetch_results(wait)
+        while True:
+            result = await self._fetch_results(_RESULT_POLL_WAIT)
+            if result is None or result.status not in (
+                TaskStatus.PENDING,
+                TaskStatus.RUNNING,
+            ):
+                return result
+
+    async def _fetch_results(self, wait: float) -> TaskResult | None:
         results_url = f"{self.client.api_server_url}/deployments/{self.deployment_id}/tasks/{self.id}/results"
 
+        params: dict[str, Any] = {"session_id": self.session_id}
+        timeout = self.client.timeout
+        if wait > 0:
+            params["wait"] = wait
+            if timeout is not None:
+                timeout += wait
+
         r = await self.client.request(
             "GET",
             results_url,
             verify=not self.client.disable_ssl,
-            params={"session_id": self.session_id},
-            timeout=self.client.timeout,
+            params=params,
+            timeout=timeout,
         )
         if r.json():
             return TaskResult.model_validate(r.json())
         return None
 
+    async def cancel(self) -> TaskResult:
+        """Cancels the task if still running, and returns its result."""
+        cancel_url = f"{self.client.api_server_url}/deployments/{self.deployment_id}/tasks/{self.id}/cancel"
+
+        r = await self.client.request(
+            "POST",
+            cancel_url,
+            verify=not self.client.disable_ssl,
+            params={"session_id": self.session_id},
+            timeout=self.client.timeout,
+        )
+        return TaskResult.model_validate(r.json())
+
     async def send_event(self, ev: Event, service_name: str) -> EventDefinition:
         """Sends a human response event."""
         url = f"{self.client.api_server_url}/deployments/{self.deployment_id}/tasks/{self.id}/events"
@@ -140,17 +183,18 @@ class Task(Model):
 
         while True:
             try:
-                async with httpx.AsyncClient(
-                    verify=not self.client.disable_ssl
-                ) as client:
-                    async with client.stream(
-                        "GET", events_url, params={"session_id": self.session_id}
-                    ) as response:
-                        response.raise_for_status()
-                        async for line in response.aiter_lines():
-                            json_line = json.loads(line)
-                            yield json_line
-                        break  # Exit the function if successful
+                async with self.client.stream(
+                    "GET",
+                    events_url,
+                    params={"session_id": self.session_id},
+                    verify=not self.client.disable_ssl,
+                    timeout=self.client.timeout,
+                ) as response:
+                    response.raise_for_status()
+                    async for line in response.aiter_lines():
+                        json_line = json.loads(line)
+                        yield json_line
+                    break  # Exit the function if successful
             except httpx.HTTPStatusError as e:
                 if e.response.status_code != 404:
                     raise  # Re-raise if it's not a 404 error
@@ -176,12 +220,17 @@ class TaskCollection(Collection):
         if task.session_id:
             run_url += f"?session_id={task.session_id}"
 
+        timeout = self.client.timeout
+        if task.timeout is not None and timeout is not None:
+            # Give the server the time to enforce the task timeout
+            timeout += task.timeout
+
         r = await self.client.request(
             "POST",
             run_url,
             verify=not self.client.disable_ssl,
             json=task.model_dump(),
-            timeout=self.client.timeout,
+            timeout=timeout,
         )
 
         return r.json()
@@ -207,6 +256,95 @@ class TaskCollection(Collection):
             session_id=response_fields["session_id"],
         )
 
+    async def create_many(
+        self,
+        tasks: list[TaskDefinition],
+        chunk_size: int = 100,
+        max_concurrency: int = 4,
+    ) -> list[Task]:
+        """Runs multiple tasks and returns them immediately, without waiting for the results.
+
+        Tasks are submitted in batches of `chunk_size`, sending at most `max_concurrency`
+        batches at the same time.
+
+        Args:
+            tasks: The definitions of the tasks we want to run.
+            chunk_size: The maximum number of tasks submitted with a single request.
+            max_concurrency: The maximum number of concurrent requests.
+        """
+        model_class = self._prepare(Task)
+        return [
+            model_class(
+                client=self.client,
+                deployment_id=self.deployment_id,
+                id=fields["task_id"],
+                session_id=fields["session_id"],
+            )
+            for fields in await self._submit_batches(tasks, chunk_size, max_concurrency)
+        ]
+
+    async def run_many(
+        self,
+        tasks: list[TaskDefinition],
+        chunk_size: int = 100,
+        max_concurrency: int = 4,
+    ) -> AsyncGenerator[tuple[int, TaskResult], None]:
+        """Runs multiple tasks and yields their results as soon as they're done.
+
+        Results are yielded in completion order, along with the position of the
+        corresponding task in `tasks`.
+
+        Args:
+            tasks: The definitions of the tasks we want to run.
+            chunk_size: The maximum number of tasks submitted with a single request.
+            max_concurrency: The maximum number of concurrent requests.
+        """
+        created = [
+            Task(
+                client=self.client,
+                deployment_id=self.deployment_id,
+                id=fields["task_id"],
+                session_id=fields["session_id"],
+            )
+            for fields in await self._submit_batches(tasks, chunk_size, max_concurrency)
+        ]
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def wait_result(index: int, task: Task) -> tuple[int, TaskResult]:
+            async with semaphore:
+                while True:
+                    result = await task.results()
+                    if result is not None:
+                        return index, result
+
+        for next_result in asyncio.as_completed(
+            [wait_result(i, t) for i, t in enumerate(created)]
+        ):
+            yield await next_result
+
+    async def _submit_batches(
+        self, tasks: list[TaskDefinition], chunk_size: int, max_concurrency: int
+    ) -> list[dict[str, Any]]:
+        batch_url = (
+            f"{self.client.api_server_url}/deployments/{self.deployment_id}/tasks/batch"
+        )
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def submit(chunk: list[TaskDefinition]) -> list[dict[str, Any]]:
+            async with semaphore:
+                r = await self.client.request(
+                    "POST",
+                    batch_url,
+                    verify=not self.client.disable_ssl,
+                    json=[task.model_dump() for task in chunk],
+                    timeout=self.client.timeout,
+                )
+                return r.json()
+
+        chunks = [tasks[i : i + chunk_size] for i in range(0, len(tasks), chunk_size)]
+        responses = await asyncio.gather(*(submit(chunk) for chunk in chunks))
+        return [fields for response in responses for fields in response]
+
     async def list(self) -> list[Task]:
         """Returns the list of tasks from this collection."""
         tasks_url = (
@@ -251,6 +389,17 @@ class Deployment(Model):
         coll_model_class = self._prepare(SessionCollection)
         return coll_model_class(client=self.client, deployment_id=self.id, items={})
 
+    async def warmup(self, service_id: str | None = None) -> None:
+        """Loads the services of the deployment, or only `service_id`, ahead of their first request."""
+        warmup_url = f"{self.client.api_server_url}/deployments/{self.id}/warmup"
+        await self.client.request(
+            "POST",
+            warmup_url,
+            params={"service_id": service_id} if service_id else None,
+            verify=not self.client.disable_ssl,
+            timeout=self.client.timeout,
+        )
+
 
 class DeploymentCollection(Collection):
     """A model representing a collection of deployments currently active."""
@@ -1,4 +1,5 @@
 import asyncio
+import functools
 import inspect
 from typing import Any, AsyncGenerator, Callable, Generic, TypeVar
 
@@ -65,16 +66,34 @@ def make_sync(_class: type[T]) -> Any:
     def generator_wrapper(
         func: Callable[_P, AsyncGenerator[_G, None]], /, *args: Any, **kwargs: Any
     ) -> Callable[_P, list[_G]]:
+        async def collect(self: _Base, *fargs: Any, **fkwargs: Any) -> list[_G]:
+            try:
+                return await _async_gen_to_list(func(self, *fargs, **fkwargs))  # type: ignore
+            finally:
+                await self.client._close_loop_clients()
+
+        @functools.wraps(func)
         def new_func(*fargs: Any, **fkwargs: Any) -> list[_G]:
-            return asyncio.run(_async_gen_to_list(func(*fargs, **fkwargs)))
+            return asyncio.run(collect(*fargs, **fkwargs))
+
+        return new_func  # type: ignore
+
+    def coroutine_wrapper(func: Callable[..., Any]) -> Callable[..., Any]:
+        @functools.wraps(func)
+        async def new_func(self: _Base, *args: Any, **kwargs: Any) -> Any:
+            try:
+                return await func(self, *args, **kwargs)
+            finally:
+                # Each sync call runs in its own event loop, don't leak its connections
+                await self.client._close_loop_clients()
 
-        return new_func
+        return async_to_sync(new_func)
 
     for name, method in _class.__dict__.items():
         # Only wrap async public methods
         if inspect.isasyncgenfunction(method):
             setattr(ModelWrapper, name, generator_wrapper(method))
         elif asyncio.iscoroutinefunction(method) and not name.startswith("_"):
-            setattr(ModelWrapper, name, async_to_sync(method))
+            setattr(ModelWrapper, name, coroutine_wrapper(method))
 
     return ModelWrapper
@@ -1,10 +1,18 @@
-from .apiserver import DeploymentDefinition, Status, StatusEnum
+from .apiserver import (
+    DeploymentDefinition,
+    DeploymentStatusEnum,
+    Readiness,
+    Status,
+    StatusEnum,
+)
 from .core import (
     ChatMessage,
     EventDefinition,
     SessionDefinition,
     TaskDefinition,
+    TaskPriority,
     TaskResult,
+    TaskStatus,
     generate_id,
 )
 
@@ -13,9 +21,13 @@ __all__ = [
     "EventDefinition",
     "SessionDefinition",
     "TaskDefinition",
+    "TaskPriority",
     "TaskResult",
+    "TaskStatus",
     "generate_id",
     "DeploymentDefinition",
+    "DeploymentStatusEnum",
+    "Readiness",
     "Status",
     "StatusEnum",
 ]
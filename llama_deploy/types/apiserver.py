@@ -9,6 +9,13 @@ class StatusEnum(Enum):
     DOWN = "Down"
 
 
+class DeploymentStatusEnum(Enum):
+    PENDING = "Pending"
+    STARTING = "Starting"
+    READY = "Ready"
+    FAILED = "Failed"
+
+
 class Status(BaseModel):
     status: StatusEnum
     status_message: str
@@ -16,5 +23,10 @@ class Status(BaseModel):
     deployments: list[str] | None = None
 
 
+class Readiness(BaseModel):
+    ready: bool
+    deployments: dict[str, DeploymentStatusEnum]
+
+
 class DeploymentDefinition(BaseModel):
     name: str
@@ -1,4 +1,5 @@
 import uuid
+from enum import Enum
 
 from llama_index.core.llms import ChatMessage
 from pydantic import BaseModel, Field
@@ -8,6 +9,14 @@ def generate_id() -> str:
     return str(uuid.uuid4())
 
 
+class TaskPriority(str, Enum):
+    """The scheduling priority of a task."""
+
+    HIGH = "high"
+    NORMAL = "normal"
+    LOW = "low"
+
+
 class TaskDefinition(BaseModel):
     """
     The definition and state of a task.
@@ -22,12 +31,23 @@ class TaskDefinition(BaseModel):
         service_id (str):
             The service ID that the task should be sent to.
             If blank, the orchestrator decides.
+        timeout (float):
+            Maximum number of seconds the task can run before being cancelled.
+            If blank, the task can run forever.
+        priority (TaskPriority):
+            How the task is scheduled when the service is at capacity.
+        tenant_id (str):
+            The tenant submitting the task, tenants with tasks of the same priority
+            share the service fairly.
     """
 
     input: str
     task_id: str = Field(default_factory=generate_id)
     session_id: str | None = None
     service_id: str | None = None
+    timeout: float | None = Field(default=None, gt=0)
+    priority: TaskPriority = TaskPriority.NORMAL
+    tenant_id: str | None = None
 
 
 class SessionDefinition(BaseModel):
@@ -62,6 +82,16 @@ class EventDefinition(BaseModel):
     event_obj_str: str
 
 
+class TaskStatus(str, Enum):
+    """The execution status of a task."""
+
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
 class TaskResult(BaseModel):
     """
     The result of a task.
@@ -71,13 +101,16 @@ class TaskResult(BaseModel):
             The task ID.
         history (list[ChatMessage]):
             The task history.
-        result (str):
-            The task result.
+        result (str | None):
+            The task result, None until the task is done.
+        status (TaskStatus):
+            The execution status of the task.
         data (dict):
             Additional data about the task or result.
     """
 
     task_id: str
     history: list[ChatMessage]
-    result: str
+    result: str | None = None
+    status: TaskStatus = TaskStatus.DONE
     data: dict = Field(default_factory=dict)
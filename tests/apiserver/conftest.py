@@ -10,6 +10,7 @@ from workflows.events import StartEvent, StopEvent
 from llama_deploy.apiserver.app import app
 from llama_deploy.apiserver.deployment import Deployment
 from llama_deploy.apiserver.deployment_config_parser import DeploymentConfig
+from llama_deploy.apiserver.settings import settings
 
 
 class SmallWorkflow(Workflow):
@@ -18,6 +19,14 @@ class SmallWorkflow(Workflow):
         return StopEvent(result="Hello, world!")
 
 
+@pytest.fixture(autouse=True)
+def cache_path(tmp_path_factory: pytest.TempPathFactory) -> Iterator[Path]:
+    # Keep the tests away from the cache of the user
+    path = tmp_path_factory.mktemp("cache")
+    with mock.patch.object(settings, "cache_path", path):
+        yield path
+
+
 @pytest.fixture
 def mock_importlib() -> Iterator[None]:
     with mock.patch("llama_deploy.apiserver.deployment.importlib") as importlib:
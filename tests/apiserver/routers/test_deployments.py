@@ -1,9 +1,10 @@
 from __future__ import annotations
 
+import asyncio
 import json
 from pathlib import Path
 from types import TracebackType
-from typing import Generator, Optional
+from typing import Any, AsyncGenerator, Callable, Generator, Optional
 from unittest import mock
 from unittest.mock import MagicMock, patch
 
@@ -14,8 +15,16 @@ from fastapi.testclient import TestClient
 from workflows.context import JsonSerializer
 from workflows.events import Event
 
+from llama_deploy.apiserver.admission import AdmissionRejected
+from llama_deploy.apiserver.broadcast import EventBroadcaster
+from llama_deploy.apiserver.deployment import DeploymentError, SessionOwnedError
 from llama_deploy.apiserver.deployment_config_parser import DeploymentConfig
-from llama_deploy.types import TaskResult
+from llama_deploy.apiserver.result_cache import CacheMode
+from llama_deploy.apiserver.routers.deployments import (
+    _batched,
+    create_deployment_task,
+)
+from llama_deploy.types import TaskPriority, TaskResult, TaskStatus
 from llama_deploy.types.core import EventDefinition, TaskDefinition
 
 
@@ -25,7 +34,9 @@ def mock_manager() -> Generator[MagicMock]:
     with patch("llama_deploy.apiserver.routers.deployments.manager") as mock_mgr:
         mock_deployment = MagicMock()
         mock_deployment.name = "test-deployment"
-        mock_deployment._config.ui.port = 3000
+        mock_deployment.ui_port = 3000
+        mock_deployment.wake_ui_server = mock.AsyncMock(return_value=3000)
+        mock_deployment.ui_client = httpx.AsyncClient()
         mock_mgr.get_deployment.return_value = mock_deployment
         yield mock_mgr
 
@@ -47,6 +58,14 @@ def test_read_deployment(http_client: TestClient, mock_manager: MagicMock) -> No
     assert response.json() == {"detail": "Deployment not found"}
 
 
+def test_deployment_not_ready(http_client: TestClient, mock_manager: MagicMock) -> None:
+    mock_manager.get_deployment.return_value.ready = False
+    response = http_client.post("/deployments/test-deployment/tasks/create", json={})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "5"
+    assert response.json() == {"detail": "Deployment test-deployment is still starting"}
+
+
 def test_create_deployment(
     http_client: TestClient, data_path: Path, mock_manager: MagicMock
 ) -> None:
@@ -149,13 +168,88 @@ def test_run_deployment_task(
     assert response.status_code == 200
 
 
+def test_run_deployment_task_timeout(
+    http_client: TestClient, data_path: Path, mock_manager: MagicMock
+) -> None:
+    deployment = mock.AsyncMock()
+    deployment.default_service = "TestService"
+    deployment.service_names = ["TestService"]
+    deployment.run_workflow.side_effect = TimeoutError(
+        "Task timed out after 1.0 seconds"
+    )
+    mock_manager.get_deployment.return_value = deployment
+
+    response = http_client.post(
+        "/deployments/test-deployment/tasks/run/",
+        json={"input": '{"a": 1}', "timeout": 1},
+    )
+    assert response.status_code == 504
+    assert response.json() == {"detail": "Task timed out after 1.0 seconds"}
+    deployment.run_workflow.assert_awaited_once_with(
+        service_id="TestService",
+        session_id=None,
+        task_timeout=1.0,
+        cache_mode=CacheMode.use,
+        priority=TaskPriority.NORMAL,
+        tenant_id=None,
+        a=1,
+    )
+
+
+def test_run_deployment_task_cache_control(
+    http_client: TestClient, data_path: Path, mock_manager: MagicMock
+) -> None:
+    deployment = mock.AsyncMock()
+    deployment.default_service = "TestService"
+    deployment.service_names = ["TestService"]
+    deployment.run_workflow.return_value = "foo"
+    mock_manager.get_deployment.return_value = deployment
+
+    response = http_client.post(
+        "/deployments/test-deployment/tasks/run/",
+        json={"input": "{}"},
+        headers={"Cache-Control": "no-cache"},
+    )
+    assert response.status_code == 200
+    assert deployment.run_workflow.call_args.kwargs["cache_mode"] == CacheMode.refresh
+
+
+@pytest.mark.asyncio
+async def test_run_deployment_task_client_disconnected() -> None:
+    cancelled = asyncio.Event()
+
+    async def run_workflow(**kwargs: Any) -> None:
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    deployment = mock.MagicMock()
+    deployment.default_service = "TestService"
+    deployment.service_names = ["TestService"]
+    deployment.run_workflow = run_workflow
+    request = mock.MagicMock()
+    request.is_disconnected = mock.AsyncMock(side_effect=[False, True])
+
+    with mock.patch(
+        "llama_deploy.apiserver.routers.deployments._DISCONNECT_POLL_INTERVAL", 0.01
+    ):
+        response = await create_deployment_task(
+            request, deployment, TaskDefinition(input="{}")
+        )
+
+    assert response.status_code == 499
+    assert cancelled.is_set()
+
+
 def test_create_deployment_task(
     http_client: TestClient, data_path: Path, mock_manager: MagicMock
 ) -> None:
     deployment = mock.MagicMock()
     deployment.default_service = "TestService"
     deployment.service_names = ["TestService"]
-    deployment.run_workflow_no_wait.return_value = "42"
+    deployment.run_workflow_no_wait = mock.AsyncMock(return_value="42")
     deployment._contexts = {"84": mock.MagicMock()}  # For session_id test
     mock_manager.get_deployment.return_value = deployment
 
@@ -176,6 +270,185 @@ def test_create_deployment_task(
     assert response.status_code == 200
 
 
+def test_create_deployment_tasks_batch(
+    http_client: TestClient, data_path: Path, mock_manager: MagicMock
+) -> None:
+    deployment = mock.MagicMock()
+    deployment.default_service = "TestService"
+    deployment.service_names = ["TestService", "OtherService"]
+    deployment.run_workflow_no_wait = mock.AsyncMock(
+        side_effect=[("t1", "s1"), ("t2", "s2")]
+    )
+    mock_manager.get_deployment.return_value = deployment
+
+    response = http_client.post(
+        "/deployments/test-deployment/tasks/batch",
+        json=[
+            {"input": '{"a": 1}'},
+            {
+                "input": "{}",
+                "service_id": "OtherService",
+                "session_id": "s2",
+                "timeout": 30,
+                "priority": "low",
+                "tenant_id": "backfill",
+            },
+        ],
+    )
+    assert response.status_code == 200
+    tasks = [TaskDefinition(**td) for td in response.json()]
+    assert [(t.task_id, t.session_id) for t in tasks] == [("t1", "s1"), ("t2", "s2")]
+    assert deployment.run_workflow_no_wait.call_args_list == [
+        mock.call(
+            service_id="TestService",
+            session_id=None,
+            task_timeout=None,
+            priority=TaskPriority.NORMAL,
+            tenant_id=None,
+            a=1,
+        ),
+        mock.call(
+            service_id="OtherService",
+            session_id="s2",
+            task_timeout=30.0,
+            priority=TaskPriority.LOW,
+            tenant_id="backfill",
+        ),
+    ]
+
+
+def test_create_deployment_tasks_batch_invalid(
+    http_client: TestClient, data_path: Path, mock_manager: MagicMock
+) -> None:
+    deployment = mock.MagicMock()
+    deployment.default_service = "TestService"
+    deployment.service_names = ["TestService"]
+    mock_manager.get_deployment.return_value = deployment
+
+    response = http_client.post(
+        "/deployments/test-deployment/tasks/batch",
+        json=[{"input": "{}"}, {"input": "{}", "service_id": "missing"}],
+    )
+    assert response.status_code == 404
+    # No task is started when the batch is invalid
+    deployment.run_workflow_no_wait.assert_not_called()
+
+    for bad_input in ("{", "[1]"):
+        response = http_client.post(
+            "/deployments/test-deployment/tasks/batch",
+            json=[{"input": "{}"}, {"input": bad_input}],
+        )
+        assert response.status_code == 400
+        assert response.json()["detail"].startswith("Input of task 1")
+    deployment.run_workflow_no_wait.assert_not_called()
+
+    with patch(
+        "llama_deploy.apiserver.routers.deployments.settings"
+    ) as mocked_settings:
+        mocked_settings.max_batch_size = 1
+        response = http_client.post(
+            "/deployments/test-deployment/tasks/batch",
+            json=[{"input": "{}"}, {"input": "{}"}],
+        )
+    assert response.status_code == 400
+
+
+def test_create_deployment_task_session_owned(
+    http_client: TestClient, mock_manager: MagicMock
+) -> None:
+    deployment = mock.MagicMock()
+    deployment.default_service = "TestService"
+    deployment.service_names = ["TestService"]
+    deployment.run_workflow = mock.AsyncMock(
+        side_effect=SessionOwnedError("s1", "replica")
+    )
+    deployment.run_workflow_no_wait = mock.AsyncMock(
+        side_effect=SessionOwnedError("s1", "replica")
+    )
+    mock_manager.get_deployment.return_value = deployment
+
+    for endpoint in ("run", "create"):
+        response = http_client.post(
+            f"/deployments/test-deployment/tasks/{endpoint}",
+            params={"session_id": "s1"},
+            json={"input": "{}"},
+        )
+        assert response.status_code == 409
+        assert response.json() == {
+            "detail": "Session s1 is owned by another replica: replica"
+        }
+
+
+def test_create_deployment_task_rejected(
+    http_client: TestClient, data_path: Path, mock_manager: MagicMock
+) -> None:
+    deployment = mock.MagicMock()
+    deployment.default_service = "TestService"
+    deployment.service_names = ["TestService"]
+    deployment.run_workflow_no_wait = mock.AsyncMock(
+        side_effect=AdmissionRejected("Service at capacity", retry_after=2.5)
+    )
+    mock_manager.get_deployment.return_value = deployment
+
+    response = http_client.post(
+        "/deployments/test-deployment/tasks/create/",
+        json={"input": "{}"},
+    )
+    assert response.status_code == 429
+    assert response.headers["retry-after"] == "3"
+    assert response.json() == {"detail": "Service at capacity"}
+
+    # Tasks started before the rejection are reported in batches
+    deployment.run_workflow_no_wait.side_effect = [
+        ("t1", "s1"),
+        AdmissionRejected("Service queue is full", retry_after=1),
+    ]
+    response = http_client.post(
+        "/deployments/test-deployment/tasks/batch",
+        json=[{"input": "{}"}, {"input": "{}"}],
+    )
+    assert response.status_code == 429
+    assert response.headers["retry-after"] == "1"
+    detail = response.json()["detail"]
+    assert detail["message"] == "Service queue is full"
+    assert [td["task_id"] for td in detail["started"]] == ["t1"]
+
+    # So are they on other errors
+    deployment.run_workflow_no_wait.side_effect = [("t1", "s1"), KeyError("s2")]
+    response = http_client.post(
+        "/deployments/test-deployment/tasks/batch",
+        json=[{"input": "{}"}, {"input": "{}", "session_id": "s2"}],
+    )
+    assert response.status_code == 500
+    assert [td["task_id"] for td in response.json()["detail"]["started"]] == ["t1"]
+
+
+def test_cancel_task(
+    http_client: TestClient, data_path: Path, mock_manager: MagicMock
+) -> None:
+    deployment = mock.AsyncMock()
+    deployment.cancel_task.return_value = TaskResult(
+        task_id="t1",
+        history=[],
+        status=TaskStatus.CANCELLED,
+        data={"error": "Task was cancelled"},
+    )
+    mock_manager.get_deployment.return_value = deployment
+
+    response = http_client.post(
+        "/deployments/test-deployment/tasks/t1/cancel", params={"session_id": "s1"}
+    )
+    assert response.status_code == 200
+    assert response.json()["status"] == "cancelled"
+    deployment.cancel_task.assert_awaited_once_with("t1")
+
+    deployment.cancel_task.side_effect = KeyError("t1")
+    response = http_client.post(
+        "/deployments/test-deployment/tasks/t1/cancel", params={"session_id": "s1"}
+    )
+    assert response.status_code == 404
+
+
 def test_send_event_not_found(
     http_client: TestClient, data_path: Path, mock_manager: MagicMock
 ) -> None:
@@ -198,7 +471,7 @@ def test_send_event(
     deployment = mock.AsyncMock()
     deployment.default_service = "TestService"
     mock_context = mock.MagicMock()
-    deployment._contexts = {"42": mock_context}
+    deployment.get_session.return_value = mock_context
     mock_manager.get_deployment.return_value = deployment
 
     serializer = JsonSerializer()
@@ -216,6 +489,15 @@ def test_send_event(
     ev_def = EventDefinition(**response.json())
     assert ev_def.service_id == event_def.service_id
     assert ev_def.event_obj_str == event_def.event_obj_str
+    deployment.get_session.assert_awaited_once_with("42", "TestService")
+    mock_context.send_event.assert_called_once()
+
+
+def _subscribe_to(handler: Any) -> Callable:
+    def subscribe_events(task_id: str, offset: int = 0) -> AsyncGenerator:
+        return EventBroadcaster(handler).subscribe(offset)
+
+    return subscribe_events
 
 
 def test_get_event_not_found(
@@ -229,6 +511,20 @@ def test_get_event_not_found(
     assert response.status_code == 404
 
 
+def test_get_event_task_not_found(
+    http_client: TestClient, data_path: Path, mock_manager: MagicMock
+) -> None:
+    deployment = mock.AsyncMock()
+    deployment.subscribe_events = mock.MagicMock(side_effect=KeyError("84"))
+    mock_manager.get_deployment.return_value = deployment
+    response = http_client.get(
+        "/deployments/test-deployment/tasks/84/events",
+        params={"session_id": "42"},
+    )
+    assert response.status_code == 404
+    assert response.json() == {"detail": "Task not found"}
+
+
 @pytest.mark.asyncio
 async def test_get_event_stream(
     http_client: TestClient, data_path: Path, mock_manager: MagicMock
@@ -256,7 +552,7 @@ async def test_get_event_stream(
             return await_impl().__await__()
 
     mock_handler = MockHandler()
-    deployment._handlers = {"test_task_id": mock_handler}
+    deployment.subscribe_events = _subscribe_to(mock_handler)
     mock_manager.get_deployment.return_value = deployment
 
     response = http_client.get(
@@ -298,7 +594,7 @@ async def test_get_event_stream_raw(
             return await_impl().__await__()
 
     mock_handler = MockHandler()
-    deployment._handlers = {"test_task_id": mock_handler}
+    deployment.subscribe_events = _subscribe_to(mock_handler)
     mock_manager.get_deployment.return_value = deployment
 
     response = http_client.get(
@@ -316,6 +612,89 @@ async def test_get_event_stream_raw(
         ix += 1
 
 
+class _StreamingHandler:
+    def __init__(self, events: list[Event]) -> None:
+        self.events = events
+
+    async def stream_events(self):  # type:ignore
+        for event in self.events:
+            yield event
+
+    def __await__(self):  # type:ignore
+        async def await_impl():  # type:ignore
+            return "completed"
+
+        return await_impl().__await__()
+
+
+def test_get_event_stream_sse(
+    http_client: TestClient, data_path: Path, mock_manager: MagicMock
+) -> None:
+    deployment = mock.AsyncMock()
+    deployment.subscribe_events = _subscribe_to(
+        _StreamingHandler([Event(msg=f"event {i}") for i in range(3)])
+    )
+    mock_manager.get_deployment.return_value = deployment
+
+    response = http_client.get(
+        "/deployments/test-deployment/tasks/test_task_id/events/?session_id=42",
+        headers={"Accept": "text/event-stream", "Last-Event-ID": "0"},
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    messages = [m for m in response.text.split("\n\n") if m]
+    assert len(messages) == 2
+    assert messages[0].splitlines()[0] == "id: 1"
+    assert json.loads(messages[0].splitlines()[1][len("data: ") :]) == {
+        "_data": {"msg": "event 1"}
+    }
+    assert messages[1].splitlines()[0] == "id: 2"
+
+
+def test_get_event_stream_batched(
+    http_client: TestClient, data_path: Path, mock_manager: MagicMock
+) -> None:
+    deployment = mock.AsyncMock()
+    deployment.subscribe_events = _subscribe_to(
+        _StreamingHandler([Event(msg=f"event {i}") for i in range(5)])
+    )
+    mock_manager.get_deployment.return_value = deployment
+
+    response = http_client.get(
+        "/deployments/test-deployment/tasks/test_task_id/events/?session_id=42&max_events=2&max_delay=1",
+    )
+    assert response.status_code == 200
+    lines = response.text.splitlines()
+    assert [json.loads(line)["_data"]["msg"] for line in lines] == [
+        f"event {i}" for i in range(5)
+    ]
+
+
+@pytest.mark.asyncio
+async def test_batched() -> None:
+    async def items() -> AsyncGenerator[int, None]:
+        for i in range(5):
+            yield i
+
+    assert [b async for b in _batched(items(), 1, None)] == [[0], [1], [2], [3], [4]]
+    assert [b async for b in _batched(items(), 2, 1.0)] == [[0, 1], [2, 3], [4]]
+
+    async def slow_items() -> AsyncGenerator[int, None]:
+        yield 0
+        await asyncio.sleep(0.2)
+        yield 1
+
+    # Incomplete batches are flushed once max_delay expires
+    assert [b async for b in _batched(slow_items(), 10, 0.01)] == [[0], [1]]
+
+    async def failing_items() -> AsyncGenerator[int, None]:
+        yield 0
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError, match="boom"):
+        [b async for b in _batched(failing_items(), 2, None)]
+
+
 def test_get_task_result_not_found(
     http_client: TestClient, data_path: Path, mock_manager: MagicMock
 ) -> None:
@@ -357,17 +736,9 @@ def test_get_task_result(
 ) -> None:
     deployment = mock.AsyncMock()
     deployment.default_service = "TestService"
-
-    # Mock the handler to return the expected result - needs to be awaitable
-    class MockHandler:
-        def __await__(self):  # type:ignore
-            async def await_impl():  # type:ignore
-                return "test_result"
-
-            return await_impl().__await__()
-
-    mock_handler = MockHandler()
-    deployment._handlers = {"test_task_id": mock_handler}
+    deployment.get_task_result.return_value = TaskResult(
+        task_id="test_task_id", history=[], result="test_result"
+    )
 
     mock_manager.get_deployment.return_value = deployment
 
@@ -376,6 +747,19 @@ def test_get_task_result(
     )
     assert response.status_code == 200
     assert TaskResult(**response.json()).result == "test_result"
+    deployment.get_task_result.assert_awaited_with("test_task_id", 0)
+
+    response = http_client.get(
+        "/deployments/test-deployment/tasks/test_task_id/results/?session_id=42&wait=2.5",
+    )
+    assert response.status_code == 200
+    deployment.get_task_result.assert_awaited_with("test_task_id", 2.5)
+
+    deployment.get_task_result.side_effect = KeyError("test_task_id")
+    response = http_client.get(
+        "/deployments/test-deployment/tasks/test_task_id/results/?session_id=42",
+    )
+    assert response.status_code == 404
 
 
 def test_get_sessions_not_found(
@@ -419,13 +803,14 @@ def test_delete_session(
 ) -> None:
     deployment = mock.AsyncMock()
     deployment.default_service = "TestService"
-    deployment._contexts = {"42": mock.MagicMock()}  # Mock context to be deleted
+    deployment.delete_session = mock.AsyncMock()
     mock_manager.get_deployment.return_value = deployment
 
     response = http_client.post(
         "/deployments/test-deployment/sessions/delete/?session_id=42",
     )
     assert response.status_code == 200
+    deployment.delete_session.assert_awaited_once_with("42")
 
 
 def test_get_session_not_found(
@@ -464,10 +849,8 @@ def test_create_session_not_found(
 def test_create_session(
     http_client: TestClient, data_path: Path, mock_manager: MagicMock
 ) -> None:
-    deployment = mock.AsyncMock()
-    deployment.default_service = "TestService"
-    deployment._workflow_services = {"TestService": mock.MagicMock()}
-    deployment._contexts = {}
+    deployment = mock.MagicMock()
+    deployment.create_session = mock.AsyncMock(return_value="session_id")
     mock_manager.get_deployment.return_value = deployment
 
     response = http_client.post(
@@ -475,8 +858,7 @@ def test_create_session(
     )
 
     assert response.status_code == 200
-    # The response should contain a generated session_id
-    assert "session_id" in response.json()
+    assert response.json()["session_id"] == "session_id"
     assert response.json()["state"] == {}
     assert response.json()["task_ids"] == []
 
@@ -484,6 +866,33 @@ def test_create_session(
     mock_manager.get_deployment.assert_called_once_with("test-deployment")
 
 
+def test_warmup(http_client: TestClient, mock_manager: MagicMock) -> None:
+    deployment = mock_manager.get_deployment.return_value
+    deployment.service_names = ["TestService"]
+    deployment.warmup = mock.AsyncMock()
+
+    response = http_client.post("/deployments/test-deployment/warmup")
+    assert response.status_code == 200
+    assert response.json() == {"name": "test-deployment"}
+    deployment.warmup.assert_awaited_with(None)
+
+    response = http_client.post(
+        "/deployments/test-deployment/warmup", params={"service_id": "TestService"}
+    )
+    assert response.status_code == 200
+    deployment.warmup.assert_awaited_with(["TestService"])
+
+    response = http_client.post(
+        "/deployments/test-deployment/warmup", params={"service_id": "Other"}
+    )
+    assert response.status_code == 404
+
+    deployment.warmup.side_effect = Exception("import failed")
+    response = http_client.post("/deployments/test-deployment/warmup")
+    assert response.status_code == 500
+    assert response.json()["detail"] == "Unable to load services: import failed"
+
+
 @respx.mock
 def test_proxy_successful_html(
     http_client: TestClient, mock_manager: MagicMock
@@ -629,6 +1038,20 @@ def test_proxy_connect_error(http_client: TestClient, mock_manager: MagicMock) -
     assert "server unavailable" in response.json()["detail"].lower()
 
 
+def test_proxy_ui_server_not_started(
+    http_client: TestClient, mock_manager: MagicMock
+) -> None:
+    """Test proxy when a stopped UI server can't be started again."""
+    deployment = mock_manager.get_deployment.return_value
+    deployment.wake_ui_server.side_effect = DeploymentError(
+        "UI server not ready after 60.0 seconds"
+    )
+    response = http_client.get("/deployments/test-deployment/ui/index.html")
+
+    assert response.status_code == 503
+    assert response.json() == {"detail": "UI server not ready after 60.0 seconds"}
+
+
 @respx.mock
 def test_proxy_path_without_trailing_slash(
     http_client: TestClient, mock_manager: MagicMock
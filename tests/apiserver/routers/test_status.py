@@ -5,6 +5,7 @@ import httpx
 from fastapi.testclient import TestClient
 
 from llama_deploy.apiserver.settings import settings
+from llama_deploy.types import DeploymentStatusEnum
 
 
 def test_read_main(http_client: TestClient) -> None:
@@ -18,6 +19,31 @@ def test_read_main(http_client: TestClient) -> None:
     }
 
 
+def test_ready(http_client: TestClient) -> None:
+    with mock.patch("llama_deploy.apiserver.routers.status.manager") as manager:
+        manager.deployment_statuses.return_value = {
+            "fast": DeploymentStatusEnum.READY,
+            "slow": DeploymentStatusEnum.STARTING,
+        }
+        response = http_client.get("/status/ready")
+        assert response.status_code == 200
+        assert response.json() == {
+            "ready": False,
+            "deployments": {"fast": "Ready", "slow": "Starting"},
+        }
+
+        response = http_client.get("/status/ready", params={"deployment_name": "fast"})
+        assert response.status_code == 200
+        assert response.json() == {"ready": True, "deployments": {"fast": "Ready"}}
+
+        response = http_client.get("/status/ready", params={"deployment_name": "slow"})
+        assert response.status_code == 503
+        assert response.json()["detail"] == "Deployment slow: Starting"
+
+        response = http_client.get("/status/ready", params={"deployment_name": "none"})
+        assert response.status_code == 404
+
+
 def test_prom_proxy_off(http_client: TestClient, monkeypatch: Any) -> None:
     monkeypatch.setattr(settings, "prometheus_enabled", False)
     response = http_client.get("/status/metrics/")
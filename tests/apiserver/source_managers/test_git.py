@@ -1,10 +1,12 @@
 from pathlib import Path
+from typing import Generator
 from unittest import mock
 
 import pytest
+from git import Repo
 
 from llama_deploy.apiserver.deployment_config_parser import DeploymentConfig
-from llama_deploy.apiserver.source_managers.git import GitSourceManager
+from llama_deploy.apiserver.source_managers.git import GitSourceManager, sync_repo
 
 
 @pytest.fixture
@@ -30,22 +32,111 @@ def test_sync_wrong_params(config: DeploymentConfig) -> None:
         sm.sync("some_source")
 
 
-def test_sync(config: DeploymentConfig) -> None:
+@pytest.fixture
+def origin(tmp_path: Path) -> Repo:
+    repo = Repo.init(tmp_path / "origin", initial_branch="main")
+    with repo.config_writer() as config:
+        config.set_value("user", "name", "test")
+        config.set_value("user", "email", "test@example.com")
+        config.set_value("uploadpack", "allowFilter", "true")
+    _commit(repo, {"README.md": "readme", "src/app/main.py": "1", "docs/x.md": "x"})
+    return repo
+
+
+@pytest.fixture
+def cache_dir(tmp_path: Path) -> Generator[Path, None, None]:
+    with mock.patch(
+        "llama_deploy.apiserver.source_managers.git.settings"
+    ) as mocked_settings:
+        mocked_settings.cache_dir = tmp_path / "cache"
+        yield mocked_settings.cache_dir
+
+
+def _commit(repo: Repo, files: dict[str, str]) -> str:
+    for name, content in files.items():
+        path = Path(repo.working_dir) / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content)
+    repo.index.add(list(files))
+    return repo.index.commit("commit").hexsha
+
+
+def _url(repo: Repo) -> str:
+    return Path(repo.working_dir).as_uri()
+
+
+def test_sync(config: DeploymentConfig, origin: Repo, cache_dir: Path) -> None:
     sm = GitSourceManager(config)
-    with mock.patch("llama_deploy.apiserver.source_managers.git.Repo") as repo_mock:
-        sm.sync("source", "dest")
-        repo_mock.clone_from.assert_called_with(to_path="dest", url="source")
-        sm.sync("source@branch", "dest")
-        repo_mock.clone_from.assert_called_with(
-            to_path="dest", url="source", multi_options=["-b branch", "--single-branch"]
-        )
+    dest = cache_dir.parent / "dest"
+    commit = sm.sync(_url(origin), str(dest))
+    assert commit == origin.head.commit.hexsha
+    assert (dest / "src/app/main.py").read_text() == "1"
+
+    # Syncing again updates the checkout in place
+    (dest / "leftover.txt").write_text("")
+    _commit(origin, {"src/app/main.py": "2"})
+    sm.sync(_url(origin), str(dest))
+    assert (dest / "src/app/main.py").read_text() == "2"
+    assert not (dest / "leftover.txt").exists()
+    assert len(list((cache_dir / "git").iterdir())) == 1
 
 
-def test_sync_dir_exists(config: DeploymentConfig, tmp_path: Path) -> None:
+def test_sync_refs(config: DeploymentConfig, origin: Repo, cache_dir: Path) -> None:
     sm = GitSourceManager(config)
-    with mock.patch("llama_deploy.apiserver.source_managers.git.Repo"):
-        with mock.patch(
-            "llama_deploy.apiserver.source_managers.git.shutil"
-        ) as shutil_mock:
-            sm.sync("source", str(tmp_path))
-            shutil_mock.rmtree.assert_called_once()
+    dest = cache_dir.parent / "dest"
+    first = origin.head.commit.hexsha
+    origin.create_head("other")
+    _commit(origin, {"src/app/main.py": "2"})
+
+    sm.sync(f"{_url(origin)}@other", str(dest))
+    assert (dest / "src/app/main.py").read_text() == "1"
+    assert sync_repo(_url(origin), None, dest) == origin.head.commit.hexsha
+    assert (dest / "src/app/main.py").read_text() == "2"
+    # Abbreviated SHAs are resolved from the full history
+    assert sync_repo(_url(origin), first[:8], dest) == first
+    assert (dest / "src/app/main.py").read_text() == "1"
+
+
+def test_sync_replaces_existing_dir(
+    config: DeploymentConfig, origin: Repo, cache_dir: Path
+) -> None:
+    sm = GitSourceManager(config)
+    dest = cache_dir.parent / "dest"
+    dest.mkdir()
+    (dest / "old.txt").write_text("")
+    sm.sync(_url(origin), str(dest))
+    assert not (dest / "old.txt").exists()
+    assert (dest / "README.md").exists()
+
+
+def test_sync_sparse(config: DeploymentConfig, origin: Repo, cache_dir: Path) -> None:
+    config.services["test-workflow"].source.location = _url(origin)
+    config.services["test-workflow"].import_path = "src/app/main:workflow"
+    sm = GitSourceManager(config)
+    dest = cache_dir.parent / "dest"
+    sm.sync(_url(origin), str(dest))
+    assert (dest / "README.md").exists()
+    assert (dest / "src/app/main.py").exists()
+    assert not (dest / "docs").exists()
+
+
+def test_sparse_paths(config: DeploymentConfig) -> None:
+    source = "https://example.com/repo.git"
+    service = config.services["test-workflow"]
+    service.source.location = source
+    sm = GitSourceManager(config)
+    assert sm._sparse_paths(source) == ["tests/apiserver/data"]
+    # Other sources need everything
+    assert sm._sparse_paths("other") is None
+
+    service.python_dependencies = ["requirements.txt", "pkgs/a/", "./local_pkg", "x"]
+    service.env_files = ["config/.env"]
+    assert sm._sparse_paths(source) == [
+        "config",
+        "local_pkg",
+        "pkgs",
+        "tests/apiserver/data",
+    ]
+
+    service.python_dependencies = ["."]
+    assert sm._sparse_paths(source) is None
@@ -1,10 +1,17 @@
+import os
+import shutil
 from pathlib import Path
+from typing import Generator
 from unittest import mock
 
 import pytest
 
 from llama_deploy.apiserver.deployment_config_parser import DeploymentConfig
 from llama_deploy.apiserver.source_managers.base import SyncPolicy
+from llama_deploy.apiserver.source_managers.content_store import (
+    ContentStore,
+    file_digest,
+)
 from llama_deploy.apiserver.source_managers.local import LocalSourceManager
 
 
@@ -13,6 +20,32 @@ def config(data_path: Path) -> DeploymentConfig:
     return DeploymentConfig.from_yaml(data_path / "local.yaml")
 
 
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path: Path) -> Generator[Path, None, None]:
+    with mock.patch(
+        "llama_deploy.apiserver.source_managers.local.settings"
+    ) as mocked_settings:
+        mocked_settings.cache_dir = tmp_path / "cache"
+        yield mocked_settings.cache_dir
+
+
+@pytest.fixture
+def no_reflink() -> Generator[None, None, None]:
+    # Files are copied, whatever the filesystem running the tests
+    with mock.patch(
+        "llama_deploy.apiserver.source_managers.content_store._reflink",
+        side_effect=OSError(95, "Operation not supported"),
+    ):
+        yield
+
+
+def _write(root: Path, files: dict[str, str]) -> None:
+    for name, content in files.items():
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content)
+
+
 def test_dest_missing(config: DeploymentConfig) -> None:
     sm = LocalSourceManager(config)
     with pytest.raises(ValueError, match="Destination cannot be empty"):
@@ -22,15 +55,21 @@ def test_dest_missing(config: DeploymentConfig) -> None:
 def test_sync_error(config: DeploymentConfig) -> None:
     sm = LocalSourceManager(config)
     with mock.patch(
-        "llama_deploy.apiserver.source_managers.local.shutil"
-    ) as shutil_mock:
-        shutil_mock.copytree.side_effect = Exception("this was a test")
+        "llama_deploy.apiserver.source_managers.local.sync_tree"
+    ) as sync_tree_mock:
+        sync_tree_mock.side_effect = Exception("this was a test")
         with pytest.raises(
             ValueError, match="Unable to copy source into dest: this was a test"
         ):
             sm.sync("source", "dest")
 
 
+def test_sync_missing_source(config: DeploymentConfig, tmp_path: Path) -> None:
+    sm = LocalSourceManager(config, tmp_path)
+    with pytest.raises(ValueError, match="Unable to copy missing into"):
+        sm.sync("missing", str(tmp_path / "dest"))
+
+
 def test_relative_path(tmp_path: Path, data_path: Path) -> None:
     config = DeploymentConfig.from_yaml(data_path / "local.yaml")
     sm = LocalSourceManager(config, data_path)
@@ -62,17 +101,196 @@ def test_absolute_path(tmp_path: Path, data_path: Path) -> None:
 
 def test_skip(config: DeploymentConfig) -> None:
     with mock.patch(
-        "llama_deploy.apiserver.source_managers.local.shutil"
-    ) as shutil_mock:
+        "llama_deploy.apiserver.source_managers.local.sync_tree"
+    ) as sync_tree_mock:
         sm = LocalSourceManager(config)
-        sm.sync("source", "dest", SyncPolicy.SKIP)
-        shutil_mock.copytree.assert_not_called()
+        assert sm.sync("source", "dest", SyncPolicy.SKIP) is None
+        sync_tree_mock.assert_not_called()
+
+
+def test_replace_incremental(config: DeploymentConfig, tmp_path: Path) -> None:
+    _write(tmp_path / "src", {"a.py": "a", "b.py": "b", "pkg/c.py": "c"})
+    dest = tmp_path / "dest"
+    sm = LocalSourceManager(config, tmp_path)
+    version = sm.sync("src", str(dest))
+    unchanged = (dest / "src" / "a.py").stat().st_ino
+    assert sm.sync("src", str(dest)) == version
+
+    _write(tmp_path / "src", {"b.py": "b2"})
+    (tmp_path / "src" / "pkg" / "c.py").unlink()
+    (tmp_path / "src" / "pkg").rmdir()
+    _write(dest / "src", {"stale.py": "stale"})
+    with mock.patch(
+        "llama_deploy.apiserver.source_managers.content_store.file_digest",
+        wraps=file_digest,
+    ) as digest_mock:
+        assert sm.sync("src", str(dest)) != version
+
+    # Only the changed file was read again
+    digest_mock.assert_called_once_with(tmp_path / "src" / "b.py")
+    assert (dest / "src" / "a.py").stat().st_ino == unchanged
+    assert (dest / "src" / "b.py").read_text() == "b2"
+    assert sorted(p.name for p in (dest / "src").iterdir()) == ["a.py", "b.py"]
+
+
+def test_new_destination(config: DeploymentConfig, tmp_path: Path) -> None:
+    _write(tmp_path / "src", {"a.py": "a", "pkg/b.py": "b"})
+    sm = LocalSourceManager(config, tmp_path)
+    sm.sync("src", str(tmp_path / "v0"))
+
+    # A new version of a deployment reads no file again
+    with mock.patch(
+        "llama_deploy.apiserver.source_managers.content_store.file_digest",
+        wraps=file_digest,
+    ) as digest_mock:
+        sm.sync("src", str(tmp_path / "v1"))
+    digest_mock.assert_not_called()
+    assert (tmp_path / "v1" / "src" / "pkg" / "b.py").read_text() == "b"
+
+
+def test_modified_object_replaced(
+    config: DeploymentConfig, tmp_path: Path, cache_dir: Path
+) -> None:
+    _write(tmp_path / "src", {"a.py": "a"})
+    sm = LocalSourceManager(config, tmp_path)
+    sm.sync("src", str(tmp_path / "v0"))
+    obj = ContentStore(cache_dir / "content").object_path(
+        file_digest(tmp_path / "src" / "a.py")
+    )
+    os.chmod(obj, 0o644)
+    obj.write_text("b")
+
+    sm.sync("src", str(tmp_path / "v1"))
+    assert obj.read_text() == "a"
+    assert (tmp_path / "v1" / "src" / "a.py").read_text() == "a"
+
+
+def test_symlinks(config: DeploymentConfig, tmp_path: Path, cache_dir: Path) -> None:
+    _write(tmp_path / "src", {"a.py": "a"})
+    _write(tmp_path / "outside", {"secret.txt": "secret"})
+    (tmp_path / "src" / "loop").symlink_to("..")
+    (tmp_path / "src" / "b.py").symlink_to("a.py")
+    (tmp_path / "src" / "ext").symlink_to(tmp_path / "outside")
+    dest = tmp_path / "dest" / "src"
+    sm = LocalSourceManager(config, tmp_path)
+    sm.sync("src", str(tmp_path / "dest"))
+
+    # Links are recreated as they are, not followed
+    assert os.readlink(dest / "loop") == ".."
+    assert os.readlink(dest / "b.py") == "a.py"
+    assert os.readlink(dest / "ext") == str(tmp_path / "outside")
+    objects = [p for p in (cache_dir / "content" / "objects").rglob("*") if p.is_file()]
+    assert len(objects) == 1
+
+    (tmp_path / "src" / "b.py").unlink()
+    (tmp_path / "src" / "ext").unlink()
+    sm.sync("src", str(tmp_path / "dest"))
+    assert sorted(p.name for p in dest.iterdir()) == ["a.py", "loop"]
+    assert (tmp_path / "outside" / "secret.txt").exists()
 
 
 def test_merge(config: DeploymentConfig, tmp_path: Path) -> None:
+    _write(tmp_path / "src", {"a.py": "a"})
+    _write(tmp_path / "dest" / "src", {"local.py": "local"})
+    sm = LocalSourceManager(config, tmp_path)
+    sm.sync("src", str(tmp_path / "dest"), SyncPolicy.MERGE)
+
+    assert (tmp_path / "dest" / "src" / "a.py").read_text() == "a"
+    assert (tmp_path / "dest" / "src" / "local.py").read_text() == "local"
+
+
+def test_fail(config: DeploymentConfig, tmp_path: Path) -> None:
+    _write(tmp_path / "src", {"a.py": "a"})
+    sm = LocalSourceManager(config, tmp_path)
+    sm.sync("src", str(tmp_path / "dest"), SyncPolicy.FAIL)
+    assert (tmp_path / "dest" / "src" / "a.py").read_text() == "a"
+
+    with pytest.raises(ValueError, match="Destination exists"):
+        sm.sync("src", str(tmp_path / "dest"), SyncPolicy.FAIL)
+
+
+@pytest.mark.usefixtures("no_reflink")
+def test_dedup(config: DeploymentConfig, tmp_path: Path, cache_dir: Path) -> None:
+    _write(tmp_path / "src", {"a.py": "same"})
+    sm = LocalSourceManager(config, tmp_path)
+    sm.sync("src", str(tmp_path / "one"))
+    sm.sync("src", str(tmp_path / "two"))
+
+    objects = [p for p in (cache_dir / "content" / "objects").rglob("*") if p.is_file()]
+    assert len(objects) == 1
+
+
+@pytest.mark.usefixtures("no_reflink")
+def test_writable(config: DeploymentConfig, tmp_path: Path, cache_dir: Path) -> None:
+    _write(tmp_path / "src", {"a.py": "same", "run.sh": "#!/bin/sh"})
+    os.chmod(tmp_path / "src" / "run.sh", 0o755)
+    sm = LocalSourceManager(config, tmp_path)
+    sm.sync("src", str(tmp_path / "one"))
+    sm.sync("src", str(tmp_path / "two"))
+
+    # Synced files keep the permissions of the source, and can be written, e.g. by a
+    # UI build, without changing the stored file or the other deployments
+    one = tmp_path / "one" / "src" / "a.py"
+    assert (one.stat().st_mode & 0o777) == (
+        (tmp_path / "src" / "a.py").stat().st_mode & 0o777
+    )
+    assert (tmp_path / "one" / "src" / "run.sh").stat().st_mode & 0o777 == 0o755
+    one.write_text("changed")
+    assert (tmp_path / "two" / "src" / "a.py").read_text() == "same"
+    store = ContentStore(cache_dir / "content")
+    assert store.object_path(file_digest(tmp_path / "src" / "a.py")).read_text() == (
+        "same"
+    )
+
+    # Syncing again restores the source content
+    sm.sync("src", str(tmp_path / "one"))
+    assert one.read_text() == "same"
+
+
+def test_reflink(config: DeploymentConfig, tmp_path: Path) -> None:
+    _write(tmp_path / "src", {"a.py": "same"})
+    sm = LocalSourceManager(config, tmp_path)
     with mock.patch(
-        "llama_deploy.apiserver.source_managers.local.shutil"
-    ) as shutil_mock:
-        sm = LocalSourceManager(config)
-        sm.sync("source", str(tmp_path), SyncPolicy.MERGE)
-        shutil_mock.copytree.assert_called_with(mock.ANY, mock.ANY, dirs_exist_ok=True)
+        "llama_deploy.apiserver.source_managers.content_store._reflink",
+        side_effect=shutil.copy2,
+    ) as reflink:
+        sm.sync("src", str(tmp_path / "one"))
+        sm.sync("src", str(tmp_path / "two"))
+        # Unchanged clones aren't cloned again
+        sm.sync("src", str(tmp_path / "one"))
+    assert reflink.call_count == 2
+
+    one = tmp_path / "one" / "src" / "a.py"
+    assert not os.path.samefile(one, tmp_path / "two" / "src" / "a.py")
+    assert one.read_text() == "same"
+
+
+def test_collect_garbage(
+    config: DeploymentConfig, tmp_path: Path, cache_dir: Path
+) -> None:
+    _write(tmp_path / "src", {"a.py": "a"})
+    _write(tmp_path / "other", {"b.py": "b"})
+    sm = LocalSourceManager(config, tmp_path)
+    sm.sync("src", str(tmp_path / "one"))
+    sm.sync("other", str(tmp_path / "two"))
+    store = ContentStore(cache_dir / "content")
+
+    # Recently stored files are kept
+    assert store.collect_garbage() == 0
+    unused = store.object_path(file_digest(tmp_path / "other" / "b.py"))
+    shutil.rmtree(tmp_path / "other")
+    assert store.collect_garbage(grace_period=0) == 1
+    assert store.object_path(file_digest(tmp_path / "src" / "a.py")).exists()
+    assert not unused.exists()
+    assert len(list((cache_dir / "content" / "manifests").iterdir())) == 1
+
+
+@pytest.mark.usefixtures("no_reflink")
+def test_link_fallback(config: DeploymentConfig, tmp_path: Path) -> None:
+    _write(tmp_path / "src", {"a.py": "a"})
+    sm = LocalSourceManager(config, tmp_path)
+    sm.sync("src", str(tmp_path / "dest"))
+
+    # Copied, never hardlinked to the stored file
+    assert (tmp_path / "dest" / "src" / "a.py").read_text() == "a"
+    assert (tmp_path / "dest" / "src" / "a.py").stat().st_nlink == 1
@@ -0,0 +1,210 @@
+import asyncio
+
+import pytest
+
+from llama_deploy.apiserver.admission import AdmissionController, AdmissionRejected
+from llama_deploy.apiserver.deployment_config_parser import OverflowPolicy
+from llama_deploy.types import TaskPriority
+
+
+@pytest.mark.asyncio
+async def test_unlimited() -> None:
+    controller = AdmissionController("deployment", "service")
+    for _ in range(100):
+        await controller.acquire()
+    assert controller.running == 100
+    assert controller.queued == 0
+
+
+@pytest.mark.asyncio
+async def test_reject() -> None:
+    controller = AdmissionController(
+        "deployment",
+        "service",
+        max_concurrency=2,
+        overflow_policy=OverflowPolicy.reject,
+    )
+    await controller.acquire()
+    await controller.acquire()
+    with pytest.raises(AdmissionRejected, match="Service at capacity") as exc_info:
+        await controller.acquire()
+    assert exc_info.value.retry_after == 1
+
+    controller.release()
+    await controller.acquire()
+    assert controller.running == 2
+
+
+@pytest.mark.asyncio
+async def test_queue_fifo() -> None:
+    controller = AdmissionController("deployment", "service", max_concurrency=1)
+    await controller.acquire()
+
+    admitted: list[int] = []
+
+    async def task(i: int) -> None:
+        await controller.acquire()
+        admitted.append(i)
+
+    tasks = [asyncio.create_task(task(i)) for i in range(3)]
+    await asyncio.sleep(0)
+    assert controller.queued == 3
+
+    for _ in range(3):
+        controller.release()
+        await asyncio.sleep(0)
+    await asyncio.gather(*tasks)
+
+    assert admitted == [0, 1, 2]
+    # The slot is handed over, never freed
+    assert controller.running == 1
+    assert controller.queued == 0
+
+
+@pytest.mark.asyncio
+async def test_queue_full() -> None:
+    controller = AdmissionController(
+        "deployment", "service", max_concurrency=1, max_queue_size=1
+    )
+    await controller.acquire()
+    waiter = asyncio.create_task(controller.acquire())
+    await asyncio.sleep(0)
+
+    with pytest.raises(AdmissionRejected, match="Service queue is full"):
+        await controller.acquire()
+
+    controller.release()
+    await waiter
+    assert controller.running == 1
+
+
+@pytest.mark.asyncio
+async def test_queue_timeout() -> None:
+    controller = AdmissionController(
+        "deployment", "service", max_concurrency=1, queue_timeout=0.01
+    )
+    await controller.acquire()
+
+    with pytest.raises(AdmissionRejected, match="Timed out") as exc_info:
+        await controller.acquire()
+    assert exc_info.value.retry_after == 0.01
+    assert controller.queued == 0
+
+    controller.release()
+    assert controller.running == 0
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter() -> None:
+    controller = AdmissionController("deployment", "service", max_concurrency=1)
+    await controller.acquire()
+    waiter = asyncio.create_task(controller.acquire())
+    await asyncio.sleep(0)
+
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    assert controller.queued == 0
+
+    # The slot isn't handed over to the cancelled waiter
+    controller.release()
+    assert controller.running == 0
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_released_before_waking() -> None:
+    controller = AdmissionController("deployment", "service", max_concurrency=1)
+    await controller.acquire()
+    waiter = asyncio.create_task(controller.acquire())
+    await asyncio.sleep(0)
+
+    # The slot is released before the cancelled waiter gets to run
+    waiter.cancel()
+    controller.release()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    assert controller.queued == 0
+    assert controller.running == 0
+
+
+@pytest.mark.asyncio
+async def test_drain() -> None:
+    controller = AdmissionController("deployment", "service", max_concurrency=1)
+    await controller.drain()
+
+    await controller.acquire()
+    waiter = asyncio.create_task(controller.acquire())
+    drain = asyncio.create_task(controller.drain())
+    await asyncio.sleep(0)
+
+    # The slot is handed over to the waiter, the controller is still busy
+    controller.release()
+    await waiter
+    assert not drain.done()
+
+    controller.release()
+    await asyncio.wait_for(drain, timeout=1)
+
+
+async def _admission_order(
+    controller: AdmissionController, tasks: list[tuple[TaskPriority, str | None]]
+) -> list[tuple[TaskPriority, str | None]]:
+    """Queues `tasks` in order on a busy controller, returns the order they're admitted."""
+    admitted: list[tuple[TaskPriority, str | None]] = []
+
+    async def task(priority: TaskPriority, tenant_id: str | None) -> None:
+        await controller.acquire(priority, tenant_id)
+        admitted.append((priority, tenant_id))
+
+    runs = [asyncio.create_task(task(*t)) for t in tasks]
+    await asyncio.sleep(0)
+    for _ in tasks:
+        controller.release()
+        await asyncio.sleep(0)
+    await asyncio.gather(*runs)
+    return admitted
+
+
+@pytest.mark.asyncio
+async def test_queue_priorities() -> None:
+    controller = AdmissionController("deployment", "service", max_concurrency=1)
+    await controller.acquire()
+
+    tasks = [(TaskPriority.LOW, None)] * 3 + [(TaskPriority.HIGH, None)] * 12
+    admitted = await _admission_order(controller, tasks)
+
+    # Low priority tasks get one slot out of nine, then the rest once high ones are done
+    low = [i for i, (p, _) in enumerate(admitted) if p == TaskPriority.LOW]
+    assert low == [4, 13, 14]
+
+
+@pytest.mark.asyncio
+async def test_queue_tenants() -> None:
+    controller = AdmissionController("deployment", "service", max_concurrency=1)
+    await controller.acquire()
+
+    tasks = [(TaskPriority.NORMAL, "bulk")] * 3 + [(TaskPriority.NORMAL, "chat")] * 2
+    admitted = await _admission_order(controller, tasks)
+
+    assert [t for _, t in admitted] == ["bulk", "chat", "bulk", "chat", "bulk"]
+
+
+@pytest.mark.asyncio
+async def test_queue_starvation_timeout() -> None:
+    controller = AdmissionController(
+        "deployment", "service", max_concurrency=1, starvation_timeout=0.01
+    )
+    await controller.acquire()
+    low = asyncio.create_task(controller.acquire(TaskPriority.LOW))
+    await asyncio.sleep(0.02)
+    high = asyncio.create_task(controller.acquire(TaskPriority.HIGH))
+    await asyncio.sleep(0)
+
+    # The low priority task waited for too long, it goes first
+    controller.release()
+    await asyncio.sleep(0)
+    assert low.done()
+    assert not high.done()
+
+    controller.release()
+    await high
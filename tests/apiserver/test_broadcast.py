@@ -0,0 +1,89 @@
+import asyncio
+from typing import Any, AsyncGenerator
+
+import pytest
+from workflows.events import Event
+
+from llama_deploy.apiserver.broadcast import EventBroadcaster
+
+
+class QueueHandler:
+    """A fake workflow handler streaming the events put in a queue."""
+
+    def __init__(self) -> None:
+        self.queue: asyncio.Queue[Event | None] = asyncio.Queue()
+        self.error: Exception | None = None
+        self.stream_calls = 0
+
+    async def stream_events(self) -> AsyncGenerator[Event, None]:
+        self.stream_calls += 1
+        while True:
+            ev = await self.queue.get()
+            if ev is None:
+                break
+            yield ev
+
+    def __await__(self) -> Any:
+        async def await_impl() -> str:
+            if self.error:
+                raise self.error
+            return "done"
+
+        return await_impl().__await__()
+
+
+async def _collect(broadcaster: EventBroadcaster, offset: int = 0) -> list[Any]:
+    return [(o, ev.msg) async for o, ev in broadcaster.subscribe(offset)]
+
+
+@pytest.mark.asyncio
+async def test_broadcast_multiple_subscribers() -> None:
+    handler = QueueHandler()
+    broadcaster = EventBroadcaster(handler)  # type: ignore
+
+    first = asyncio.create_task(_collect(broadcaster))
+    second = asyncio.create_task(_collect(broadcaster))
+    for i in range(3):
+        await handler.queue.put(Event(msg=f"event {i}"))
+    await handler.queue.put(None)
+
+    expected = [(0, "event 0"), (1, "event 1"), (2, "event 2")]
+    assert await first == expected
+    assert await second == expected
+    # The handler stream was consumed only once
+    assert handler.stream_calls == 1
+
+    # Late subscribers get the replay
+    assert await _collect(broadcaster) == expected
+    assert await _collect(broadcaster, offset=2) == [(2, "event 2")]
+
+
+@pytest.mark.asyncio
+async def test_broadcast_replay_buffer_is_bounded() -> None:
+    handler = QueueHandler()
+    broadcaster = EventBroadcaster(handler, replay_size=2)  # type: ignore
+    for i in range(4):
+        await handler.queue.put(Event(msg=f"event {i}"))
+    await handler.queue.put(None)
+
+    # Drain the handler stream
+    await _collect(broadcaster)
+    assert broadcaster.first_offset == 2
+    assert broadcaster.next_offset == 4
+    # Events older than the buffer are lost for late subscribers
+    assert await _collect(broadcaster) == [(2, "event 2"), (3, "event 3")]
+
+
+@pytest.mark.asyncio
+async def test_broadcast_error() -> None:
+    handler = QueueHandler()
+    handler.error = ValueError("workflow failed")
+    broadcaster = EventBroadcaster(handler)  # type: ignore
+    await handler.queue.put(Event(msg="event 0"))
+    await handler.queue.put(None)
+
+    received = []
+    with pytest.raises(ValueError, match="workflow failed"):
+        async for _, ev in broadcaster.subscribe():
+            received.append(ev.msg)
+    assert received == ["event 0"]
@@ -18,6 +18,14 @@ def do_assert(config: DeploymentConfig) -> None:
     assert len(wf_config.python_dependencies) == 3
     assert wf_config.env == {"VAR_1": "x", "VAR_2": "y"}
     assert wf_config.env_files == ["./.env"]
+    assert wf_config.max_concurrency == 4
+    assert wf_config.max_queue_size == 10
+    assert wf_config.overflow_policy == "queue"
+    assert wf_config.queue_timeout == 30
+    assert wf_config.deterministic
+    assert wf_config.cache
+    assert wf_config.cache.max_size == 500
+    assert wf_config.cache.ttl == 3600
 
     wf_config = config.services["another-workflow"]
     assert wf_config.name == "My LITS Workflow"
@@ -29,6 +37,9 @@ def do_assert(config: DeploymentConfig) -> None:
     assert wf_config.ts_dependencies
     assert len(wf_config.ts_dependencies) == 2
     assert wf_config.ts_dependencies["@llamaindex/core"] == "^0.2.0"
+    assert wf_config.max_concurrency is None
+    assert not wf_config.deterministic
+    assert wf_config.cache is None
 
 
 def test_load_config_file(data_path: Path) -> None:
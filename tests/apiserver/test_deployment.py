@@ -1,30 +1,46 @@
 import asyncio
 import json
+import shutil
 import subprocess
 import sys
+import threading
+import time
 from collections.abc import Generator
 from copy import deepcopy
 from pathlib import Path
 from typing import Any
 from unittest import mock
 
+import httpx
 import pytest
-from workflows import Context, Workflow
+import respx
+from workflows import Context, Workflow, step
+from workflows.events import StartEvent, StopEvent
 from workflows.handler import WorkflowHandler
 
+from llama_deploy.apiserver.admission import AdmissionRejected
 from llama_deploy.apiserver.deployment import (
     SOURCE_MANAGERS,
     Deployment,
     DeploymentError,
     Manager,
+    _environment_id,
+    _install_lock,
+    _install_prefix,
 )
 from llama_deploy.apiserver.deployment_config_parser import (
     DeploymentConfig,
+    Service,
     ServiceSource,
     SourceType,
     SyncPolicy,
     UIService,
 )
+from llama_deploy.apiserver.result_cache import CacheMode
+from llama_deploy.apiserver.settings import settings
+from llama_deploy.apiserver.stats import ui_cold_starts
+from llama_deploy.apiserver.worker_pool import RemoteContext
+from llama_deploy.types import DeploymentStatusEnum, TaskStatus
 
 
 @pytest.fixture
@@ -49,65 +65,207 @@ def mock_local_source_manager() -> Generator[mock.MagicMock, Any, None]:
     SOURCE_MANAGERS[SourceType.local] = original
 
 
-def test_deployment_ctor(data_path: Path, mock_importlib: Any, tmp_path: Path) -> None:
+def test_deployment_ctor(data_path: Path, tmp_path: Path) -> None:
     config = DeploymentConfig.from_yaml(data_path / "git_service.yaml")
+    d = Deployment(config=config, base_path=data_path, deployment_path=tmp_path)
+
+    assert d.name == "TestDeployment"
+    assert d._deployment_path.name == "TestDeployment"
+    # Services are loaded by start()
+    assert d.service_names == []
+    assert d.client is not None
+
+
+@pytest.mark.asyncio
+async def test_load_services(
+    data_path: Path, mock_importlib: Any, tmp_path: Path
+) -> None:
+    config = DeploymentConfig.from_yaml(data_path / "git_service.yaml")
+    d = Deployment(config=config, base_path=data_path, deployment_path=tmp_path)
     with mock.patch("llama_deploy.apiserver.deployment.SOURCE_MANAGERS") as sm_dict:
         sm_dict["git"] = mock.MagicMock()
-        d = Deployment(config=config, base_path=data_path, deployment_path=tmp_path)
+        await d.start()
 
         sm_dict["git"].return_value.sync.assert_called_once()
-        assert d.name == "TestDeployment"
-        assert d._deployment_path.name == "TestDeployment"
         assert len(d._workflow_services) == 1
         assert d.service_names == ["test-workflow"]
-        assert d.client is not None
         assert d.default_service == "test-workflow"
 
 
-def test_deployment_ctor_missing_service_path(data_path: Path, tmp_path: Path) -> None:
+@pytest.mark.asyncio
+async def test_load_services_missing_service_path(
+    data_path: Path, tmp_path: Path
+) -> None:
     config = DeploymentConfig.from_yaml(data_path / "git_service.yaml")
     config.services["test-workflow"].import_path = None
+    d = Deployment(config=config, base_path=data_path, deployment_path=tmp_path)
     with pytest.raises(
         ValueError, match="path field in service definition must be set"
     ):
-        Deployment(config=config, base_path=data_path, deployment_path=tmp_path)
+        await d.start()
 
 
-def test_deployment_ctor_skip_default_service(
+@pytest.mark.asyncio
+async def test_load_services_syncs_each_source_once(
     data_path: Path, mock_importlib: Any, tmp_path: Path
 ) -> None:
     config = DeploymentConfig.from_yaml(data_path / "git_service.yaml")
     config.services["test-workflow2"] = deepcopy(config.services["test-workflow"])
+    d = Deployment(config=config, base_path=data_path, deployment_path=tmp_path)
 
     with mock.patch("llama_deploy.apiserver.deployment.SOURCE_MANAGERS") as sm_dict:
         sm_dict["git"] = mock.MagicMock()
-        d = Deployment(config=config, base_path=data_path, deployment_path=tmp_path)
+        await d.start()
         assert len(d._workflow_services) == 2
+        # Both services come from the same repository
+        sm_dict["git"].return_value.sync.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_load_services_syncs_concurrently(
+    data_path: Path, mock_importlib: Any, tmp_path: Path
+) -> None:
+    config = DeploymentConfig.from_yaml(data_path / "local.yaml")
+    for location in ("other", "workflow/nested"):
+        service = deepcopy(config.services["test-workflow"])
+        service.source = ServiceSource(type=SourceType.local, location=location)
+        config.services[location] = service
+    d = Deployment(config=config, base_path=data_path, deployment_path=tmp_path)
+
+    # Sources in separate folders sync at the same time
+    barrier = threading.Barrier(2, timeout=5)
+    order: list[str] = []
+
+    def sync(source: str, *args: Any) -> None:
+        if source != "workflow/nested":
+            barrier.wait()
+        order.append(source)
+
+    with mock.patch("llama_deploy.apiserver.deployment.SOURCE_MANAGERS") as sm_dict:
+        sm_dict["local"] = mock.MagicMock()
+        sm_dict["local"].return_value.relative_path.side_effect = lambda s: s
+        sm_dict["local"].return_value.sync.side_effect = sync
+        synced: dict = {}
+        await d._load_services(config, tmp_path, synced)
+
+    # Nested sources wait for the enclosing one
+    assert order.index("workflow/nested") > order.index("workflow")
+    assert sorted(location for _, location in synced) == [
+        "other",
+        "workflow",
+        "workflow/nested",
+    ]
 
 
-def test_deployment_ctor_invalid_default_service(
+@pytest.mark.asyncio
+async def test_load_services_invalid_default_service(
     data_path: Path, mock_importlib: Any, caplog: Any, tmp_path: Path
 ) -> None:
     config = DeploymentConfig.from_yaml(data_path / "local.yaml")
     config.default_service = "does-not-exist"
 
-    Deployment(config=config, base_path=data_path, deployment_path=tmp_path)
+    d = Deployment(config=config, base_path=data_path, deployment_path=tmp_path)
+    await d.start()
     assert (
         "Service with id 'does-not-exist' does not exist, cannot set it as default."
         in caplog.text
     )
 
 
-def test_deployment_ctor_default_service(
+@pytest.mark.asyncio
+async def test_load_services_default_service(
     data_path: Path, mock_importlib: Any, tmp_path: Path
 ) -> None:
     config = DeploymentConfig.from_yaml(data_path / "local.yaml")
     config.default_service = "test-workflow"
 
     d = Deployment(config=config, base_path=data_path, deployment_path=tmp_path)
+    await d.start()
     assert d.default_service == "test-workflow"
 
 
+def test__install_dependencies_cached(data_path: Path, tmp_path: Path) -> None:
+    config = DeploymentConfig.from_yaml(data_path / "python_dependencies.yaml")
+    service_config = config.services["myworkflow"]
+    with (
+        mock.patch("llama_deploy.apiserver.deployment.settings") as mocked_settings,
+        mock.patch.object(Deployment, "_install_dependencies") as mocked_install,
+        mock.patch(
+            "llama_deploy.apiserver.deployment._environment_id", return_value="env"
+        ) as environment_id,
+    ):
+        mocked_settings.cache_dir = tmp_path
+        Deployment._install_dependencies_cached(service_config, data_path)
+        Deployment._install_dependencies_cached(service_config, data_path)
+        mocked_install.assert_called_once_with(service_config, data_path, None)
+
+        # The environment was recreated
+        environment_id.return_value = "new"
+        Deployment._install_dependencies_cached(service_config, data_path)
+        assert mocked_install.call_count == 2
+
+        # A different set of dependencies is installed
+        service_config.python_dependencies = ["llama-index-core<1"]
+        Deployment._install_dependencies_cached(service_config, data_path)
+        assert mocked_install.call_count == 3
+
+        # Another install into the same environment holds the lock past the deadline
+        service_config.python_dependencies = ["llama-index-core<2"]
+        with _install_lock(_install_prefix()):
+            with pytest.raises(DeploymentError, match="still running"):
+                Deployment._install_dependencies_cached(
+                    service_config, data_path, time.monotonic() + 0.01
+                )
+        assert mocked_install.call_count == 3
+
+        # Installs into other environments don't wait
+        with _install_lock("/other/prefix"):
+            Deployment._install_dependencies_cached(service_config, data_path)
+        assert mocked_install.call_count == 4
+
+
+def test__environment_id(tmp_path: Path) -> None:
+    with mock.patch(
+        "llama_deploy.apiserver.deployment.sysconfig.get_paths",
+        return_value={"purelib": str(tmp_path)},
+    ):
+        environment_id = _environment_id()
+        assert environment_id
+        assert _environment_id() == environment_id
+
+        # A recreated environment gets a new id
+        (tmp_path / ".llama_deploy_environment").unlink()
+        assert _environment_id() != environment_id
+
+
+def test__install_dependencies_timeout(data_path: Path) -> None:
+    config = DeploymentConfig.from_yaml(data_path / "python_dependencies.yaml")
+    service_config = config.services["myworkflow"]
+    with mock.patch(
+        "llama_deploy.apiserver.deployment.subprocess.check_call",
+        side_effect=[0, subprocess.TimeoutExpired(["uv"], 1)],
+    ) as check_call:
+        with pytest.raises(DeploymentError, match="Timed out installing"):
+            Deployment._install_dependencies(
+                service_config, data_path, time.monotonic() + 1
+            )
+    # The install is killed at the deadline
+    assert 0 < check_call.call_args.kwargs["timeout"] <= 1
+
+
+@mock.patch("llama_deploy.apiserver.deployment._environment_id", return_value="env")
+def test__dependencies_hash(environment_id: Any, tmp_path: Path) -> None:
+    requirements = tmp_path / "requirements.txt"
+    requirements.write_text("foo")
+    args = ["-r", str(requirements)]
+    digest = Deployment._dependencies_hash(args)
+    assert Deployment._dependencies_hash(args) == digest
+
+    # Changes to the requirements file invalidate the hash
+    requirements.write_text("foo\nbar")
+    assert Deployment._dependencies_hash(args) != digest
+
+
 def test__install_dependencies(data_path: Path) -> None:
     config = DeploymentConfig.from_yaml(data_path / "python_dependencies.yaml")
     service_config = config.services["myworkflow"]
@@ -487,11 +645,86 @@ async def test_manager_deploy(data_path: Path) -> None:
         m._deployments_path = Path()
         await m.deploy(config, base_path=str(data_path))
         mocked_deployment.assert_called_once()
+        # Deployments share the executor of the manager
+        assert mocked_deployment.call_args.kwargs["executor"] is m._executor
         mocked_deployment.return_value.start.assert_awaited_once()
         assert m.deployment_names == ["TestDeployment"]
         assert m.get_deployment("TestDeployment") is not None
 
 
+@pytest.mark.asyncio
+async def test_manager_deploy_many(data_path: Path) -> None:
+    configs = []
+    for name in ("slow", "broken", "fast"):
+        config = DeploymentConfig.from_yaml(data_path / "git_service.yaml")
+        config.name = name
+        configs.append(config)
+    started = asyncio.Event()
+    release = asyncio.Event()
+
+    async def start(self: Deployment) -> None:
+        if self.name == "broken":
+            raise DeploymentError("install failed")
+        if self.name == "slow":
+            started.set()
+            await release.wait()
+        self._ready = True
+
+    m = Manager()
+    m._serving = True
+    m._deployments_path = Path()
+    with mock.patch.object(Deployment, "start", start):
+        task = asyncio.create_task(m.deploy_many(configs, "", max_concurrency=2))
+        await started.wait()
+        await asyncio.sleep(0)
+
+        # One slow deployment doesn't hold back the others
+        assert m.deployment_statuses() == {
+            "slow": DeploymentStatusEnum.STARTING,
+            "broken": DeploymentStatusEnum.FAILED,
+            "fast": DeploymentStatusEnum.READY,
+        }
+
+        release.set()
+        await task
+    assert m.deployment_statuses()["slow"] == DeploymentStatusEnum.READY
+    assert m.deployment_names == ["slow", "fast"]
+
+
+@pytest.mark.asyncio
+async def test_manager_deploy_many_concurrency(data_path: Path) -> None:
+    configs = []
+    for name in ("a", "b", "c"):
+        config = DeploymentConfig.from_yaml(data_path / "git_service.yaml")
+        config.name = name
+        configs.append(config)
+    started: list[str] = []
+    two_started = asyncio.Event()
+    release = asyncio.Event()
+
+    async def start(self: Deployment) -> None:
+        started.append(self.name)
+        if len(started) == 2:
+            two_started.set()
+        await release.wait()
+
+    m = Manager()
+    m._serving = True
+    m._deployments_path = Path()
+    with mock.patch.object(Deployment, "start", start):
+        task = asyncio.create_task(m.deploy_many(configs, "", max_concurrency=2))
+        await two_started.wait()
+        await asyncio.sleep(0)
+        assert m.deployment_statuses() == {
+            "a": DeploymentStatusEnum.STARTING,
+            "b": DeploymentStatusEnum.STARTING,
+            "c": DeploymentStatusEnum.PENDING,
+        }
+        release.set()
+        await task
+    assert started == ["a", "b", "c"]
+
+
 @pytest.mark.asyncio
 async def test_manager_serve_loop(tmp_path: Path) -> None:
     m = Manager()
@@ -589,6 +822,8 @@ async def test_start_ui_server_success(data_path: Path, tmp_path: Path) -> None:
 
         # Verify source manager was used correctly
         source_manager_mock.sync.assert_called_once()
+        # Verify the UI proxy connection pool was opened
+        assert deployment._ui_client is not None
 
         # Verify npm commands were executed
         assert mock_subprocess.call_count == 2
@@ -658,7 +893,7 @@ async def test_start_ui_server_uses_merge_sync_policy(
     # Patch subprocess and os
     mock_subprocess = mock.AsyncMock()
     with mock.patch("asyncio.create_subprocess_exec", mock_subprocess):
-        mock_subprocess.return_value.wait = mock.AsyncMock()
+        mock_subprocess.return_value.wait = mock.AsyncMock(return_value=0)
         mock_subprocess.return_value.pid = 1234
 
         deployment = Deployment(
@@ -673,7 +908,7 @@ async def test_start_ui_server_uses_merge_sync_policy(
         # The third argument is the policy
         assert args[2] == SyncPolicy.MERGE
         # verify that the relative path was used for the commands
-        installed_path = tmp_path / "test-deployment" / "some/location"
+        installed_path = tmp_path / "test-deployment" / "v0" / "some/location"
         # The first call to create_subprocess_exec should be for "pnpm", "install"
         install_call = mock_subprocess.call_args_list[0]
         assert install_call.args[:2] == ("pnpm", "install")
@@ -754,7 +989,8 @@ async def test_run_workflow_with_session_id(
     mock_workflow.run.assert_awaited_once_with(context=mock_context, **test_kwargs)
 
 
-def test_run_workflow_no_wait_without_session_id(
+@pytest.mark.asyncio
+async def test_run_workflow_no_wait_without_session_id(
     deployment_config: DeploymentConfig, tmp_path: Path
 ) -> None:
     """Test run_workflow_no_wait without session_id."""
@@ -778,7 +1014,7 @@ def test_run_workflow_no_wait_without_session_id(
     ) as mock_generate_id:
         mock_generate_id.side_effect = ["session_456", "handler_123"]
 
-        handler_id, session_id = deployment.run_workflow_no_wait(
+        handler_id, session_id = await deployment.run_workflow_no_wait(
             "test_service",
             None,
             **test_kwargs,  # type:ignore
@@ -793,7 +1029,8 @@ def test_run_workflow_no_wait_without_session_id(
         mock_workflow.run.assert_called_once_with(**test_kwargs)
 
 
-def test_run_workflow_no_wait_with_session_id(
+@pytest.mark.asyncio
+async def test_run_workflow_no_wait_with_session_id(
     deployment_config: DeploymentConfig, tmp_path: Path
 ) -> None:
     """Test run_workflow_no_wait with existing session_id."""
@@ -817,7 +1054,7 @@ def test_run_workflow_no_wait_with_session_id(
     ) as mock_generate_id:
         mock_generate_id.return_value = "handler_789"
 
-        handler_id, session_id = deployment.run_workflow_no_wait(
+        handler_id, session_id = await deployment.run_workflow_no_wait(
             "test_service",
             "existing_session",
             **test_kwargs,  # type:ignore
@@ -834,7 +1071,8 @@ def test_run_workflow_no_wait_with_session_id(
         mock_workflow.run.assert_called_once_with(context=mock_context, **test_kwargs)
 
 
-def test_run_workflow_no_wait_empty_kwargs(
+@pytest.mark.asyncio
+async def test_run_workflow_no_wait_empty_kwargs(
     deployment_config: DeploymentConfig, tmp_path: Path
 ) -> None:
     """Test run_workflow_no_wait with empty run_kwargs."""
@@ -856,7 +1094,7 @@ def test_run_workflow_no_wait_empty_kwargs(
     ) as mock_generate_id:
         mock_generate_id.side_effect = ["session_empty", "handler_empty"]
 
-        handler_id, session_id = deployment.run_workflow_no_wait("test_service")
+        handler_id, session_id = await deployment.run_workflow_no_wait("test_service")
 
         assert handler_id == "handler_empty"
         assert session_id == "session_empty"
@@ -882,7 +1120,8 @@ async def test_run_workflow_service_not_found(
         await deployment.run_workflow("nonexistent_service")
 
 
-def test_run_workflow_no_wait_service_not_found(
+@pytest.mark.asyncio
+async def test_run_workflow_no_wait_service_not_found(
     deployment_config: DeploymentConfig, tmp_path: Path
 ) -> None:
     """Test run_workflow_no_wait raises KeyError when service not found."""
@@ -893,7 +1132,7 @@ def test_run_workflow_no_wait_service_not_found(
     deployment._workflow_services = {}
 
     with pytest.raises(KeyError):
-        deployment.run_workflow_no_wait("nonexistent_service")
+        await deployment.run_workflow_no_wait("nonexistent_service")
 
 
 @pytest.mark.asyncio
@@ -913,3 +1152,1045 @@ async def test_run_workflow_session_not_found(
 
     with pytest.raises(KeyError):
         await deployment.run_workflow("test_service", "nonexistent_session")
+
+
+@pytest.mark.asyncio
+async def test_run_workflow_no_wait_evicts_completed_handlers(
+    deployment_config: DeploymentConfig, tmp_path: Path
+) -> None:
+    """Test completed handlers are evicted along with their inputs once the limit is reached."""
+    with mock.patch("llama_deploy.apiserver.deployment.settings") as mocked_settings:
+        mocked_settings.max_handlers = 1
+        mocked_settings.handler_ttl = None
+        mocked_settings.max_sessions = None
+        mocked_settings.session_ttl = None
+        mocked_settings.max_results = None
+        mocked_settings.result_store_path = None
+        mocked_settings.session_store_path = None
+        mocked_settings.executor_max_workers = 1
+        deployment = Deployment(
+            config=deployment_config, base_path=Path(), deployment_path=tmp_path
+        )
+
+    mock_workflow = mock.MagicMock(spec=Workflow)
+    deployment._workflow_services = {"test_service": mock_workflow}
+
+    done_handler = mock.MagicMock(spec=WorkflowHandler)
+    done_handler.done.return_value = True
+    mock_workflow.run.return_value = done_handler
+    first_id, _ = await deployment.run_workflow_no_wait("test_service")
+
+    running_handler = mock.MagicMock(spec=WorkflowHandler)
+    running_handler.done.return_value = False
+    mock_workflow.run.return_value = running_handler
+    second_id, _ = await deployment.run_workflow_no_wait("test_service")
+
+    assert first_id not in deployment._handlers
+    assert first_id not in deployment._handler_inputs
+    assert deployment._handlers[second_id] == running_handler
+
+
+@pytest.mark.asyncio
+async def test_run_workflow_no_wait_admission(tmp_path: Path) -> None:
+    """Test tasks beyond the service concurrency limit are rejected until a slot frees up."""
+    config = DeploymentConfig.model_validate(
+        {
+            "name": "test-deployment",
+            "services": {
+                "test_service": {
+                    "name": "Test",
+                    "source": {"type": "local", "location": "."},
+                    "max-concurrency": 1,
+                    "overflow-policy": "reject",
+                }
+            },
+        }
+    )
+    with mock.patch.object(Deployment, "_load_services", return_value={}):
+        deployment = Deployment(
+            config=config, base_path=Path(), deployment_path=tmp_path
+        )
+    handler: WorkflowHandler = WorkflowHandler(ctx=mock.MagicMock(spec=Context))
+    mock_workflow = mock.MagicMock(spec=Workflow)
+    mock_workflow.run.return_value = handler
+    deployment._workflow_services = {"test_service": mock_workflow}
+
+    await deployment.run_workflow_no_wait("test_service")
+    with pytest.raises(AdmissionRejected):
+        await deployment.run_workflow_no_wait("test_service")
+    with pytest.raises(AdmissionRejected):
+        await deployment.run_workflow("test_service")
+
+    handler.set_result("done")
+    await asyncio.sleep(0)
+    mock_workflow.run.return_value = WorkflowHandler(ctx=mock.MagicMock(spec=Context))
+    await deployment.run_workflow_no_wait("test_service")
+
+
+@pytest.mark.asyncio
+async def test_run_workflow_no_wait_pending(tmp_path: Path) -> None:
+    """Test tasks waiting in the service queue are returned right away as pending."""
+    config = DeploymentConfig.model_validate(
+        {
+            "name": "test-deployment",
+            "services": {
+                "test_service": {
+                    "name": "Test",
+                    "source": {"type": "local", "location": "."},
+                    "max-concurrency": 1,
+                    "queue-timeout": 0.05,
+                }
+            },
+        }
+    )
+    with mock.patch.object(Deployment, "_load_services", return_value={}):
+        deployment = Deployment(
+            config=config, base_path=Path(), deployment_path=tmp_path
+        )
+    running: WorkflowHandler = WorkflowHandler(ctx=mock.MagicMock(spec=Context))
+    mock_workflow = mock.MagicMock(spec=Workflow)
+    mock_workflow.run.return_value = running
+    deployment._workflow_services = {"test_service": mock_workflow}
+    await deployment.run_workflow_no_wait("test_service")
+
+    # Rejected while queued
+    timed_out, _ = await deployment.run_workflow_no_wait("test_service")
+    assert (await deployment.get_task_result(timed_out)).status == TaskStatus.PENDING
+    result = await deployment.get_task_result(timed_out, wait=1)
+    assert result.status == TaskStatus.FAILED
+    assert result.data == {"error": "Timed out waiting in the service queue"}
+
+    # Cancelled while queued
+    cancelled, _ = await deployment.run_workflow_no_wait("test_service")
+    result = await deployment.cancel_task(cancelled)
+    assert result.status == TaskStatus.CANCELLED
+    assert deployment._admission_controller("test_service").queued == 0
+
+    # Started once admitted, in the session returned upfront
+    handler: WorkflowHandler = WorkflowHandler(ctx=mock.MagicMock(spec=Context))
+    mock_workflow.run.return_value = handler
+    handler_id, session_id = await deployment.run_workflow_no_wait("test_service")
+    assert mock_workflow.run.call_count == 1
+    running.set_result("done")
+    assert await deployment.get_session(session_id) is handler.ctx
+    assert deployment._handlers[handler_id] is handler
+    assert (await deployment.get_task_result(handler_id)).status == TaskStatus.RUNNING
+
+
+@pytest.mark.asyncio
+async def test_run_workflow_no_wait_worker_pool(tmp_path: Path) -> None:
+    """Test tasks of services with workers are sent to the worker pool."""
+    config = DeploymentConfig.model_validate(
+        {
+            "name": "test-deployment",
+            "services": {
+                "test_service": {
+                    "name": "Test",
+                    "source": {"type": "local", "location": "."},
+                    "import-path": "src/workflow:my_workflow",
+                    "workers": 2,
+                }
+            },
+        }
+    )
+    with mock.patch.object(Deployment, "_load_services", return_value={}):
+        deployment = Deployment(
+            config=config, base_path=Path(), deployment_path=tmp_path, local=True
+        )
+    pool = deployment._worker_pools["test_service"]
+    assert pool.size == 2
+    assert pool._pythonpath == (tmp_path / "src").resolve()
+    assert pool._import_path == "workflow:my_workflow"
+
+    deployment._workflow_services = {"test_service": mock.MagicMock(spec=Workflow)}
+    handler: WorkflowHandler = WorkflowHandler()
+    with mock.patch.object(pool, "run", return_value=handler) as mock_run:
+        handler_id, session_id = await deployment.run_workflow_no_wait(
+            "test_service", input="foo"
+        )
+        mock_run.assert_awaited_once_with(handler_id, session_id, {"input": "foo"})
+    assert isinstance(deployment._contexts[session_id], RemoteContext)
+    assert deployment._handlers[handler_id] is handler
+
+    session_id = await deployment.create_session("test_service")
+    assert isinstance(deployment._contexts[session_id], RemoteContext)
+
+
+@pytest.mark.asyncio
+async def test_ui_client_lifecycle(
+    deployment_config: DeploymentConfig, tmp_path: Path
+) -> None:
+    """Test the UI proxy connection pool is reused and closed with the UI server."""
+    deployment = Deployment(
+        config=deployment_config, base_path=Path(), deployment_path=tmp_path
+    )
+    process = mock.MagicMock()
+    deployment._ui_server_process = process
+
+    client = deployment.ui_client
+    assert deployment.ui_client is client
+
+    await deployment._stop_ui_server()
+    assert client.is_closed
+    process.terminate.assert_called_once()
+    assert deployment.ui_client is not client
+
+
+@pytest.mark.asyncio
+async def test_subscribe_events(
+    deployment_config: DeploymentConfig, tmp_path: Path
+) -> None:
+    """Test subscribers of the same task share one broadcaster."""
+    deployment = Deployment(
+        config=deployment_config, base_path=Path(), deployment_path=tmp_path
+    )
+    with pytest.raises(KeyError):
+        deployment.subscribe_events("nonexistent_task")
+
+    deployment._handlers["task"] = mock.MagicMock(spec=WorkflowHandler)
+    first = deployment.subscribe_events("task")
+    second = deployment.subscribe_events("task", offset=3)
+    assert len(deployment._broadcasters) == 1
+    await first.aclose()
+    await second.aclose()
+
+    del deployment._handlers["task"]
+    deployment._on_handler_evicted("task", mock.MagicMock())
+    assert deployment._broadcasters == {}
+
+
+@pytest.mark.asyncio
+async def test_get_task_result(
+    deployment_config: DeploymentConfig, tmp_path: Path
+) -> None:
+    """Test task results are returned without blocking and outlive their handler."""
+    deployment = Deployment(
+        config=deployment_config, base_path=Path(), deployment_path=tmp_path
+    )
+    handler: WorkflowHandler = WorkflowHandler(ctx=mock.MagicMock(spec=Context))
+    mock_workflow = mock.MagicMock(spec=Workflow)
+    mock_workflow.run.return_value = handler
+    deployment._workflow_services = {"test_service": mock_workflow}
+    handler_id, _ = await deployment.run_workflow_no_wait("test_service")
+
+    result = await deployment.get_task_result(handler_id)
+    assert result.status == TaskStatus.RUNNING
+    assert result.result is None
+
+    result = await deployment.get_task_result(handler_id, wait=0.01)
+    assert result.status == TaskStatus.RUNNING
+
+    asyncio.get_running_loop().call_later(0.01, handler.set_result, "done!")
+    result = await deployment.get_task_result(handler_id, wait=5)
+    assert result.status == TaskStatus.DONE
+    assert result.result == "done!"
+
+    # Let the done callbacks run, then evict the handler
+    await asyncio.sleep(0)
+    del deployment._handlers[handler_id]
+    result = await deployment.get_task_result(handler_id)
+    assert result.result == "done!"
+
+    with pytest.raises(KeyError):
+        await deployment.get_task_result("nonexistent_task")
+
+
+@pytest.mark.asyncio
+async def test_get_task_result_failed(
+    deployment_config: DeploymentConfig, tmp_path: Path
+) -> None:
+    deployment = Deployment(
+        config=deployment_config, base_path=Path(), deployment_path=tmp_path
+    )
+    handler: WorkflowHandler = WorkflowHandler()
+    handler.set_exception(ValueError("boom"))
+    deployment._handlers["task"] = handler
+
+    result = await deployment.get_task_result("task")
+    assert result.status == TaskStatus.FAILED
+    assert result.data == {"error": "boom"}
+
+
+@pytest.mark.asyncio
+async def test_reload(data_path: Path, mock_importlib: Any, tmp_path: Path) -> None:
+    config = DeploymentConfig.from_yaml(data_path / "with_ui.yaml")
+    deployment = Deployment(
+        config=config, base_path=data_path, deployment_path=tmp_path
+    )
+    old_process = mock.MagicMock(returncode=None)
+    deployment._ui_server_process = old_process
+    old_pool = mock.AsyncMock()
+    deployment._worker_pools = {"test-workflow": old_pool}
+    old_admission = deployment._admission_controller("test-workflow")
+    await old_admission.acquire()
+    old_cache = mock.MagicMock()
+    deployment._result_caches = {"test-workflow": old_cache}
+    deployment._contexts["session"] = RemoteContext(old_pool, "session")
+    old_path = deployment._version_path
+    old_path.mkdir(parents=True)
+
+    new_config = deepcopy(config)
+    new_config.default_service = "test-workflow"
+    new_process = mock.MagicMock(returncode=None)
+    with (
+        mock.patch("llama_deploy.apiserver.deployment.settings") as mocked_settings,
+        mock.patch.object(
+            deployment, "_spawn_ui_server", return_value=new_process
+        ) as spawn,
+        mock.patch.object(deployment, "_wait_ui_ready") as wait_ui_ready,
+    ):
+        mocked_settings.reload_drain_timeout = 5
+        mocked_settings.ui_idle_timeout = None
+        await deployment.reload(new_config)
+
+        # The new version serves requests right away, from its own folder
+        port = spawn.call_args.args[1]
+        assert spawn.call_args.args[2] == deployment._version_path != old_path
+        wait_ui_ready.assert_awaited_once_with(new_process, port)
+        assert deployment.ui_port == port != config.ui.port  # type: ignore
+        assert deployment._ui_server_process is new_process
+        assert deployment._config is new_config
+        assert deployment.default_service == "test-workflow"
+        assert deployment._admission_controller("test-workflow") is not old_admission
+
+        # The previous version is stopped once its tasks are done
+        await asyncio.sleep(0)
+        old_pool.close.assert_not_awaited()
+        old_process.terminate.assert_not_called()
+        old_cache.close.assert_not_called()
+        old_admission.release()
+        await asyncio.gather(*deployment._drain_tasks)
+        old_pool.close.assert_awaited_once()
+        old_process.terminate.assert_called_once()
+        old_cache.close.assert_called_once()
+        new_process.terminate.assert_not_called()
+        assert not old_path.exists()
+        # Sessions of the worker processes are gone with them
+        assert "session" not in deployment._contexts
+
+
+@pytest.mark.asyncio
+async def test_reload_drain_timeout(
+    data_path: Path, mock_importlib: Any, tmp_path: Path
+) -> None:
+    config = DeploymentConfig.from_yaml(data_path / "local.yaml")
+    deployment = Deployment(
+        config=config, base_path=data_path, deployment_path=tmp_path
+    )
+    old_pool = mock.AsyncMock()
+    deployment._worker_pools = {"test-workflow": old_pool}
+    await deployment._admission_controller("test-workflow").acquire()
+
+    with mock.patch("llama_deploy.apiserver.deployment.settings") as mocked_settings:
+        mocked_settings.reload_drain_timeout = 0.01
+        await deployment.reload(config)
+        await asyncio.gather(*deployment._drain_tasks)
+
+    old_pool.close.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_reload_changed_source(tmp_path: Path) -> None:
+    source = tmp_path / "project" / "src"
+    source.mkdir(parents=True)
+    workflow_code = """
+from workflows import Workflow, step
+from workflows.events import StartEvent, StopEvent
+
+class ReloadWorkflow(Workflow):
+    @step
+    async def answer(self, ev: StartEvent) -> StopEvent:
+        return StopEvent(result="{result}")
+
+workflow = ReloadWorkflow()
+"""
+    (source / "reload_wf.py").write_text(workflow_code.format(result="v0"))
+    config = DeploymentConfig(
+        name="reloaded",
+        services={
+            "svc": Service(
+                name="svc",
+                source=ServiceSource(type=SourceType.local, location="src"),
+                import_path="src/reload_wf:workflow",
+            )
+        },
+    )
+    deployment = Deployment(
+        config=config,
+        base_path=tmp_path / "project",
+        deployment_path=tmp_path / "deployments",
+    )
+    try:
+        with mock.patch.object(settings, "cache_path", tmp_path / "cache"):
+            await deployment.start()
+            assert await deployment.run_workflow("svc") == "v0"
+            old_path = deployment._version_path
+
+            (source / "reload_wf.py").write_text(workflow_code.format(result="v1"))
+            await deployment.reload(deepcopy(config))
+            assert await deployment.run_workflow("svc") == "v1"
+            # The new version is imported from its own folder
+            module_file = Path(sys.modules["reload_wf"].__file__ or "")
+            assert module_file.is_relative_to(deployment._version_path.resolve())
+            await asyncio.gather(*deployment._drain_tasks)
+    finally:
+        sys.modules.pop("reload_wf", None)
+        root = str((tmp_path / "deployments").resolve())
+        sys.path[:] = [p for p in sys.path if not p.startswith(root)]
+
+    # The previous version is gone once drained
+    assert not old_path.exists()
+    assert module_file.exists()
+
+
+@pytest.mark.asyncio
+async def test_reload_ui_not_ready(
+    data_path: Path, mock_importlib: Any, tmp_path: Path
+) -> None:
+    config = DeploymentConfig.from_yaml(data_path / "with_ui.yaml")
+    deployment = Deployment(
+        config=config, base_path=data_path, deployment_path=tmp_path
+    )
+    old_process = mock.MagicMock(returncode=None)
+    deployment._ui_server_process = old_process
+    deployment._ui_port = 3000
+
+    new_process = mock.MagicMock(returncode=1)
+    with mock.patch.object(deployment, "_spawn_ui_server", return_value=new_process):
+        with pytest.raises(DeploymentError, match="UI server exited with code 1"):
+            await deployment.reload(deepcopy(config))
+
+    # The current version keeps serving requests
+    new_process.terminate.assert_called_once()
+    assert deployment._ui_server_process is old_process
+    assert deployment.ui_port == 3000
+    assert deployment._config is config
+    assert not deployment._drain_tasks
+
+
+@respx.mock
+@pytest.mark.asyncio
+async def test_wait_ui_ready(
+    deployment_config: DeploymentConfig, tmp_path: Path
+) -> None:
+    deployment = Deployment(
+        config=deployment_config, base_path=Path(), deployment_path=tmp_path
+    )
+    route = respx.get("http://localhost:4000/deployments/test-deployment/ui")
+    route.side_effect = [httpx.ConnectError("not yet"), httpx.Response(200)]
+    process = mock.MagicMock(returncode=None)
+
+    with mock.patch("llama_deploy.apiserver.deployment.asyncio.sleep") as sleep:
+        await deployment._wait_ui_ready(process, 4000)
+
+    assert route.call_count == 2
+    sleep.assert_awaited_once()
+    await deployment._stop_ui_server()
+
+
+@pytest.mark.asyncio
+async def test_start_lazy(data_path: Path, mock_importlib: Any, tmp_path: Path) -> None:
+    config = DeploymentConfig.from_yaml(data_path / "git_service.yaml")
+    config.services["test-workflow2"] = deepcopy(config.services["test-workflow"])
+    d = Deployment(config=config, base_path=data_path, deployment_path=tmp_path)
+
+    with (
+        mock.patch.object(settings, "lazy_load_services", True),
+        mock.patch("llama_deploy.apiserver.deployment.SOURCE_MANAGERS") as sm_dict,
+        mock.patch.object(d, "_load_service", wraps=d._load_service) as load_service,
+    ):
+        sm_dict["git"] = mock.MagicMock()
+        await d.start()
+
+        # Services are registered but not loaded
+        assert d.service_names == ["test-workflow", "test-workflow2"]
+        assert d.default_service == "test-workflow"
+        sm_dict["git"].return_value.sync.assert_not_called()
+        assert d._workflow_services == {}
+
+        # Concurrent first requests share one load
+        workflows = await asyncio.gather(
+            d._get_workflow("test-workflow"), d._get_workflow("test-workflow")
+        )
+        assert workflows[0] is workflows[1]
+        load_service.assert_awaited_once()
+        sm_dict["git"].return_value.sync.assert_called_once()
+
+        # The source is synced once for all the services using it
+        await d.warmup()
+        assert set(d._workflow_services) == {"test-workflow", "test-workflow2"}
+        sm_dict["git"].return_value.sync.assert_called_once()
+
+        with pytest.raises(KeyError):
+            await d.warmup(["does-not-exist"])
+
+
+@pytest.mark.asyncio
+async def test_start_lazy_load_error(
+    data_path: Path, mock_importlib: Any, tmp_path: Path
+) -> None:
+    config = DeploymentConfig.from_yaml(data_path / "git_service.yaml")
+    d = Deployment(config=config, base_path=data_path, deployment_path=tmp_path)
+
+    with (
+        mock.patch.object(settings, "lazy_load_services", True),
+        mock.patch("llama_deploy.apiserver.deployment.SOURCE_MANAGERS") as sm_dict,
+    ):
+        sm_dict["git"] = mock.MagicMock()
+        sm_dict["git"].return_value.sync.side_effect = [Exception("network"), None]
+        await d.start()
+
+        with pytest.raises(Exception, match="network"):
+            await d.run_workflow("test-workflow")
+        assert not d._service_loads
+
+        # The next request loads the service again
+        assert await d.run_workflow("test-workflow") == "Hello, world!"
+
+
+class SessionWorkflow(Workflow):
+    @step
+    async def noop(self, ev: StartEvent) -> StopEvent:
+        return StopEvent()
+
+
+@pytest.mark.asyncio
+async def test_idle_session_stored_and_restored(
+    deployment_config: DeploymentConfig, tmp_path: Path
+) -> None:
+    """Test idle sessions are moved to the session store and restored on their next use."""
+    with mock.patch(
+        "llama_deploy.apiserver.deployment.settings.session_store_path",
+        tmp_path / "sessions.db",
+    ):
+        deployment = Deployment(
+            config=deployment_config, base_path=Path(), deployment_path=tmp_path
+        )
+    workflow = SessionWorkflow()
+
+    def idle() -> None:
+        with mock.patch.object(deployment._contexts, "_ttl", 0):
+            deployment._contexts.expire()
+
+    deployment._workflow_services = {"test_service": workflow}
+
+    session_id = await deployment.create_session("test_service")
+    context = deployment._contexts[session_id]
+    assert isinstance(context, Context)
+    await context.store.set("runs", 1)
+
+    idle()
+    assert session_id not in deployment._contexts
+    await deployment.flush_state()
+    assert deployment._sessions is not None
+    assert deployment._sessions.get(session_id) is not None
+
+    # The session state survives the round trip
+    restored = await deployment.get_session(session_id, "test_service")
+    assert isinstance(restored, Context)
+    assert await restored.store.get("runs") == 1
+    assert deployment._contexts[session_id] is restored
+    await deployment.flush_state()
+    assert deployment._sessions.get(session_id) is None
+
+    idle()
+    with mock.patch.object(workflow, "run", mock.AsyncMock(return_value="ok")):
+        assert await deployment.run_workflow("test_service", session_id) == "ok"
+        context = deployment._contexts[session_id]
+        workflow.run.assert_awaited_once_with(context=context)  # type: ignore
+    assert await context.store.get("runs") == 1
+
+    idle()
+    await deployment.delete_session(session_id)
+    assert deployment._sessions.get(session_id) is None
+    with pytest.raises(KeyError):
+        await deployment.delete_session(session_id)
+    with pytest.raises(KeyError):
+        await deployment.get_session(session_id, "test_service")
+
+
+@pytest.mark.asyncio
+async def test_idle_sessions_stored_in_batches(
+    deployment_config: DeploymentConfig, tmp_path: Path
+) -> None:
+    """Test idle sessions are moved to the session store on a timer, in one write."""
+    with mock.patch(
+        "llama_deploy.apiserver.deployment.settings.session_store_path",
+        tmp_path / "sessions.db",
+    ):
+        deployment = Deployment(
+            config=deployment_config, base_path=Path(), deployment_path=tmp_path
+        )
+    deployment._workflow_services = {"test_service": SessionWorkflow()}
+    session_ids = [await deployment.create_session("test_service") for _ in range(3)]
+    assert deployment._sessions is not None
+
+    with (
+        mock.patch.object(deployment._contexts, "_ttl", 0),
+        mock.patch.object(deployment._sessions, "put_many") as put_many,
+        mock.patch(
+            "llama_deploy.apiserver.deployment._SESSION_IDLE_CHECK_INTERVAL", 0.01
+        ),
+    ):
+        deployment._watch_idle_sessions()
+        await asyncio.sleep(0.05)
+        await deployment.flush_state()
+    assert deployment._session_idle_task is not None
+    deployment._session_idle_task.cancel()
+
+    assert not deployment._contexts
+    put_many.assert_called_once()
+    assert list(put_many.call_args.args[0]) == session_ids
+
+
+@pytest.mark.asyncio
+async def test_running_session_not_stored(
+    deployment_config: DeploymentConfig, tmp_path: Path
+) -> None:
+    """Test sessions with a running workflow stay in memory."""
+    with mock.patch(
+        "llama_deploy.apiserver.deployment.settings.session_store_path",
+        tmp_path / "sessions.db",
+    ):
+        deployment = Deployment(
+            config=deployment_config, base_path=Path(), deployment_path=tmp_path
+        )
+    running = mock.MagicMock(spec=Context)
+    running.is_running = True
+    deployment._contexts["running"] = running
+    deployment._contexts._ttl = 0
+    deployment._contexts.expire()
+
+    assert "running" in deployment._contexts
+
+
+class SlowWorkflow(Workflow):
+    @step
+    async def slow(self, ev: StartEvent) -> StopEvent:
+        await asyncio.sleep(30)
+        return StopEvent(result="done")
+
+
+@pytest.mark.asyncio
+async def test_run_workflow_timeout(
+    deployment_config: DeploymentConfig, tmp_path: Path
+) -> None:
+    """Test workflows exceeding the task timeout are cancelled."""
+    deployment = Deployment(
+        config=deployment_config, base_path=Path(), deployment_path=tmp_path
+    )
+    deployment._workflow_services = {"test_service": SlowWorkflow(timeout=None)}
+
+    with pytest.raises(TimeoutError, match="Task timed out after 0.05 seconds"):
+        await deployment.run_workflow("test_service", task_timeout=0.05)
+
+    # The slot is released
+    assert deployment._admission_controller("test_service").running == 0
+
+
+@pytest.mark.asyncio
+async def test_run_workflow_cancelled(
+    deployment_config: DeploymentConfig, tmp_path: Path
+) -> None:
+    """Test the workflow is stopped when the caller gives up."""
+    deployment = Deployment(
+        config=deployment_config, base_path=Path(), deployment_path=tmp_path
+    )
+    future: asyncio.Future = asyncio.get_running_loop().create_future()
+    mock_workflow = mock.MagicMock(spec=Workflow)
+    mock_workflow.run.return_value = future
+    deployment._workflow_services = {"test_service": mock_workflow}
+
+    with mock.patch.object(Deployment, "_stop_task") as stop_task:
+        run = asyncio.create_task(deployment.run_workflow("test_service"))
+        await asyncio.sleep(0)
+        run.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await run
+
+    stop_task.assert_awaited_once_with(future)
+    assert deployment._admission_controller("test_service").running == 0
+
+
+@pytest.mark.asyncio
+async def test_cancel_task(deployment_config: DeploymentConfig, tmp_path: Path) -> None:
+    """Test cancelled tasks stop and are recorded as cancelled."""
+    deployment = Deployment(
+        config=deployment_config, base_path=Path(), deployment_path=tmp_path
+    )
+    deployment._workflow_services = {"test_service": SlowWorkflow(timeout=None)}
+    handler_id, _ = await deployment.run_workflow_no_wait("test_service")
+    await asyncio.sleep(0.01)
+
+    result = await deployment.cancel_task(handler_id)
+    assert result.status == TaskStatus.CANCELLED
+    assert result.data == {"error": "Task was cancelled"}
+    await asyncio.sleep(0)
+    assert deployment._admission_controller("test_service").running == 0
+    stored = deployment._results.get(handler_id)
+    assert stored is not None
+    assert stored.status == TaskStatus.CANCELLED
+
+    # Finished tasks are left untouched
+    assert (await deployment.cancel_task(handler_id)) == result
+    with pytest.raises(KeyError):
+        await deployment.cancel_task("unknown")
+
+
+@pytest.mark.asyncio
+async def test_run_workflow_no_wait_timeout(
+    deployment_config: DeploymentConfig, tmp_path: Path
+) -> None:
+    """Test tasks exceeding their timeout are cancelled."""
+    deployment = Deployment(
+        config=deployment_config, base_path=Path(), deployment_path=tmp_path
+    )
+    deployment._workflow_services = {"test_service": SlowWorkflow(timeout=None)}
+    handler_id, _ = await deployment.run_workflow_no_wait(
+        "test_service", task_timeout=0.05
+    )
+
+    result = await deployment.get_task_result(handler_id, wait=5)
+    assert result.status == TaskStatus.CANCELLED
+    assert result.data == {"error": "Task timed out after 0.05 seconds"}
+
+
+class EchoWorkflow(Workflow):
+    runs = 0
+
+    @step
+    async def echo(self, ev: StartEvent) -> StopEvent:
+        EchoWorkflow.runs += 1
+        return StopEvent(result=ev.get("text"))
+
+
+@pytest.mark.asyncio
+async def test_run_workflow_result_cache(tmp_path: Path) -> None:
+    """Test tasks of services with a result cache run once for the same input."""
+    config = DeploymentConfig.model_validate(
+        {
+            "name": "test-deployment",
+            "services": {
+                "test_service": {
+                    "name": "Test",
+                    "source": {"type": "local", "location": "."},
+                    "cache": True,
+                }
+            },
+        }
+    )
+    with mock.patch.object(Deployment, "_load_services", return_value={}):
+        deployment = Deployment(
+            config=config, base_path=Path(), deployment_path=tmp_path
+        )
+    deployment._workflow_services = {"test_service": EchoWorkflow()}
+    EchoWorkflow.runs = 0
+
+    # Results aren't cached until the version of the source is known
+    assert await deployment.run_workflow("test_service", text="hi") == "hi"
+    assert EchoWorkflow.runs == 1
+
+    deployment._synced_sources = {(SourceType.local, "."): "digest"}
+    assert await deployment.run_workflow("test_service", text="hi") == "hi"
+    assert await deployment.run_workflow("test_service", text="hi") == "hi"
+    assert EchoWorkflow.runs == 2
+
+    # A new version of the source invalidates the results
+    deployment._synced_sources = {(SourceType.local, "."): "new-digest"}
+    assert await deployment.run_workflow("test_service", text="hi") == "hi"
+    assert await deployment.run_workflow("test_service", text="hi") == "hi"
+    assert EchoWorkflow.runs == 3
+    assert await deployment.run_workflow("test_service", text="ho") == "ho"
+    assert EchoWorkflow.runs == 4
+
+    # Bypassing or refreshing the cache runs the workflow
+    await deployment.run_workflow(
+        "test_service", cache_mode=CacheMode.bypass, text="hi"
+    )
+    await deployment.run_workflow(
+        "test_service", cache_mode=CacheMode.refresh, text="hi"
+    )
+    assert EchoWorkflow.runs == 6
+
+
+@pytest.mark.asyncio
+async def test_run_workflow_persistent_result_cache(tmp_path: Path) -> None:
+    """Test persistent result caches are used off the event loop."""
+    config = DeploymentConfig.model_validate(
+        {
+            "name": "test-deployment",
+            "services": {
+                "test_service": {
+                    "name": "Test",
+                    "source": {"type": "local", "location": "."},
+                    "cache": {"path": str(tmp_path / "results.db")},
+                }
+            },
+        }
+    )
+    with mock.patch.object(Deployment, "_load_services", return_value={}):
+        deployment = Deployment(
+            config=config, base_path=Path(), deployment_path=tmp_path
+        )
+    deployment._workflow_services = {"test_service": EchoWorkflow()}
+    deployment._synced_sources = {(SourceType.local, "."): "digest"}
+    EchoWorkflow.runs = 0
+
+    with mock.patch.object(
+        deployment._executor, "run", wraps=deployment._executor.run
+    ) as run:
+        assert await deployment.run_workflow("test_service", text="hi") == "hi"
+        assert await deployment.run_workflow("test_service", text="hi") == "hi"
+    assert EchoWorkflow.runs == 1
+    operations = [c.args[0] for c in run.call_args_list]
+    assert operations == ["result_cache"] * 3
+    deployment._result_caches["test_service"].close()
+
+
+class GatedWorkflow(Workflow):
+    runs = 0
+    gate: asyncio.Event
+
+    @step
+    async def wait(self, ev: StartEvent) -> StopEvent:
+        GatedWorkflow.runs += 1
+        await GatedWorkflow.gate.wait()
+        return StopEvent(result=ev.get("text"))
+
+
+@pytest.fixture
+def deterministic_deployment(tmp_path: Path) -> Deployment:
+    config = DeploymentConfig.model_validate(
+        {
+            "name": "test-deployment",
+            "services": {
+                "test_service": {
+                    "name": "Test",
+                    "source": {"type": "local", "location": "."},
+                    "deterministic": True,
+                }
+            },
+        }
+    )
+    with mock.patch.object(Deployment, "_load_services", return_value={}):
+        deployment = Deployment(
+            config=config, base_path=Path(), deployment_path=tmp_path
+        )
+    deployment._workflow_services = {"test_service": GatedWorkflow(timeout=None)}
+    GatedWorkflow.runs = 0
+    GatedWorkflow.gate = asyncio.Event()
+    return deployment
+
+
+@pytest.mark.asyncio
+async def test_run_workflow_coalesced(deterministic_deployment: Deployment) -> None:
+    """Test identical tasks of deterministic services share the same workflow run."""
+    deployment = deterministic_deployment
+    runs = [
+        asyncio.create_task(deployment.run_workflow("test_service", text=text))
+        for text in ("hi", "hi", "hi", "ho")
+    ]
+    await asyncio.sleep(0.05)
+    assert GatedWorkflow.runs == 2
+
+    GatedWorkflow.gate.set()
+    assert await asyncio.gather(*runs) == ["hi", "hi", "hi", "ho"]
+    assert deployment._inflight == {}
+
+    # Tasks in a session aren't coalesced
+    session_id = await deployment.create_session("test_service")
+    await asyncio.gather(
+        deployment.run_workflow("test_service", text="hi"),
+        deployment.run_workflow("test_service", session_id=session_id, text="hi"),
+    )
+    assert GatedWorkflow.runs == 4
+
+
+@pytest.mark.asyncio
+async def test_run_workflow_coalesced_timeout(
+    deterministic_deployment: Deployment,
+) -> None:
+    """Test callers of a coalesced task time out on their own."""
+    deployment = deterministic_deployment
+    leader = asyncio.create_task(deployment.run_workflow("test_service", text="hi"))
+    await asyncio.sleep(0.01)
+
+    with pytest.raises(TimeoutError, match="Task timed out after 0.05 seconds"):
+        await deployment.run_workflow("test_service", task_timeout=0.05, text="hi")
+    assert not leader.done()
+
+    # The workflow is stopped once all the callers gave up
+    leader.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await leader
+    assert deployment._inflight == {}
+    assert deployment._admission_controller("test_service").running == 0
+    assert GatedWorkflow.runs == 1
+
+
+@pytest.mark.asyncio
+async def test_ui_server_hibernation(data_path: Path, tmp_path: Path) -> None:
+    """Test idle UI servers are stopped and started again by the next request."""
+    config = DeploymentConfig.from_yaml(data_path / "with_ui.yaml")
+    deployment = Deployment(
+        config=config, base_path=data_path, deployment_path=tmp_path
+    )
+    process = mock.MagicMock(returncode=None)
+    process.wait = mock.AsyncMock(return_value=0)
+    deployment._ui_server_process = process
+    deployment._ui_port = 3000
+
+    with mock.patch("llama_deploy.apiserver.deployment._UI_IDLE_CHECK_INTERVAL", 0.01):
+        watcher = asyncio.create_task(deployment._hibernate_idle_ui_server(0.05))
+        # Open connections keep the UI server awake
+        with deployment.ui_connection():
+            await asyncio.sleep(0.1)
+        process.terminate.assert_not_called()
+
+        await asyncio.sleep(0.1)
+    process.terminate.assert_called_once()
+    assert deployment._ui_server_process is None
+
+    cold_starts = ui_cold_starts.labels("test-deployment")._value.get()
+    new_process = mock.MagicMock(returncode=None)
+    with (
+        mock.patch.object(
+            deployment, "_run_ui_server", return_value=new_process
+        ) as run_ui_server,
+        mock.patch.object(deployment, "_wait_ui_ready") as wait_ui_ready,
+    ):
+        ports = await asyncio.gather(
+            deployment.wake_ui_server(), deployment.wake_ui_server()
+        )
+
+    assert ports == [3000, 3000]
+    run_ui_server.assert_awaited_once()
+    wait_ui_ready.assert_awaited_once_with(new_process, 3000)
+    assert deployment._ui_server_process is new_process
+    assert ui_cold_starts.labels("test-deployment")._value.get() == cold_starts + 1
+
+    watcher.cancel()
+    await deployment._stop_ui_server()
+
+
+@pytest.mark.asyncio
+async def test_ui_server_wake_during_hibernation(
+    data_path: Path, tmp_path: Path
+) -> None:
+    """Test requests arriving while the UI server stops wait for a new one."""
+    config = DeploymentConfig.from_yaml(data_path / "with_ui.yaml")
+    deployment = Deployment(
+        config=config, base_path=data_path, deployment_path=tmp_path
+    )
+    exited = asyncio.Event()
+    process = mock.MagicMock(returncode=None)
+    process.wait = mock.AsyncMock(side_effect=exited.wait)
+    deployment._ui_server_process = process
+    deployment._ui_port = 3000
+    deployment._ui_last_active = time.monotonic() - 1
+
+    with mock.patch("llama_deploy.apiserver.deployment._UI_IDLE_CHECK_INTERVAL", 0.01):
+        watcher = asyncio.create_task(deployment._hibernate_idle_ui_server(0.05))
+        await asyncio.sleep(0.05)
+    process.terminate.assert_called_once()
+    # Not hibernated until the process exited
+    assert not deployment._ui_hibernated
+
+    new_process = mock.MagicMock(returncode=None)
+    with (
+        mock.patch.object(
+            deployment, "_run_ui_server", return_value=new_process
+        ) as run_ui_server,
+        mock.patch.object(deployment, "_wait_ui_ready"),
+    ):
+        wake = asyncio.create_task(deployment.wake_ui_server())
+        await asyncio.sleep(0.01)
+        assert not wake.done()
+        exited.set()
+        assert await wake == 3000
+
+    run_ui_server.assert_awaited_once()
+    assert deployment._ui_server_process is new_process
+    assert not deployment._ui_hibernated
+
+    watcher.cancel()
+    await deployment._stop_ui_server()
+
+
+@pytest.mark.asyncio
+async def test_ui_server_production_build_cache(
+    deployment_config: DeploymentConfig,
+    tmp_path: Path,
+    mock_local_source_manager: mock.MagicMock,
+) -> None:
+    """Test production builds of the UI are reused when the sources didn't change."""
+    deployment_config.ui = UIService.model_validate(
+        {
+            "name": "test-ui",
+            "source": {"type": "local", "location": "ui"},
+            "mode": "production",
+        }
+    )
+    mock_local_source_manager.relative_path.return_value = "ui"
+    deployment = Deployment(
+        config=deployment_config, base_path=Path(), deployment_path=tmp_path
+    )
+    ui_path = tmp_path / "test-deployment" / "v0" / "ui"
+    ui_path.mkdir(parents=True)
+    (ui_path / "package.json").write_text("{}")
+
+    async def create_subprocess_exec(*args: str, **kwargs: Any) -> mock.MagicMock:
+        if args[:2] == ("pnpm", "install"):
+            (ui_path / "node_modules" / "next").mkdir(parents=True, exist_ok=True)
+        elif args[:3] == ("pnpm", "run", "build"):
+            (ui_path / ".next").mkdir(exist_ok=True)
+            (ui_path / ".next" / "BUILD_ID").write_text("1")
+        process = mock.MagicMock()
+        process.wait = mock.AsyncMock(return_value=0)
+        return process
+
+    with (
+        mock.patch.object(settings, "cache_path", tmp_path / "cache"),
+        mock.patch(
+            "llama_deploy.apiserver.deployment.asyncio.create_subprocess_exec",
+            side_effect=create_subprocess_exec,
+        ) as mock_subprocess,
+    ):
+        await deployment._install_ui_server(deployment_config, deployment._version_path)
+        assert [c.args for c in mock_subprocess.call_args_list] == [
+            ("pnpm", "install"),
+            ("pnpm", "run", "build"),
+        ]
+        env = mock_subprocess.call_args.kwargs["env"]
+        assert env["LLAMA_DEPLOY_NEXTJS_BASE_PATH"] == "/deployments/test-deployment/ui"
+
+        # Nothing changed, the build is reused
+        mock_subprocess.reset_mock()
+        await deployment._install_ui_server(deployment_config, deployment._version_path)
+        mock_subprocess.assert_not_called()
+
+        # The build lives in the cache, out of the synced sources
+        assert (ui_path / ".next").is_symlink()
+        assert (ui_path / "node_modules").is_symlink()
+
+        # The source folder was replaced, the build is linked again
+        shutil.rmtree(ui_path)
+        ui_path.mkdir()
+        (ui_path / "package.json").write_text("{}")
+        await deployment._install_ui_server(deployment_config, deployment._version_path)
+        mock_subprocess.assert_not_called()
+        assert (ui_path / ".next" / "BUILD_ID").read_text() == "1"
+        assert (ui_path / "node_modules" / "next").is_dir()
+
+        # The sources changed, the UI is built again
+        (ui_path / "package.json").write_text('{"name": "ui"}')
+        await deployment._install_ui_server(deployment_config, deployment._version_path)
+        assert mock_subprocess.call_count == 2
+        # The previous build is left untouched
+        builds = sorted((tmp_path / "cache" / "ui").iterdir())
+        assert len(builds) == 2
+        assert [(b / "node_modules" / "next").is_dir() for b in builds] == [True, True]
+
+        await deployment._run_ui_server(deployment_config, ui_path, 3000)
+        assert mock_subprocess.call_args.args == ("pnpm", "run", "start")
+        assert mock_subprocess.call_args.kwargs["env"]["PORT"] == "3000"
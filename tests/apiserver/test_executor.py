@@ -0,0 +1,81 @@
+import asyncio
+import contextvars
+import threading
+
+import pytest
+
+from llama_deploy.apiserver.executor import BlockingExecutor
+from llama_deploy.apiserver.stats import executor_queue_depth, executor_timeouts
+
+request_id: contextvars.ContextVar[str] = contextvars.ContextVar("request_id")
+
+
+def _metric(metric: object, operation: str) -> float:
+    return metric.labels(operation)._value.get()  # type: ignore
+
+
+@pytest.mark.asyncio
+async def test_run() -> None:
+    executor = BlockingExecutor(max_workers=2)
+    request_id.set("abc")
+
+    def work(a: int, b: int) -> tuple[int, str, str]:
+        return a + b, request_id.get(), threading.current_thread().name
+
+    result, rid, thread_name = await executor.run("test_run", work, 1, 2)
+    assert result == 3
+    # The operation runs in another thread, in the context of the caller
+    assert rid == "abc"
+    assert thread_name.startswith("llama_deploy_io")
+
+    with pytest.raises(ValueError, match="boom"):
+        await executor.run("test_run", _raise, ValueError("boom"))
+    executor.shutdown()
+
+
+def _raise(e: Exception) -> None:
+    raise e
+
+
+@pytest.mark.asyncio
+async def test_run_timeout() -> None:
+    executor = BlockingExecutor(max_workers=1)
+    release = threading.Event()
+    ran = threading.Event()
+
+    blocking = asyncio.create_task(executor.run("test_timeout", release.wait))
+    await asyncio.sleep(0.01)
+    with pytest.raises(TimeoutError, match="test_timeout timed out after 0.01"):
+        await executor.run("test_timeout", ran.set, timeout=0.01)
+    assert _metric(executor_timeouts, "test_timeout") == 1
+
+    # The operation that timed out while waiting for a thread never runs
+    release.set()
+    assert await blocking
+    await executor.run("test_timeout", lambda: None)
+    assert not ran.is_set()
+    assert _metric(executor_queue_depth, "test_timeout") == 0
+    executor.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_run_cancelled() -> None:
+    executor = BlockingExecutor(max_workers=1)
+    release = threading.Event()
+    ran = threading.Event()
+
+    blocking = asyncio.create_task(executor.run("test_cancel", release.wait))
+    queued = asyncio.create_task(executor.run("test_cancel", ran.set))
+    await asyncio.sleep(0.01)
+    assert _metric(executor_queue_depth, "test_cancel") == 1
+
+    queued.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await queued
+    assert _metric(executor_queue_depth, "test_cancel") == 0
+
+    release.set()
+    await blocking
+    await executor.run("test_cancel", lambda: None)
+    assert not ran.is_set()
+    executor.shutdown()
@@ -0,0 +1,92 @@
+from unittest import mock
+
+from llama_deploy.apiserver.registry import BoundedRegistry
+
+
+def test_registry_dict_interface() -> None:
+    r: BoundedRegistry[int] = BoundedRegistry("test", "test-deployment")
+    r["a"] = 1
+    r["b"] = 2
+    assert r["a"] == 1
+    assert "b" in r
+    assert len(r) == 2
+    assert list(r.keys()) == ["b", "a"]
+    assert r.pop("a") == 1
+    assert "a" not in r
+    assert r.get("a") is None
+
+
+def test_registry_lru_eviction() -> None:
+    evicted: list[tuple[str, int]] = []
+    r: BoundedRegistry[int] = BoundedRegistry(
+        "test",
+        "test-deployment",
+        max_size=2,
+        on_evict=lambda k, v: evicted.append((k, v)),
+    )
+    r["a"] = 1
+    r["b"] = 2
+    # Accessing "a" makes "b" the least recently used
+    r["a"]
+    r["c"] = 3
+    assert list(r.keys()) == ["a", "c"]
+    assert evicted == [("b", 2)]
+
+
+def test_registry_never_evicts_active_entries() -> None:
+    r: BoundedRegistry[int] = BoundedRegistry(
+        "test", "test-deployment", max_size=2, is_active=lambda v: v > 0
+    )
+    r["a"] = 1
+    r["b"] = 0
+    r["c"] = 1
+    # "b" is the only inactive entry
+    assert sorted(r.keys()) == ["a", "c"]
+    r["d"] = 1
+    assert len(r) == 3
+
+
+def test_registry_ttl() -> None:
+    with mock.patch("llama_deploy.apiserver.registry.time") as mocked_time:
+        mocked_time.monotonic.return_value = 100.0
+        r: BoundedRegistry[int] = BoundedRegistry(
+            "test", "test-deployment", ttl=10, is_active=lambda v: v > 0
+        )
+        r["running"] = 1
+        r["done"] = 0
+        r["recent"] = 0
+
+        mocked_time.monotonic.return_value = 105.0
+        r.touch("recent")
+        assert r.expire() == 0
+
+        mocked_time.monotonic.return_value = 112.0
+        assert r.expire() == 1
+        assert sorted(r.keys()) == ["recent", "running"]
+
+
+def test_registry_expire_stops_at_recent_entries() -> None:
+    checked: list[int] = []
+
+    def is_active(v: int) -> bool:
+        checked.append(v)
+        return v == 0
+
+    with mock.patch("llama_deploy.apiserver.registry.time") as mocked_time:
+        mocked_time.monotonic.return_value = 100.0
+        r: BoundedRegistry[int] = BoundedRegistry(
+            "test", "test-deployment", ttl=10, is_active=is_active
+        )
+        r["running"] = 0
+        r["idle"] = 1
+        mocked_time.monotonic.return_value = 105.0
+        for i in range(2, 100):
+            r[f"recent-{i}"] = i
+
+        checked.clear()
+        mocked_time.monotonic.return_value = 112.0
+        # Active entries are skipped, entries accessed after the deadline aren't checked
+        assert r.expire() == 1
+        assert checked == [0, 1]
+        assert "running" in r
+        assert "idle" not in r
@@ -0,0 +1,102 @@
+from pathlib import Path
+from unittest import mock
+
+import pytest
+
+from llama_deploy.apiserver.result_cache import CacheMode, ResultCache
+from llama_deploy.apiserver.stats import result_cache_lookups, result_cache_size
+
+
+def test_result_cache_key() -> None:
+    cache = ResultCache("deployment", "service", "v1", max_size=10)
+    # Keys don't depend on the order of the input fields
+    assert cache.key({"a": 1, "b": [1, 2]}) == cache.key({"b": [1, 2], "a": 1})
+    assert cache.key({"a": 1}) != cache.key({"a": 2})
+    # Changing the service configuration changes the keys
+    other = ResultCache("deployment", "service", "v2", max_size=10)
+    assert cache.key({"a": 1}) != other.key({"a": 1})
+    # Changing the source of the service changes the keys
+    assert cache.key({"a": 1}, "commit1") != cache.key({"a": 1}, "commit2")
+
+
+def test_result_cache_lru() -> None:
+    cache = ResultCache("deployment", "lru", "v1", max_size=2)
+    cache.put("a", 1)
+    cache.put("b", None)
+    assert cache.get("a") == (True, 1)
+    cache.put("c", 3)
+
+    hits = result_cache_lookups.labels("deployment", "lru", "hit")._value.get()
+    misses = result_cache_lookups.labels("deployment", "lru", "miss")._value.get()
+    assert cache.get("b") == (False, None)
+    assert cache.get("a") == (True, 1)
+    assert cache.get("c") == (True, 3)
+    assert result_cache_lookups.labels("deployment", "lru", "hit")._value.get() == (
+        hits + 2
+    )
+    assert result_cache_lookups.labels("deployment", "lru", "miss")._value.get() == (
+        misses + 1
+    )
+    assert result_cache_size.labels("deployment", "lru")._value.get() == 2
+
+
+def test_result_cache_ttl() -> None:
+    cache = ResultCache("deployment", "ttl", "v1", max_size=10, ttl=60)
+    with mock.patch(
+        "llama_deploy.apiserver.result_cache.time.time", return_value=1000.0
+    ):
+        cache.put("a", 1)
+    with mock.patch(
+        "llama_deploy.apiserver.result_cache.time.time", return_value=1030.0
+    ):
+        assert cache.get("a") == (True, 1)
+    with mock.patch(
+        "llama_deploy.apiserver.result_cache.time.time", return_value=1061.0
+    ):
+        assert cache.get("a") == (False, None)
+
+
+def test_result_cache_disk(tmp_path: Path) -> None:
+    db_path = tmp_path / "cache" / "results.db"
+    cache = ResultCache("deployment", "disk", "v1", max_size=1, path=db_path)
+    cache.put("a", {"answer": 42})
+    cache.put("b", "b")
+    # Evicted from memory, still on disk
+    assert cache.get("a") == (True, {"answer": 42})
+    # Results that can't be serialized are only kept in memory
+    cache.put("c", object())
+    cache.close()
+
+    # Results survive the cache
+    cache = ResultCache("deployment", "disk", "v1", max_size=1, path=db_path)
+    assert cache.get("b") == (True, "b")
+    assert cache.get("c") == (False, None)
+    cache.close()
+
+
+def test_result_cache_closed(tmp_path: Path) -> None:
+    cache = ResultCache(
+        "deployment", "closed", "v1", max_size=1, path=tmp_path / "results.db"
+    )
+    cache.put("a", 1)
+    cache.close()
+    # Tasks still running when the cache is closed don't fail
+    cache.put("b", 2)
+    assert cache.get("a") == (False, None)
+    assert cache.get("b") == (False, None)
+
+
+@pytest.mark.parametrize(
+    "cache_control,mode",
+    [
+        (None, CacheMode.use),
+        ("max-age=60", CacheMode.use),
+        ("no-cache", CacheMode.refresh),
+        ("max-age = 0", CacheMode.refresh),
+        ("No-Cache, no-store", CacheMode.bypass),
+    ],
+)
+def test_cache_mode_from_cache_control(
+    cache_control: str | None, mode: CacheMode
+) -> None:
+    assert CacheMode.from_cache_control(cache_control) == mode
@@ -0,0 +1,57 @@
+from pathlib import Path
+
+from llama_deploy.apiserver.result_store import (
+    InMemoryResultStore,
+    SqliteResultStore,
+)
+from llama_deploy.types import TaskResult, TaskStatus
+
+
+def test_in_memory_result_store() -> None:
+    store = InMemoryResultStore(max_size=2)
+    for i in range(3):
+        store.put(TaskResult(task_id=f"task_{i}", history=[], result=str(i)))
+
+    assert store.get("task_0") is None
+    result = store.get("task_2")
+    assert result is not None
+    assert result.result == "2"
+    assert result.status == TaskStatus.DONE
+
+
+def test_sqlite_result_store(tmp_path: Path) -> None:
+    db_path = tmp_path / "results" / "results.db"
+    store = SqliteResultStore(db_path, "deployment_a")
+    store.put(TaskResult(task_id="task", history=[], result="a"))
+    store.put(
+        TaskResult(
+            task_id="failed",
+            history=[],
+            status=TaskStatus.FAILED,
+            data={"error": "boom"},
+        )
+    )
+    store.close()
+
+    # Results survive the store
+    store = SqliteResultStore(db_path, "deployment_a")
+    result = store.get("task")
+    assert result is not None
+    assert result.result == "a"
+    failed = store.get("failed")
+    assert failed is not None
+    assert failed.status == TaskStatus.FAILED
+    assert failed.data == {"error": "boom"}
+
+    # Namespaces are isolated
+    other = SqliteResultStore(db_path, "deployment_b")
+    assert other.get("task") is None
+
+
+def test_sqlite_result_store_max_size(tmp_path: Path) -> None:
+    store = SqliteResultStore(tmp_path / "results.db", "deployment", max_size=5)
+    for i in range(10):
+        store.put(TaskResult(task_id=f"task_{i}", history=[], result=str(i)))
+
+    assert store.get("task_0") is None
+    assert store.get("task_9") is not None
@@ -0,0 +1,149 @@
+from typing import Iterator
+
+import httpx
+import pytest
+import respx
+from fastapi.testclient import TestClient
+
+from llama_deploy.apiserver.routing import HashRing, RoutingFront, create_routing_app
+
+REPLICAS = ["http://replica-a:4501", "http://replica-b:4501"]
+
+
+@pytest.fixture
+def front() -> RoutingFront:
+    return RoutingFront(REPLICAS)
+
+
+@pytest.fixture
+def client(front: RoutingFront) -> Iterator[TestClient]:
+    with TestClient(create_routing_app(front)) as client:
+        yield client
+
+
+def test_hash_ring_minimal_movement() -> None:
+    ring = HashRing(["a", "b", "c"])
+    keys = [f"deployment/{i}" for i in range(3000)]
+    before = {k: ring.owner(k) for k in keys}
+    counts = {r: list(before.values()).count(r) for r in ring.replicas}
+    assert all(600 < c < 1400 for c in counts.values())
+
+    # Only the keys taken over by the new replica move
+    ring.add("d")
+    after = {k: ring.owner(k) for k in keys}
+    moved = [k for k in keys if before[k] != after[k]]
+    assert all(after[k] == "d" for k in moved)
+    assert 400 < len(moved) < 1200
+
+    # Only the keys of the removed replica move
+    ring.remove("a")
+    final = {k: ring.owner(k) for k in keys}
+    assert all(final[k] == after[k] for k in keys if after[k] != "a")
+    assert ring.replicas == ["b", "c", "d"]
+
+    with pytest.raises(LookupError):
+        HashRing().owner("key")
+
+
+@respx.mock
+def test_route_session(client: TestClient, front: RoutingFront) -> None:
+    owner = front.session_owner("test-deployment", "s1")
+    routes = {
+        replica: respx.get(
+            f"{replica}/deployments/test-deployment/tasks/t1/results"
+        ).mock(return_value=httpx.Response(200, json={"task_id": "t1"}))
+        for replica in REPLICAS
+    }
+
+    response = client.get(
+        "/deployments/test-deployment/tasks/t1/results", params={"session_id": "s1"}
+    )
+    assert response.status_code == 200
+    assert response.json() == {"task_id": "t1"}
+    for replica, route in routes.items():
+        assert route.call_count == (1 if replica == owner else 0)
+    assert routes[owner].calls.last.request.url.params["session_id"] == "s1"
+
+
+@respx.mock
+def test_route_new_session_pinned(client: TestClient, front: RoutingFront) -> None:
+    for replica in REPLICAS:
+        respx.post(f"{replica}/deployments/test-deployment/tasks/create").mock(
+            return_value=httpx.Response(
+                200,
+                json={"task_id": "t1", "session_id": f"s-{replica}", "input": ""},
+            )
+        )
+
+    response = client.post("/deployments/test-deployment/tasks/create", json={})
+    assert response.status_code == 200
+    session_id = response.json()["session_id"]
+    creator = session_id[2:]
+
+    # Follow-up requests reach the replica that created the session
+    assert front.session_owner("test-deployment", session_id) == creator
+    stream = respx.get(f"{creator}/deployments/test-deployment/tasks/t1/events").mock(
+        return_value=httpx.Response(200, content=b'{"a": 1}\n{"b": 2}\n')
+    )
+    response = client.get(
+        "/deployments/test-deployment/tasks/t1/events",
+        params={"session_id": session_id},
+    )
+    assert response.status_code == 200
+    assert response.text == '{"a": 1}\n{"b": 2}\n'
+    assert stream.called
+
+
+@respx.mock
+def test_route_broadcast_and_gather(client: TestClient) -> None:
+    creates = [
+        respx.post(f"{replica}/deployments/create").mock(
+            return_value=httpx.Response(200, json={"name": "test-deployment"})
+        )
+        for replica in REPLICAS
+    ]
+    for i, replica in enumerate(REPLICAS):
+        respx.get(f"{replica}/deployments/test-deployment/sessions").mock(
+            return_value=httpx.Response(200, json=[{"session_id": f"s{i}"}])
+        )
+
+    response = client.post("/deployments/create", files={"config_file": b"name: x"})
+    assert response.status_code == 200
+    assert all(route.call_count == 1 for route in creates)
+    assert (
+        creates[0].calls.last.request.content == creates[1].calls.last.request.content
+    )
+
+    response = client.get("/deployments/test-deployment/sessions")
+    assert response.json() == [{"session_id": "s0"}, {"session_id": "s1"}]
+
+
+@respx.mock
+def test_route_replica_down(client: TestClient, front: RoutingFront) -> None:
+    owner = front.session_owner("test-deployment", "s1")
+    respx.get(f"{owner}/deployments/test-deployment/sessions/s1").mock(
+        side_effect=httpx.ConnectError("refused")
+    )
+
+    response = client.get("/deployments/test-deployment/sessions/s1")
+    assert response.status_code == 502
+    assert front.replicas == [r for r in REPLICAS if r != owner]
+
+
+@respx.mock
+@pytest.mark.asyncio
+async def test_check_health(front: RoutingFront) -> None:
+    health = respx.get(f"{REPLICAS[0]}/status/").mock(return_value=httpx.Response(500))
+    respx.get(f"{REPLICAS[1]}/status/").mock(return_value=httpx.Response(200))
+
+    await front.check_health()
+    assert front.replicas == [REPLICAS[1]]
+
+    health.mock(return_value=httpx.Response(200))
+    await front.check_health()
+    assert front.replicas == REPLICAS
+
+    front.remove_replica(REPLICAS[0])
+    await front.check_health()
+    assert front.replicas == [REPLICAS[1]]
+    await front.aclose()
@@ -20,12 +20,15 @@ async def test_lifespan(
     config_file = tmp_path / "test.yml"
     with open(config_file, "w") as f:
         f.write(source_file.read_text())
+    (tmp_path / "broken.yml").write_text("name: [")
 
     mocked_manager.serve = mock.AsyncMock()
+    mocked_manager.deploy_many = mock.AsyncMock()
     with mock.patch("llama_deploy.apiserver.server.settings") as mocked_settings:
         mocked_settings.rc_path = tmp_path
         mocked_settings.deployments_path = tmp_path / "foo/bar"
         mocked_settings.deployment_file_path = None
+        mocked_settings.rc_deploy_concurrency = 4
         mocked_manager.deployments_path = mocked_settings.deployments_path
         caplog.set_level(logging.INFO)
         async with lifespan(mock.AsyncMock()):
@@ -37,6 +40,16 @@ async def test_lifespan(
         )
         assert f"Deploying startup configuration from {config_file}" in caplog.text
         mocked_manager.serve.assert_called_once()
+        # Deployments start in the background
+        configs = mocked_manager.deploy_many.call_args.args[0]
+        assert [c.name for c in configs] == ["TestDeployment"]
+        assert mocked_manager.deploy_many.call_args.kwargs == {
+            "base_path": str(tmp_path),
+            "max_concurrency": 4,
+        }
+        # Configs that can't be parsed are reported as failed deployments
+        mocked_manager.mark_failed.assert_called_once()
+        assert mocked_manager.mark_failed.call_args.args[0] == "broken.yml"
 
 
 @pytest.mark.asyncio
@@ -61,7 +74,7 @@ async def test_lifespan_with_specific_deployment_file(
         f.write(source_file.read_text())
 
     mocked_manager.serve = mock.AsyncMock()
-    mocked_manager.deploy = mock.AsyncMock()
+    mocked_manager.deploy_many = mock.AsyncMock()
 
     with mock.patch("llama_deploy.apiserver.server.settings") as mocked_settings:
         mocked_settings.rc_path = tmp_path
@@ -78,4 +91,5 @@ async def test_lifespan_with_specific_deployment_file(
         assert f"Deploying startup configuration from {other_file}" not in caplog.text
 
         # Should be called once for the specific file
-        mocked_manager.deploy.assert_called_once()
+        mocked_manager.deploy_many.assert_called_once()
+        assert len(mocked_manager.deploy_many.call_args.args[0]) == 1
@@ -0,0 +1,64 @@
+from pathlib import Path
+from unittest import mock
+
+from llama_deploy.apiserver.session_store import SqliteSessionStore
+from llama_deploy.apiserver.stats import session_store_lookups, session_store_size
+
+
+def test_sqlite_session_store(tmp_path: Path) -> None:
+    db_path = tmp_path / "sessions" / "sessions.db"
+    store = SqliteSessionStore(db_path, "deployment_a")
+    store.put("session", {"state": {"runs": 1}})
+    store.put("other", {"state": {}})
+    assert session_store_size.labels("deployment_a")._value.get() == 2
+    store.close()
+
+    # Sessions survive the store
+    store = SqliteSessionStore(db_path, "deployment_a")
+    hits = session_store_lookups.labels("deployment_a", "hit")._value.get()
+    assert store.get("session") == {"state": {"runs": 1}}
+    assert session_store_lookups.labels("deployment_a", "hit")._value.get() == hits + 1
+
+    store.delete("session")
+    misses = session_store_lookups.labels("deployment_a", "miss")._value.get()
+    assert store.get("session") is None
+    assert (
+        session_store_lookups.labels("deployment_a", "miss")._value.get() == misses + 1
+    )
+    assert session_store_size.labels("deployment_a")._value.get() == 1
+
+    # Namespaces are isolated
+    other = SqliteSessionStore(db_path, "deployment_b")
+    assert other.get("other") is None
+
+
+def test_sqlite_session_store_ttl(tmp_path: Path) -> None:
+    store = SqliteSessionStore(tmp_path / "sessions.db", "deployment", ttl=60)
+    with mock.patch(
+        "llama_deploy.apiserver.session_store.time.time", return_value=1000.0
+    ):
+        store.put("old", {})
+    with mock.patch(
+        "llama_deploy.apiserver.session_store.time.time", return_value=1100.0
+    ):
+        assert store.get("old") is None
+        store.put("new", {})
+
+    assert session_store_size.labels("deployment")._value.get() == 1
+
+
+def test_sqlite_session_store_put_many(tmp_path: Path) -> None:
+    store = SqliteSessionStore(tmp_path / "sessions.db", "batch")
+    store.put_many({"a": {"state": {}}, "b": {"state": {}}})
+    store.put_many({"b": {"state": {"runs": 1}}, "c": {"state": {}}})
+    assert store.get("b") == {"state": {"runs": 1}}
+    assert session_store_size.labels("batch")._value.get() == 3
+
+    store.delete("a")
+    store.delete("unknown")
+    assert session_store_size.labels("batch")._value.get() == 2
+    store.close()
+
+    # The count starts from the sessions already stored
+    SqliteSessionStore(tmp_path / "sessions.db", "batch")
+    assert session_store_size.labels("batch")._value.get() == 2
@@ -0,0 +1,237 @@
+import asyncio
+import threading
+from pathlib import Path
+from unittest import mock
+
+import pytest
+from workflows import Context, Workflow, step
+from workflows.events import StartEvent, StopEvent
+from workflows.handler import WorkflowHandler
+
+from llama_deploy.apiserver.deployment import Deployment, SessionOwnedError
+from llama_deploy.apiserver.deployment_config_parser import DeploymentConfig
+from llama_deploy.apiserver.result_store import InMemoryResultStore, RedisResultStore
+from llama_deploy.apiserver.session_store import RedisSessionStore
+from llama_deploy.apiserver.settings import ApiserverSettings, settings
+from llama_deploy.apiserver.state_backend import (
+    LocalStateBackend,
+    RedisStateBackend,
+    create_state_backend,
+)
+from llama_deploy.types import TaskResult, TaskStatus
+
+
+class FakeRedis:
+    """Implements the subset of the redis.Redis API used by the state backend."""
+
+    def __init__(self) -> None:
+        self.data: dict[str, str] = {}
+        self.expiry: dict[str, int | None] = {}
+        self.threads: set[str] = set()
+
+    def get(self, name: str) -> str | None:
+        return self.data.get(name)
+
+    def set(
+        self, name: str, value: str, px: int | None = None, nx: bool = False
+    ) -> bool:
+        if nx and name in self.data:
+            return False
+        self.data[name] = value
+        self.expiry[name] = px
+        self.threads.add(threading.current_thread().name)
+        return True
+
+    def delete(self, name: str) -> None:
+        self.data.pop(name, None)
+        self.expiry.pop(name, None)
+
+    def close(self) -> None:
+        pass
+
+
+class SessionWorkflow(Workflow):
+    @step
+    async def noop(self, ev: StartEvent) -> StopEvent:
+        return StopEvent()
+
+
+@pytest.fixture
+def replicas(data_path: Path, tmp_path: Path) -> tuple[Deployment, Deployment]:
+    config = DeploymentConfig.from_yaml(data_path / "git_service.yaml")
+    backend = RedisStateBackend(FakeRedis(), settings)
+    # Two API Server replicas serving the same deployment
+    return (
+        Deployment(
+            config=config,
+            base_path=Path(),
+            deployment_path=tmp_path / "a",
+            state_backend=backend,
+        ),
+        Deployment(
+            config=config,
+            base_path=Path(),
+            deployment_path=tmp_path / "b",
+            state_backend=backend,
+        ),
+    )
+
+
+def test_redis_result_store() -> None:
+    client = FakeRedis()
+    store = RedisResultStore(client, "deployment_a", ttl=60)
+    store.put(TaskResult(task_id="task", history=[], result="a"))
+
+    result = store.get("task")
+    assert result is not None
+    assert result.result == "a"
+    assert client.expiry["llama_deploy:deployment_a:results:task"] == 60_000
+    assert RedisResultStore(client, "deployment_b").get("task") is None
+
+    # Sub-second ttls still expire
+    RedisResultStore(client, "deployment_c", ttl=0.0001).put(
+        TaskResult(task_id="task", history=[], result="c")
+    )
+    assert client.expiry["llama_deploy:deployment_c:results:task"] == 1
+
+
+def test_redis_session_store() -> None:
+    client = FakeRedis()
+    store = RedisSessionStore(client, "deployment_a")
+    store.put("session", {"state": {}})
+
+    assert store.get("session") == {"state": {}}
+    assert client.expiry["llama_deploy:deployment_a:sessions:session"] is None
+    store.delete("session")
+    assert store.get("session") is None
+
+
+def test_redis_session_store_claim() -> None:
+    client = FakeRedis()
+    store = RedisSessionStore(client, "deployment_a")
+    assert store.claim("session", "replica_a", 1) is None
+    assert client.expiry["llama_deploy:deployment_a:session_owners:session"] == 1000
+    # The owner renews its lease, other replicas are told who owns the session
+    assert store.claim("session", "replica_a", 2) is None
+    assert client.expiry["llama_deploy:deployment_a:session_owners:session"] == 2000
+    assert store.claim("session", "replica_b", 1) == "replica_a"
+
+    # Only the owner releases the session
+    store.release(["session"], "replica_b")
+    assert store.claim("session", "replica_b", 1) == "replica_a"
+    store.release(["session"], "replica_a")
+    assert store.claim("session", "replica_b", 1) is None
+
+    # Deleting the session drops its owner
+    store.delete("session")
+    assert store.claim("session", "replica_a", 1) is None
+
+
+def test_create_state_backend() -> None:
+    backend = create_state_backend(ApiserverSettings())
+    assert isinstance(backend, LocalStateBackend)
+    assert not backend.shared
+    assert isinstance(backend.result_store("deployment"), InMemoryResultStore)
+    assert backend.session_store("deployment") is None
+
+    with pytest.raises(ValueError, match="Unsupported state backend URL"):
+        create_state_backend(ApiserverSettings(state_backend_url="http://redis"))
+
+    fake_redis = mock.MagicMock()
+    with mock.patch.dict("sys.modules", {"redis": fake_redis}):
+        backend = create_state_backend(
+            ApiserverSettings(state_backend_url="redis://localhost:6379/0")
+        )
+    assert isinstance(backend, RedisStateBackend)
+    assert backend.shared
+    fake_redis.Redis.from_url.assert_called_once_with("redis://localhost:6379/0")
+
+
+@pytest.mark.asyncio
+async def test_task_result_shared(replicas: tuple[Deployment, Deployment]) -> None:
+    owner, other = replicas
+    handler: WorkflowHandler = WorkflowHandler(ctx=mock.MagicMock(spec=Context))
+    mock_workflow = mock.MagicMock(spec=Workflow)
+    mock_workflow.run.return_value = handler
+    owner._workflow_services = {"test_service": mock_workflow}
+    handler_id, _ = await owner.run_workflow_no_wait("test_service")
+
+    result = await other.get_task_result(handler_id)
+    assert result.status == TaskStatus.RUNNING
+
+    asyncio.get_running_loop().call_later(0.01, handler.set_result, "done!")
+    with mock.patch("llama_deploy.apiserver.deployment._RESULT_POLL_INTERVAL", 0.01):
+        result = await other.get_task_result(handler_id, wait=5)
+    assert result.status == TaskStatus.DONE
+    assert result.result == "done!"
+
+    with pytest.raises(KeyError):
+        await other.get_task_result("unknown")
+
+    # Redis is written off the event loop
+    client = owner._state._client  # type: ignore
+    assert client.threads
+    assert threading.main_thread().name not in client.threads
+
+
+@pytest.mark.asyncio
+async def test_session_shared(replicas: tuple[Deployment, Deployment]) -> None:
+    owner, other = replicas
+    workflow = SessionWorkflow()
+    owner._workflow_services = {"test_service": workflow}
+    other._workflow_services = {"test_service": workflow}
+
+    session_id = await owner.create_session("test_service")
+    context = await other.get_session(session_id, "test_service")
+    assert isinstance(context, Context)
+
+    # The state is published when the tasks of the session complete
+    owner_context = owner._contexts[session_id]
+    assert isinstance(owner_context, Context)
+    await owner_context.store.set("runs", 1)
+    with mock.patch.object(workflow, "run", mock.AsyncMock(return_value="ok")):
+        await owner.run_workflow("test_service", session_id)
+    del other._contexts[session_id]
+    context = await other.get_session(session_id, "test_service")
+    assert isinstance(context, Context)
+    assert await context.store.get("runs") == 1
+
+    # Restoring a shared session leaves it readable by the other replicas
+    del owner._contexts[session_id]
+    await owner.get_session(session_id, "test_service")
+
+    await other.delete_session(session_id)
+    del owner._contexts[session_id]
+    with pytest.raises(KeyError):
+        await owner.get_session(session_id, "test_service")
+
+
+@pytest.mark.asyncio
+async def test_session_owned(replicas: tuple[Deployment, Deployment]) -> None:
+    owner, other = replicas
+    workflow = SessionWorkflow()
+    owner._workflow_services = {"test_service": workflow}
+    other._workflow_services = {"test_service": workflow}
+
+    session_id = await owner.create_session("test_service")
+    await owner.flush_state()
+    with mock.patch.object(workflow, "run", mock.AsyncMock(return_value="ok")):
+        await owner.run_workflow("test_service", session_id)
+        # Other replicas read the session but don't run its tasks
+        await other.get_session(session_id, "test_service")
+        with pytest.raises(SessionOwnedError, match="owned by another replica"):
+            await other.run_workflow("test_service", session_id)
+
+    # Once the owner moves the session to the store, any replica can take it over
+    owner_context = owner._contexts.pop(session_id)
+    assert isinstance(owner_context, Context)
+    await owner_context.store.set("runs", 1)
+    owner._on_session_evicted(session_id, owner_context)
+    await owner.flush_state()
+    with mock.patch.object(workflow, "run", mock.AsyncMock(return_value="ok")) as run:
+        await other.run_workflow("test_service", session_id)
+    # The copy read before the takeover was replaced by the stored one
+    context = run.call_args.kwargs["context"]
+    assert await context.store.get("runs") == 1
+    with pytest.raises(SessionOwnedError):
+        await owner.run_workflow("test_service", session_id)
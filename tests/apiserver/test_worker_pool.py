@@ -0,0 +1,60 @@
+import asyncio
+from pathlib import Path
+
+import pytest
+from workflows.events import StopEvent
+
+from llama_deploy.apiserver.worker_pool import WorkerError, WorkerPool
+
+
+@pytest.fixture
+def pool(data_path: Path) -> WorkerPool:
+    return WorkerPool(
+        "deployment",
+        "service",
+        size=2,
+        pythonpath=data_path,
+        import_path="workflow:my_workflow",
+    )
+
+
+@pytest.mark.asyncio
+async def test_run(pool: WorkerPool) -> None:
+    try:
+        handlers = [
+            await pool.run(f"task_{i}", f"session_{i}", {"data": i}) for i in range(4)
+        ]
+        results = await asyncio.wait_for(asyncio.gather(*handlers), timeout=60)
+        assert results == [f"Received: {i}" for i in range(4)]
+
+        events = [ev async for ev in handlers[0].stream_events()]
+        assert isinstance(events[-1], StopEvent)
+    finally:
+        await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_run_error(pool: WorkerPool) -> None:
+    try:
+        handler = await pool.run("task", "session", {})
+        with pytest.raises(WorkerError):
+            await asyncio.wait_for(handler, timeout=60)
+    finally:
+        await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_worker_exit(pool: WorkerPool) -> None:
+    handler = await pool.run("task", "session", {"data": "foo"})
+    assert await asyncio.wait_for(handler, timeout=60) == "Received: foo"
+
+    # Tasks running in a worker fail when it exits, next tasks start a new one
+    worker = pool._workers[pool._worker_index("session")]
+    assert worker is not None
+    worker.process.kill()
+    await asyncio.wait_for(worker.reader, timeout=60)  # type: ignore
+    try:
+        handler = await pool.run("task", "session", {"data": "bar"})
+        assert await asyncio.wait_for(handler, timeout=60) == "Received: bar"
+    finally:
+        await pool.close()
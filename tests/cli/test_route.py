@@ -0,0 +1,26 @@
+from unittest import mock
+
+from click.testing import CliRunner
+
+from llama_deploy.cli import llamactl
+
+
+def test_route(runner: CliRunner) -> None:
+    with mock.patch("llama_deploy.cli.route.uvicorn") as mocked_uvicorn:
+        result = runner.invoke(
+            llamactl,
+            ["route", "-r", "http://a:4501", "-r", "http://b:4501/", "--port", "80"],
+        )
+
+    assert result.exit_code == 0
+    mocked_uvicorn.run.assert_called_once()
+    assert mocked_uvicorn.run.call_args.kwargs == {"host": "127.0.0.1", "port": 80}
+
+
+def test_route_no_replicas(runner: CliRunner) -> None:
+    with mock.patch("llama_deploy.cli.route.uvicorn") as mocked_uvicorn:
+        result = runner.invoke(llamactl, ["route"])
+
+    assert result.exit_code == 1
+    assert "At least one replica is required" in result.output
+    mocked_uvicorn.run.assert_not_called()
@@ -1,10 +1,13 @@
+import json
+from pathlib import Path
+from typing import AsyncGenerator
 from unittest import mock
 
 import httpx
 from click.testing import CliRunner
 
 from llama_deploy.cli import llamactl
-from llama_deploy.types import TaskDefinition
+from llama_deploy.types import TaskDefinition, TaskResult
 
 
 def test_run(runner: CliRunner) -> None:
@@ -81,3 +84,39 @@ def test_run_args(runner: CliRunner) -> None:
         assert expected.service_id == actual.service_id
         assert actual.session_id is None
         assert result.exit_code == 0
+
+
+def test_run_input_file(runner: CliRunner, tmp_path: Path) -> None:
+    input_file = tmp_path / "inputs.ndjson"
+    input_file.write_text('{"query": "first"}\n\n{"query": "second"}\n')
+
+    async def run_many(tasks: list[TaskDefinition]) -> AsyncGenerator:
+        yield 1, TaskResult(task_id="t2", history=[], result="second result")
+        yield 0, TaskResult(task_id="t1", history=[], result="first result")
+
+    with mock.patch("llama_deploy.cli.run.Client") as mocked_client:
+        mocked_deployment = mock.MagicMock()
+        mocked_deployment.tasks.run_many.side_effect = run_many
+        mocked_client.return_value.__aenter__.return_value = mocked_client.return_value
+        mocked_client.return_value.apiserver.deployments.get = mock.AsyncMock(
+            return_value=mocked_deployment
+        )
+
+        result = runner.invoke(
+            llamactl,
+            ["run", "-d", "deployment_name", "-s", "service_name", "-f", input_file],
+        )
+
+        assert result.exit_code == 0
+        tasks = mocked_deployment.tasks.run_many.call_args[0][0]
+        assert [t.input for t in tasks] == ['{"query": "first"}', '{"query": "second"}']
+        assert all(t.service_id == "service_name" for t in tasks)
+        lines = [json.loads(line) for line in result.output.splitlines()]
+        assert lines[0] == {
+            "index": 1,
+            "task_id": "t2",
+            "result": "second result",
+            "status": "done",
+            "data": {},
+        }
+        assert lines[1]["index"] == 0
@@ -13,7 +13,12 @@ from llama_deploy.client.models.apiserver import (
     Task,
     TaskCollection,
 )
-from llama_deploy.types import SessionDefinition, TaskDefinition, TaskResult
+from llama_deploy.types import (
+    SessionDefinition,
+    TaskDefinition,
+    TaskResult,
+    TaskStatus,
+)
 
 
 @pytest.mark.asyncio
@@ -98,7 +103,7 @@ async def test_task_results(client: Any) -> None:
         deployment_id="a_deployment",
         session_id="a_session",
     )
-    await t.results()
+    await t.results(wait=0)
 
     client.request.assert_awaited_with(
         "GET",
@@ -108,6 +113,82 @@ async def test_task_results(client: Any) -> None:
         timeout=120.0,
     )
 
+    await t.results(wait=10)
+
+    client.request.assert_awaited_with(
+        "GET",
+        "http://localhost:4501/deployments/a_deployment/tasks/a_task/results",
+        verify=True,
+        params={"session_id": "a_session", "wait": 10},
+        timeout=130.0,
+    )
+
+    # By default, the result is polled until the task is done
+    running = TaskResult(task_id="a_task", history=[], status=TaskStatus.RUNNING)
+    client.request.reset_mock()
+    client.request.side_effect = [
+        mock.MagicMock(json=lambda: running.model_dump()),
+        mock.MagicMock(json=lambda: res.model_dump()),
+    ]
+    result = await t.results()
+    assert result is not None
+    assert result.result == "some_text"
+    assert client.request.await_count == 2
+    assert client.request.call_args.kwargs["params"]["wait"] == 10.0
+
+
+@pytest.mark.asyncio
+async def test_task_collection_create_many(client: Any) -> None:
+    client.request.side_effect = lambda method, url, json, **kwargs: mock.MagicMock(
+        json=lambda: [
+            {**td, "task_id": f"task_{td['input']}", "session_id": "s"} for td in json
+        ]
+    )
+    coll = TaskCollection(client=client, items={}, deployment_id="a_deployment")
+    tasks = [TaskDefinition(input=str(i)) for i in range(5)]
+
+    created = await coll.create_many(tasks, chunk_size=2)
+
+    assert [t.id for t in created] == [f"task_{i}" for i in range(5)]
+    assert client.request.await_count == 3
+    assert {c.args[1] for c in client.request.await_args_list} == {
+        "http://localhost:4501/deployments/a_deployment/tasks/batch"
+    }
+    assert [len(c.kwargs["json"]) for c in client.request.await_args_list] == [
+        2,
+        2,
+        1,
+    ]
+
+
+@pytest.mark.asyncio
+async def test_task_collection_run_many(client: Any) -> None:
+    polls: dict[str, int] = {}
+
+    def request(method: str, url: str, **kwargs: Any) -> Any:
+        if url.endswith("/tasks/batch"):
+            return mock.MagicMock(
+                json=lambda: [
+                    {**td, "task_id": f"task_{i}", "session_id": "s"}
+                    for i, td in enumerate(kwargs["json"])
+                ]
+            )
+        task_id = url.split("/")[-2]
+        polls[task_id] = polls.get(task_id, 0) + 1
+        # task_0 needs a second poll to complete
+        status = "running" if task_id == "task_0" and polls[task_id] == 1 else "done"
+        result = TaskResult(task_id=task_id, history=[], result=task_id, status=status)
+        return mock.MagicMock(json=lambda: result.model_dump())
+
+    client.request.side_effect = request
+    coll = TaskCollection(client=client, items={}, deployment_id="a_deployment")
+    tasks = [TaskDefinition(input="{}") for _ in range(2)]
+
+    results = [r async for r in coll.run_many(tasks)]
+
+    assert sorted((i, r.result) for i, r in results) == [(0, "task_0"), (1, "task_1")]
+    assert polls == {"task_0": 2, "task_1": 1}
+
 
 @pytest.mark.asyncio
 async def test_task_collection_run(client: Any) -> None:
@@ -134,6 +215,9 @@ async def test_task_collection_run(client: Any) -> None:
             "task_id": "test_id",
             "session_id": None,
             "service_id": None,
+            "timeout": None,
+            "priority": "normal",
+            "tenant_id": None,
         },
         timeout=120.0,
     )
@@ -166,6 +250,9 @@ async def test_task_collection_create(client: Any) -> None:
             "task_id": "test_id",
             "session_id": None,
             "service_id": None,
+            "timeout": None,
+            "priority": "normal",
+            "tenant_id": None,
         },
         timeout=120.0,
     )
@@ -207,6 +294,21 @@ async def test_task_deployment_sessions(client: Any) -> None:
     )
 
 
+@pytest.mark.asyncio
+async def test_deployment_warmup(client: Any) -> None:
+    d = Deployment(client=client, id="a_deployment")
+
+    await d.warmup("a_service")
+
+    client.request.assert_awaited_with(
+        "POST",
+        "http://localhost:4501/deployments/a_deployment/warmup",
+        params={"service_id": "a_service"},
+        verify=True,
+        timeout=120.0,
+    )
+
+
 @pytest.mark.asyncio
 async def test_task_deployment_collection_create(client: Any) -> None:
     client.request.return_value = mock.MagicMock(json=lambda: {"name": "deployment"})
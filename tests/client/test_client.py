@@ -1,6 +1,9 @@
+import asyncio
 from unittest import mock
 
+import httpx
 import pytest
+import respx
 
 from llama_deploy.client import Client
 from llama_deploy.client.client import _SyncClient
@@ -46,15 +49,87 @@ def test_client_attributes() -> None:
     assert issubclass(type(c.sync.apiserver), ApiServer)
 
 
+def test_client_http2_requires_h2() -> None:
+    with mock.patch("importlib.util.find_spec", return_value=None):
+        with pytest.raises(ImportError, match="pip install llama_deploy\\[http2\\]"):
+            Client(http2=True)
+        # Clients not using HTTP/2 don't need it
+        Client(http2=False)
+
+    with mock.patch("importlib.util.find_spec", return_value=mock.MagicMock()):
+        assert Client(http2=True).http2
+
+
 @pytest.mark.asyncio
 async def test_client_request() -> None:
     with mock.patch("llama_deploy.client.base.httpx") as _httpx:
         mocked_response = mock.MagicMock()
-        _httpx.AsyncClient.return_value.__aenter__.return_value.request.return_value = (
-            mocked_response
+        _httpx.AsyncClient.return_value.request = mock.AsyncMock(
+            return_value=mocked_response
         )
 
         c = Client()
         await c.request("GET", "http://example.com", verify=False)
-        _httpx.AsyncClient.assert_called_with(verify=False)
+        _httpx.AsyncClient.assert_called_with(
+            verify=False, http2=False, limits=_httpx.Limits.return_value
+        )
+        _httpx.Limits.assert_called_with(
+            max_connections=100, max_keepalive_connections=20, keepalive_expiry=5.0
+        )
         mocked_response.raise_for_status.assert_called_once()
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_client_request_reuses_connection_pool() -> None:
+    respx.get("http://example.com").mock(return_value=httpx.Response(200))
+
+    async with Client() as c:
+        await c.request("GET", "http://example.com")
+        pooled = c._http_clients[True]
+        await c.request("GET", "http://example.com")
+        assert c._http_clients[True] is pooled
+        await c.request("GET", "http://example.com", verify=False)
+        assert len(c._http_clients) == 2
+
+    assert c._http_clients == {}
+    assert pooled.is_closed
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_client_stream() -> None:
+    respx.get("http://example.com/events").mock(
+        return_value=httpx.Response(200, content=b'{"a": 1}\n{"b": 2}\n')
+    )
+
+    c = Client()
+    async with c.stream("GET", "http://example.com/events") as response:
+        lines = [line async for line in response.aiter_lines()]
+
+    assert lines == ['{"a": 1}', '{"b": 2}']
+    await c.aclose()
+
+
+def test_client_pool_per_event_loop() -> None:
+    c = Client()
+
+    async def get_pool() -> httpx.AsyncClient:
+        return c._get_http_client(True)
+
+    first = asyncio.run(get_pool())
+    second = asyncio.run(get_pool())
+    assert first is not second
+
+
+@respx.mock
+def test_client_sync_closes_pool() -> None:
+    respx.get("http://localhost:4501/status/").mock(
+        return_value=httpx.Response(200, json={})
+    )
+    sc = Client().sync
+    for _ in range(3):
+        assert sc.apiserver.status().status.value == "Healthy"
+    # Each call runs in its own event loop, the pool doesn't outlive it
+    assert sc._http_clients == {}
+    assert sc._http_loop is None